@@ -1,7 +1,20 @@
 import numpy as np
+import argparse
+import random
+import time
+import multiprocessing
+import mmap
+import os
+from multiprocessing import Pool, shared_memory
+from array import array
 from enum import Enum
 import re
-from typing import List, Tuple, Optional
+import itertools
+from collections import deque
+import struct
+import sys
+import threading
+from typing import List, Tuple, Optional, NamedTuple, Callable, Dict, Iterable, Iterator
 
 # Define piece type enum
 class PieceType(Enum):
@@ -19,73 +32,625 @@ class Color(Enum):
     WHITE = 1
     BLACK = 2
 
-# Represents a chess piece
-class Piece:
-    def __init__(self, piece_type: PieceType, color: Color):
-        self.piece_type = piece_type
-        self.color = color
-        self.has_moved = False
-        
-    def __str__(self):
-        # Unicode chess symbols for displaying pieces
-        symbols = {
-            (PieceType.PAWN, Color.WHITE): '♙',
-            (PieceType.ROOK, Color.WHITE): '♖',
-            (PieceType.KNIGHT, Color.WHITE): '♘', 
-            (PieceType.BISHOP, Color.WHITE): '♗',
-            (PieceType.QUEEN, Color.WHITE): '♕',
-            (PieceType.KING, Color.WHITE): '♔',
-            (PieceType.PAWN, Color.BLACK): '♟',
-            (PieceType.ROOK, Color.BLACK): '♜',
-            (PieceType.KNIGHT, Color.BLACK): '♞',
-            (PieceType.BISHOP, Color.BLACK): '♝',
-            (PieceType.QUEEN, Color.BLACK): '♛',
-            (PieceType.KING, Color.BLACK): '♚',
-        }
-        return symbols.get((self.piece_type, self.color), ' ')
+# Outcome of the current position for the side to move
+class GameStatus(Enum):
+    ONGOING = 0
+    CHECK = 1
+    CHECKMATE = 2
+    STALEMATE = 3
+    DRAW = 4
+
+# Pieces are small integers: the PieceType value, plus 8 for black; 0 is an empty square
+EMPTY = 0
+BLACK_PIECE = 8
+
+def make_piece(piece_type: PieceType, color: Color) -> int:
+    return piece_type.value | (BLACK_PIECE if color == Color.BLACK else 0)
+
+def piece_type_of(piece: int) -> PieceType:
+    return PieceType(piece & 7)
+
+def piece_color_of(piece: int) -> Color:
+    if not piece:
+        return Color.NONE
+    return Color.BLACK if piece & BLACK_PIECE else Color.WHITE
+
+# Unicode chess symbols for displaying pieces, indexed by piece code
+PIECE_SYMBOLS = [' '] * 16
+for _piece_type, _white, _black in ((PieceType.PAWN, '♙', '♟'), (PieceType.ROOK, '♖', '♜'),
+                                    (PieceType.KNIGHT, '♘', '♞'), (PieceType.BISHOP, '♗', '♝'),
+                                    (PieceType.QUEEN, '♕', '♛'), (PieceType.KING, '♔', '♚')):
+    PIECE_SYMBOLS[make_piece(_piece_type, Color.WHITE)] = _white
+    PIECE_SYMBOLS[make_piece(_piece_type, Color.BLACK)] = _black
+
+# Bitboard square layout: square = row * 8 + col, so a8 is bit 0 and h1 is bit 63
+def square_index(row: int, col: int) -> int:
+    return row * 8 + col
+
+# Index into per-color tables (white 0, black 1)
+COLOR_INDEX = {Color.WHITE: 0, Color.BLACK: 1}
+INDEX_COLOR = (Color.WHITE, Color.BLACK)
+
+# Yields the square index of every set bit, lowest first
+def iter_bits(bb: int):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+# Builds a leaper attack table from a list of (row, col) offsets
+def _leaper_table(offsets) -> List[int]:
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                bb |= 1 << square_index(r, c)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _leaper_table([(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)])
+KING_ATTACKS = _leaper_table([(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0)])
+# Squares a pawn of the given color attacks (white pawns move towards row 0)
+PAWN_ATTACKS = (
+    _leaper_table([(-1, -1), (-1, 1)]),
+    _leaper_table([(1, -1), (1, 1)]),
+)
+
+# Walks each ray from a square, stopping at (and including) the first blocker
+def _ray_attacks(sq: int, occupied: int, directions) -> int:
+    row, col = divmod(sq, 8)
+    attacks = 0
+    for dr, dc in directions:
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            bit = 1 << square_index(r, c)
+            attacks |= bit
+            if occupied & bit:
+                break
+            r += dr
+            c += dc
+    return attacks
+
+# Precomputes, for every square and line through it, the attack set for each
+# possible arrangement of blockers on that line. Edge squares never change the
+# result, so they are left out of the mask to keep the tables small.
+def _line_tables(directions) -> List[tuple]:
+    tables = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        for dr, dc in directions:
+            r, c = row + dr, col + dc
+            while 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                mask |= 1 << square_index(r, c)
+                r += dr
+                c += dc
+        table = {}
+        subset = 0
+        while True:
+            table[subset] = _ray_attacks(sq, subset, directions)
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        tables.append((mask, table))
+    return tables
+
+_RANK_LINES = _line_tables([(0, 1), (0, -1)])
+_FILE_LINES = _line_tables([(1, 0), (-1, 0)])
+_DIAGONAL_LINES = _line_tables([(1, 1), (-1, -1)])
+_ANTI_DIAGONAL_LINES = _line_tables([(1, -1), (-1, 1)])
+
+def rook_attacks(sq: int, occupied: int) -> int:
+    rank_mask, rank_table = _RANK_LINES[sq]
+    file_mask, file_table = _FILE_LINES[sq]
+    return rank_table[occupied & rank_mask] | file_table[occupied & file_mask]
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+    diag_mask, diag_table = _DIAGONAL_LINES[sq]
+    anti_mask, anti_table = _ANTI_DIAGONAL_LINES[sq]
+    return diag_table[occupied & diag_mask] | anti_table[occupied & anti_mask]
+
+def queen_attacks(sq: int, occupied: int) -> int:
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+# Squares strictly between two squares sharing a rank, file or diagonal (0 otherwise)
+def _between_table() -> List[List[int]]:
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                if (dr, dc) == (0, 0):
+                    continue
+                between = 0
+                r, c = row + dr, col + dc
+                while 0 <= r < 8 and 0 <= c < 8:
+                    target = square_index(r, c)
+                    table[sq][target] = between
+                    between |= 1 << target
+                    r += dr
+                    c += dc
+    return table
+
+BETWEEN = _between_table()
+
+# Moves are 16-bit integers: bits 0-5 from square, 6-11 to square, 12-15 flags
+Move = int
+QUIET_MOVE = 0
+DOUBLE_PAWN_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EN_PASSANT = 5
+# Promotions set this flag bit; the low two flag bits pick the piece
+PROMOTION = 8
+PROMOTION_PIECES = (PieceType.KNIGHT.value, PieceType.BISHOP.value, PieceType.ROOK.value, PieceType.QUEEN.value)
+PROMOTION_CODES = {piece_type: code for code, piece_type in enumerate(PROMOTION_PIECES)}
+# Most legal moves possible in any chess position is 218
+MAX_MOVES = 256
+PROMOTION_RANKS = 0xFF | (0xFF << 56)
+
+def encode_move(from_sq: int, to_sq: int, flags: int = QUIET_MOVE) -> Move:
+    return from_sq | (to_sq << 6) | (flags << 12)
+
+def move_from(move: Move) -> int:
+    return move & 63
+
+def move_to(move: Move) -> int:
+    return (move >> 6) & 63
+
+def move_flags(move: Move) -> int:
+    return move >> 12
+
+# PieceType value a move promotes to (0 when it is not a promotion)
+def move_promotion(move: Move) -> int:
+    flags = move >> 12
+    return PROMOTION_PIECES[flags & 3] if flags & PROMOTION else 0
+
+# A reusable move list: one flat array shared by every ply of a search, each
+# ply writing its moves after those of its parent
+def new_move_buffer(plies: int) -> array:
+    return array('H', bytes(2 * MAX_MOVES * plies))
+
+# Lowercase letter for each promotion piece type value
+PROMOTION_LETTERS = {PieceType.QUEEN.value: 'q', PieceType.ROOK.value: 'r',
+                     PieceType.BISHOP.value: 'b', PieceType.KNIGHT.value: 'n'}
+
+# Piece type for each FEN letter (uppercase is white)
+FEN_PIECE_TYPES = {'p': PieceType.PAWN, 'n': PieceType.KNIGHT, 'b': PieceType.BISHOP,
+                   'r': PieceType.ROOK, 'q': PieceType.QUEEN, 'k': PieceType.KING}
+FEN_LETTERS = {piece_type.value: letter for letter, piece_type in FEN_PIECE_TYPES.items()}
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+# Piece letter, origin file and rank, capture mark, target square, promotion
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(=?[NBRQ])?$')
+
+# Game state stored after the mailbox in a snapshot: side to move, castling
+# rights, en passant pawn square (255 for none), halfmove clock, move count
+SNAPSHOT_STATE = struct.Struct('<BBBHI')
+
+# Piece-square tables in centipawns, from white's point of view with a8 first
+# (the board's own square order); black reads them mirrored vertically
+_PAWN_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+]
+_PAWN_ENDGAME_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+     80,  80,  80,  80,  80,  80,  80,  80,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     30,  30,  30,  30,  30,  30,  30,  30,
+     15,  15,  15,  15,  15,  15,  15,  15,
+      5,   5,   5,   5,   5,   5,   5,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+      0,   0,   0,   0,   0,   0,   0,   0,
+]
+_KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+]
+_BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+]
+_ROOK_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0,
+]
+_QUEEN_TABLE = [
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+]
+_KING_TABLE = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20,
+]
+_KING_ENDGAME_TABLE = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+]
+
+# Material in the middlegame and endgame, indexed by PieceType value
+MIDDLEGAME_VALUES = (0, 100, 500, 320, 330, 900, 0)
+ENDGAME_VALUES = (0, 120, 530, 300, 320, 930, 0)
+# Game phase weight per piece type; 24 is the full starting complement
+PHASE_WEIGHTS = (0, 0, 2, 1, 1, 4, 0)
+TOTAL_PHASE = 24
+
+# Signed material plus square bonus per piece code and square (black negative)
+def _score_tables(values, tables) -> List[List[int]]:
+    scores = [[0] * 64 for _ in range(16)]
+    for piece_type, table in tables.items():
+        for sq in range(64):
+            scores[piece_type][sq] = values[piece_type] + table[sq]
+            scores[piece_type | BLACK_PIECE][sq] = -(values[piece_type] + table[sq ^ 56])
+    return scores
+
+MIDDLEGAME_SCORES = _score_tables(MIDDLEGAME_VALUES, {1: _PAWN_TABLE, 2: _ROOK_TABLE, 3: _KNIGHT_TABLE,
+                                                      4: _BISHOP_TABLE, 5: _QUEEN_TABLE, 6: _KING_TABLE})
+ENDGAME_SCORES = _score_tables(ENDGAME_VALUES, {1: _PAWN_ENDGAME_TABLE, 2: _ROOK_TABLE, 3: _KNIGHT_TABLE,
+                                                4: _BISHOP_TABLE, 5: _QUEEN_TABLE, 6: _KING_ENDGAME_TABLE})
+
+# Castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING = 15
+
+# Rights that survive a move touching each square (king and rook home squares)
+CASTLING_MASK = [ALL_CASTLING] * 64
+CASTLING_MASK[square_index(7, 4)] &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[square_index(7, 7)] &= ~WHITE_KINGSIDE
+CASTLING_MASK[square_index(7, 0)] &= ~WHITE_QUEENSIDE
+CASTLING_MASK[square_index(0, 4)] &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[square_index(0, 7)] &= ~BLACK_KINGSIDE
+CASTLING_MASK[square_index(0, 0)] &= ~BLACK_QUEENSIDE
+
+# Zobrist keys, drawn from a fixed seed so keys are stable between runs
+_zobrist_random = random.Random(0x5EED)
+ZOBRIST_PIECES = [[[_zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(7)] for _ in range(2)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+
+# Squares attacked by a single piece of the given color index and type value
+def piece_attacks(sq: int, color: int, piece_type: int, occupied: int) -> int:
+    if piece_type == 1:
+        return PAWN_ATTACKS[color][sq]
+    if piece_type == 3:
+        return KNIGHT_ATTACKS[sq]
+    if piece_type == 4:
+        return bishop_attacks(sq, occupied)
+    if piece_type == 2:
+        return rook_attacks(sq, occupied)
+    if piece_type == 5:
+        return queen_attacks(sq, occupied)
+    return KING_ATTACKS[sq]
 
 class ChessBoard:
-    def __init__(self):
-        # Initialize empty board and game state
-        self.board = [[None for _ in range(8)] for _ in range(8)]
+    # Recompute the evaluation from scratch on every evaluate() call and fail
+    # loudly if the incrementally kept terms have drifted
+    debug_evaluation = False
+
+    def __init__(self, fen: Optional[str] = None):
+        # Initialize empty board and game state, then set up the starting
+        # position or the one given as FEN
+        # Piece code on each square, indexed by square_index(row, col)
+        self.board = bytearray(64)
         self.current_turn = Color.WHITE
         self.last_move = None
         self.move_count = 0
         self.position_history = []
         self.en_passant_target = None
-        self.initialize_board()
+        self.castling_rights = ALL_CASTLING
+        # Moves since the last capture or pawn move, for the fifty-move rule
+        self.halfmove_clock = 0
+        self.zobrist_key = 0
+        # Previous state for each pushed move, most recent last
+        self.undo_stack = []
+        self._move_buffer = new_move_buffer(1)
+        # Bitboards per color and piece type, indexed [color index][PieceType value]
+        self.pieces = [[0] * 7 for _ in range(2)]
+        self.occupancy = [0, 0]
+        self.occupied = 0
+        # Squares each piece attacks, and the union of those per color
+        self.square_attacks = [0] * 64
+        self.attack_maps = [0, 0]
+        self._dirty = 0
+        # Evaluation terms kept up to date as pieces are placed and removed
+        self.middlegame_score = 0
+        self.endgame_score = 0
+        self.phase = 0
+        # Legal moves and status of the current position, filled on first use
+        self._legal_cache = None
+        self._status = None
+        if fen is None:
+            self.initialize_board()
+        else:
+            self.set_fen(fen)
         
     def initialize_board(self):
-        # Initialize white pieces
-        self.board[7] = [
-            Piece(PieceType.ROOK, Color.WHITE),
-            Piece(PieceType.KNIGHT, Color.WHITE),
-            Piece(PieceType.BISHOP, Color.WHITE),
-            Piece(PieceType.QUEEN, Color.WHITE),
-            Piece(PieceType.KING, Color.WHITE),
-            Piece(PieceType.BISHOP, Color.WHITE),
-            Piece(PieceType.KNIGHT, Color.WHITE),
-            Piece(PieceType.ROOK, Color.WHITE)
-        ]
-        self.board[6] = [Piece(PieceType.PAWN, Color.WHITE) for _ in range(8)]
-        
-        # Initialize black pieces
-        self.board[0] = [
-            Piece(PieceType.ROOK, Color.BLACK),
-            Piece(PieceType.KNIGHT, Color.BLACK),
-            Piece(PieceType.BISHOP, Color.BLACK),
-            Piece(PieceType.QUEEN, Color.BLACK),
-            Piece(PieceType.KING, Color.BLACK),
-            Piece(PieceType.BISHOP, Color.BLACK),
-            Piece(PieceType.KNIGHT, Color.BLACK),
-            Piece(PieceType.ROOK, Color.BLACK)
-        ]
-        self.board[1] = [Piece(PieceType.PAWN, Color.BLACK) for _ in range(8)]
-        
-        # Initialize empty squares
-        for i in range(2, 6):
-            self.board[i] = [None for _ in range(8)]
-            
+        # Set up the starting position
+        self.set_fen(STARTING_FEN)
+
+    def sync_bitboards(self):
+        # Rebuild every bitboard from the mailbox
+        self.pieces = [[0] * 7 for _ in range(2)]
+        self.occupancy = [0, 0]
+        for sq, piece in enumerate(self.board):
+            if piece:
+                bit = 1 << sq
+                us = piece >> 3
+                self.pieces[us][piece & 7] |= bit
+                self.occupancy[us] |= bit
+        self.occupied = self.occupancy[0] | self.occupancy[1]
+        self.middlegame_score, self.endgame_score, self.phase = self.compute_evaluation_terms()
+        self._dirty = (1 << 64) - 1
+        self._refresh_attacks()
+        self.zobrist_key = self.compute_zobrist_key()
+        self.position_history = [self.zobrist_key]
+        self._legal_cache = None
+        self._status = None
+
+    def set_fen(self, fen: str):
+        # Set up the position described by a FEN string
+        fields = fen.split()
+        rows = fields[0].split('/') if fields else []
+        if len(fields) < 4 or len(rows) != 8:
+            raise ValueError("Invalid FEN")
+
+        board = bytearray(64)
+        for r, text in enumerate(rows):
+            c = 0
+            for ch in text:
+                if ch.isdigit():
+                    c += int(ch)
+                    continue
+                if ch.lower() not in FEN_PIECE_TYPES or c >= 8:
+                    raise ValueError("Invalid FEN")
+                board[square_index(r, c)] = make_piece(FEN_PIECE_TYPES[ch.lower()], Color.WHITE if ch.isupper() else Color.BLACK)
+                c += 1
+            if c != 8:
+                raise ValueError("Invalid FEN")
+
+        if fields[1] not in ('w', 'b'):
+            raise ValueError("Invalid FEN")
+        rights = 0
+        if fields[2] != '-':
+            for ch in fields[2]:
+                if ch not in 'KQkq':
+                    raise ValueError("Invalid FEN")
+                rights |= {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE, 'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}[ch]
+        for right, row, col in ((WHITE_KINGSIDE, 7, 7), (WHITE_QUEENSIDE, 7, 0),
+                                (BLACK_KINGSIDE, 0, 7), (BLACK_QUEENSIDE, 0, 0)):
+            color = Color.WHITE if row == 7 else Color.BLACK
+            if (board[square_index(row, 4)] != make_piece(PieceType.KING, color) or
+                    board[square_index(row, col)] != make_piece(PieceType.ROOK, color)):
+                rights &= ~right
+
+        self.board = board
+        self.current_turn = Color.WHITE if fields[1] == 'w' else Color.BLACK
+        self.castling_rights = rights
+        self.en_passant_target = None
+        if fields[3] != '-':
+            ep_row, ep_col = self.algebraic_to_index(fields[3])
+            self.en_passant_target = (ep_row + 1 if self.current_turn == Color.WHITE else ep_row - 1, ep_col)
+        self.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        fullmove = int(fields[5]) if len(fields) > 5 else 1
+        self.move_count = (fullmove - 1) * 2 + (1 if self.current_turn == Color.BLACK else 0)
+        self.last_move = None
+        self.undo_stack = []
+        self.sync_bitboards()
+
+    def get_fen(self) -> str:
+        # The position as a FEN string
+        rows = []
+        for row in range(8):
+            text = ''
+            empty = 0
+            for col in range(8):
+                piece = self.board[square_index(row, col)]
+                if not piece:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                letter = FEN_LETTERS[piece & 7]
+                text += letter.upper() if piece_color_of(piece) == Color.WHITE else letter
+            rows.append(text + (str(empty) if empty else ''))
+        rights = ''.join(letter for right, letter in ((WHITE_KINGSIDE, 'K'), (WHITE_QUEENSIDE, 'Q'),
+                                                      (BLACK_KINGSIDE, 'k'), (BLACK_QUEENSIDE, 'q'))
+                         if self.castling_rights & right) or '-'
+        en_passant = '-'
+        if self.en_passant_target:
+            row, col = self.en_passant_target
+            en_passant = self.index_to_algebraic(row + 1 if row == 4 else row - 1, col)
+        return (f"{'/'.join(rows)} {'w' if self.current_turn == Color.WHITE else 'b'} {rights} "
+                f"{en_passant} {self.halfmove_clock} {self.move_count // 2 + 1}")
+
+    def snapshot(self) -> bytes:
+        # The position as 73 bytes: the mailbox followed by the packed game state
+        if self.en_passant_target:
+            ep_sq = square_index(*self.en_passant_target)
+        else:
+            ep_sq = 255
+        return bytes(self.board) + SNAPSHOT_STATE.pack(
+            COLOR_INDEX[self.current_turn], self.castling_rights, ep_sq, self.halfmove_clock, self.move_count)
+
+    def restore(self, snapshot: bytes):
+        # Set up a position saved by snapshot(); the undo stack is cleared
+        side, self.castling_rights, ep_sq, self.halfmove_clock, self.move_count = SNAPSHOT_STATE.unpack_from(snapshot, 64)
+        self.board = bytearray(snapshot[:64])
+        self.current_turn = INDEX_COLOR[side]
+        self.en_passant_target = divmod(ep_sq, 8) if ep_sq != 255 else None
+        self.last_move = None
+        self.undo_stack = []
+        self.sync_bitboards()
+
+    @classmethod
+    def from_snapshot(cls, snapshot: bytes, history: Optional[List[int]] = None) -> 'ChessBoard':
+        # Rebuild a board from snapshot(), optionally with its repetition history
+        board = cls()
+        board.restore(snapshot)
+        if history:
+            board.position_history = list(history)
+        return board
+
+    def __reduce__(self):
+        # Pickle (for process pools) as a snapshot plus the repetition history
+        return (ChessBoard.from_snapshot, (self.snapshot(), self.position_history))
+
+    def _en_passant_file(self) -> Optional[int]:
+        # File of the en passant target, counted only when a pawn could take it
+        if not self.en_passant_target:
+            return None
+        row, col = self.en_passant_target
+        pusher = 0 if row == 4 else 1
+        passed_sq = square_index(row + (1 if pusher == 0 else -1), col)
+        if PAWN_ATTACKS[pusher][passed_sq] & self.pieces[pusher ^ 1][PieceType.PAWN.value]:
+            return col
+        return None
+
+    def compute_zobrist_key(self) -> int:
+        # Hash the whole position from scratch
+        key = 0
+        for us in (0, 1):
+            for piece_type in range(1, 7):
+                for sq in iter_bits(self.pieces[us][piece_type]):
+                    key ^= ZOBRIST_PIECES[us][piece_type][sq]
+        if self.current_turn == Color.BLACK:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING[self.castling_rights]
+        ep_file = self._en_passant_file()
+        if ep_file is not None:
+            key ^= ZOBRIST_EN_PASSANT[ep_file]
+        return key
+
+    def _refresh_attacks(self):
+        # Recompute the attacks of pieces standing on squares touched since the
+        # last refresh, and of any slider whose rays reach one of those squares
+        changed = self._dirty
+        if not changed:
+            return
+        self._dirty = 0
+        occupied = self.occupied
+        square_attacks = self.square_attacks
+        board = self.board
+        white, black = self.pieces
+        sliders = (white[2] | white[4] | white[5] | black[2] | black[4] | black[5]) & ~changed
+        for sq in iter_bits(sliders):
+            if square_attacks[sq] & changed:
+                changed |= 1 << sq
+        for sq in iter_bits(changed):
+            piece = board[sq]
+            if piece:
+                square_attacks[sq] = piece_attacks(sq, piece >> 3, piece & 7, occupied)
+            else:
+                square_attacks[sq] = 0
+        for us in (0, 1):
+            attacked = 0
+            for sq in iter_bits(self.occupancy[us]):
+                attacked |= square_attacks[sq]
+            self.attack_maps[us] = attacked
+
+    def _remove_piece(self, sq: int) -> int:
+        # Take a piece off the mailbox and its bitboards
+        piece = self.board[sq]
+        if piece:
+            bit = 1 << sq
+            us = piece >> 3
+            self.pieces[us][piece & 7] ^= bit
+            self.occupancy[us] ^= bit
+            self.occupied ^= bit
+            self._dirty |= bit
+            self.zobrist_key ^= ZOBRIST_PIECES[us][piece & 7][sq]
+            self.middlegame_score -= MIDDLEGAME_SCORES[piece][sq]
+            self.endgame_score -= ENDGAME_SCORES[piece][sq]
+            self.phase -= PHASE_WEIGHTS[piece & 7]
+            self.board[sq] = EMPTY
+        return piece
+
+    def _place_piece(self, sq: int, piece: int):
+        # Put a piece on an empty square of the mailbox and its bitboards
+        bit = 1 << sq
+        us = piece >> 3
+        self.pieces[us][piece & 7] |= bit
+        self.occupancy[us] |= bit
+        self.occupied |= bit
+        self._dirty |= bit
+        self.zobrist_key ^= ZOBRIST_PIECES[us][piece & 7][sq]
+        self.middlegame_score += MIDDLEGAME_SCORES[piece][sq]
+        self.endgame_score += ENDGAME_SCORES[piece][sq]
+        self.phase += PHASE_WEIGHTS[piece & 7]
+        self.board[sq] = piece
+
+    def compute_evaluation_terms(self) -> Tuple[int, int, int]:
+        # Middlegame score, endgame score and phase from a full board scan
+        middlegame = endgame = phase = 0
+        for sq, piece in enumerate(self.board):
+            if piece:
+                middlegame += MIDDLEGAME_SCORES[piece][sq]
+                endgame += ENDGAME_SCORES[piece][sq]
+                phase += PHASE_WEIGHTS[piece & 7]
+        return middlegame, endgame, phase
+
+    def evaluate(self) -> int:
+        # Tapered material and piece-square score from the side to move, in O(1)
+        if self.debug_evaluation:
+            terms = self.compute_evaluation_terms()
+            if terms != (self.middlegame_score, self.endgame_score, self.phase):
+                raise AssertionError(f"Evaluation drifted: kept {(self.middlegame_score, self.endgame_score, self.phase)}, "
+                                     f"recomputed {terms}")
+        phase = min(self.phase, TOTAL_PHASE)
+        score = (self.middlegame_score * phase + self.endgame_score * (TOTAL_PHASE - phase)) // TOTAL_PHASE
+        return score if self.current_turn == Color.WHITE else -score
+
     def display(self):
         # Display the current board state
         print("   a  b  c  d  e  f  g  h")
@@ -93,11 +658,11 @@ class ChessBoard:
         for i in range(8):
             print(f"{8-i}|", end=" ")
             for j in range(8):
-                piece = self.board[i][j]
-                if piece is None:
+                piece = self.board[i * 8 + j]
+                if piece == EMPTY:
                     print(".", end="  ")
                 else:
-                    print(piece, end=" ")
+                    print(PIECE_SYMBOLS[piece], end=" ")
             print(f"|")
 
     def algebraic_to_index(self, algebraic: str) -> tuple:
@@ -116,360 +681,2503 @@ class ChessBoard:
         # Check if position is within board bounds
         return 0 <= row < 8 and 0 <= col < 8
 
-    def get_piece(self, row: int, col: int) -> Optional[Piece]:
-        # Get piece at specified position
+    def get_piece(self, row: int, col: int) -> int:
+        # Get piece code at specified position (EMPTY when off the board)
         if not self.is_valid_position(row, col):
-            return None
-        return self.board[row][col]
+            return EMPTY
+        return self.board[row * 8 + col]
 
     def is_path_clear(self, from_row: int, from_col: int, to_row: int, to_col: int) -> bool:
-        # Check if path between two points is clear of pieces
-        row_step = 0 if from_row == to_row else (to_row - from_row) // abs(to_row - from_row)
-        col_step = 0 if from_col == to_col else (to_col - from_col) // abs(to_col - from_col)
-        
-        row, col = from_row + row_step, from_col + col_step
-        while (row, col) != (to_row, to_col):
-            if self.get_piece(row, col) is not None:
-                return False
-            row += row_step
-            col += col_step
-        return True
+        # Check if the squares strictly between two aligned points are empty
+        return not BETWEEN[square_index(from_row, from_col)][square_index(to_row, to_col)] & self.occupied
+
+    def _legal_context(self, us: int) -> tuple:
+        # Work out, once per position, which enemy pieces give check and which
+        # of our pieces are pinned (with the ray each pinned piece may use)
+        if self._dirty:
+            self._refresh_attacks()
+        them = us ^ 1
+        king_bb = self.pieces[us][PieceType.KING.value]
+        if not king_bb:
+            return -1, 0, (1 << 64) - 1, 0, {}
+        king_sq = king_bb.bit_length() - 1
+        checkers = self.attackers_to(king_sq, them)
+        if not checkers:
+            check_mask = (1 << 64) - 1
+        elif checkers & (checkers - 1):
+            check_mask = 0
+        else:
+            check_mask = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+
+        enemy = self.pieces[them]
+        own = self.occupancy[us]
+        snipers = ((rook_attacks(king_sq, 0) & (enemy[2] | enemy[5])) |
+                   (bishop_attacks(king_sq, 0) & (enemy[4] | enemy[5])))
+        pinned = 0
+        pin_rays = {}
+        for sniper in iter_bits(snipers):
+            between = BETWEEN[king_sq][sniper]
+            blockers = between & self.occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pinned |= blockers
+                pin_rays[blockers.bit_length() - 1] = between | (1 << sniper)
+        return king_sq, checkers, check_mask, pinned, pin_rays
+
+    def _en_passant_square(self, us: int) -> Optional[int]:
+        # Square of the enemy pawn that may be taken en passant, if any
+        if not self.en_passant_target:
+            return None
+        ep_sq = square_index(*self.en_passant_target)
+        if not self.pieces[us ^ 1][PieceType.PAWN.value] & (1 << ep_sq):
+            return None
+        return ep_sq
+
+    def _legal_targets(self, sq: int, piece_type: int, us: int, context: tuple) -> int:
+        # Bitboard of legal destinations for our piece on `sq`
+        king_sq, checkers, check_mask, pinned, pin_rays = context
+        them = us ^ 1
+        own = self.occupancy[us]
+        occupied = self.occupied
+
+        if piece_type == 6:
+            targets = KING_ATTACKS[sq] & ~own
+            if checkers:
+                # Sliders see through the king along the checking line
+                without_king = occupied ^ (1 << sq)
+                legal = 0
+                for target in iter_bits(targets & ~self.attack_maps[them]):
+                    if not self.attackers_to(target, them, without_king):
+                        legal |= 1 << target
+                return legal
+            targets &= ~self.attack_maps[them]
+
+            # Castling
+            rights = self.castling_rights & (WHITE_KINGSIDE | WHITE_QUEENSIDE if us == 0 else BLACK_KINGSIDE | BLACK_QUEENSIDE)
+            if rights:
+                enemy_attacks = self.attack_maps[them]
+                rooks = self.pieces[us][2]
+                corner = sq & ~7
+                # Kingside castle
+                if (rights & (WHITE_KINGSIDE | BLACK_KINGSIDE) and
+                    rooks & (1 << (corner + 7)) and
+                    not BETWEEN[sq][corner + 7] & occupied and
+                    not enemy_attacks & (0b11 << (sq + 1))):
+                    targets |= 1 << (sq + 2)
+
+                # Queenside castle
+                if (rights & (WHITE_QUEENSIDE | BLACK_QUEENSIDE) and
+                    rooks & (1 << corner) and
+                    not BETWEEN[sq][corner] & occupied and
+                    not enemy_attacks & (0b11 << (sq - 2))):
+                    targets |= 1 << (sq - 2)
+            return targets
+
+        if check_mask == 0:
+            return 0
+
+        if piece_type == 1:
+            forward = -8 if us == 0 else 8
+            targets = 0
+            one = sq + forward
+            if 0 <= one < 64 and not occupied & (1 << one):
+                targets |= 1 << one
+                if (sq >> 3) == (6 if us == 0 else 1) and not occupied & (1 << (one + forward)):
+                    targets |= 1 << (one + forward)
+            attacks = PAWN_ATTACKS[us][sq]
+            targets |= attacks & self.occupancy[them]
+            targets &= check_mask
+
+            # En passant: both pawns leave the rank at once, so verify the
+            # resulting position directly to catch discovered rank checks
+            ep_sq = self._en_passant_square(us)
+            if ep_sq is not None and attacks & (1 << (ep_sq + forward)):
+                ep_bit = 1 << ep_sq
+                to_bit = 1 << (ep_sq + forward)
+                if king_sq < 0:
+                    targets |= to_bit
+                else:
+                    after = occupied ^ (1 << sq) ^ ep_bit | to_bit
+                    if not self.attackers_to(king_sq, them, after) & ~ep_bit:
+                        targets |= to_bit
+        elif piece_type == 3:
+            targets = KNIGHT_ATTACKS[sq] & ~own & check_mask
+        else:
+            targets = piece_attacks(sq, us, piece_type, occupied) & ~own & check_mask
+
+        if pinned & (1 << sq):
+            targets &= pin_rays[sq]
+        return targets
+
+    def generate_moves(self, buffer: array, start: int = 0, captures_only: bool = False,
+                       color: Optional[Color] = None) -> int:
+        # Write the legal moves of a side (the side to move by default) into
+        # buffer from index start in one pass, and return the end index.
+        # captures_only keeps captures and promotions, for quiescence search.
+        us = COLOR_INDEX[color or self.current_turn]
+        context = self._legal_context(us)
+        check_mask = context[2]
+        bbs = self.pieces[us]
+        enemy = self.occupancy[us ^ 1]
+        end = start
+        for piece_type in (6, 1, 3, 4, 2, 5):
+            if check_mask == 0 and piece_type != 6:
+                break
+            for sq in iter_bits(bbs[piece_type]):
+                targets = self._legal_targets(sq, piece_type, us, context)
+                if piece_type == 1:
+                    if captures_only:
+                        targets &= enemy | PROMOTION_RANKS | PAWN_ATTACKS[us][sq]
+                    for target in iter_bits(targets):
+                        if (1 << target) & PROMOTION_RANKS:
+                            flags = PROMOTION | CAPTURE if enemy >> target & 1 else PROMOTION
+                            for code in (3, 2, 1, 0):
+                                buffer[end] = sq | (target << 6) | ((flags | code) << 12)
+                                end += 1
+                            continue
+                        delta = target - sq
+                        if delta == 16 or delta == -16:
+                            flags = DOUBLE_PAWN_PUSH
+                        elif delta == 8 or delta == -8:
+                            flags = QUIET_MOVE
+                        elif enemy >> target & 1:
+                            flags = CAPTURE
+                        else:
+                            flags = EN_PASSANT
+                        buffer[end] = sq | (target << 6) | (flags << 12)
+                        end += 1
+                else:
+                    if captures_only:
+                        targets &= enemy
+                    for target in iter_bits(targets):
+                        if enemy >> target & 1:
+                            flags = CAPTURE
+                        elif piece_type == 6 and target - sq == 2:
+                            flags = KING_CASTLE
+                        elif piece_type == 6 and target - sq == -2:
+                            flags = QUEEN_CASTLE
+                        else:
+                            flags = QUIET_MOVE
+                        buffer[end] = sq | (target << 6) | (flags << 12)
+                        end += 1
+        return end
+
+    def generate_legal_moves(self, color: Optional[Color] = None) -> List[Move]:
+        # Every legal move for a side as a list; searches should prefer generate_moves
+        end = self.generate_moves(self._move_buffer, 0, color=color)
+        return self._move_buffer[:end].tolist()
+
+    def find_move(self, from_sq: int, to_sq: int, promotion: int = 0) -> Optional[Move]:
+        # The legal encoded move between two squares, if there is one
+        for move in self.legal_moves():
+            if move & 0xFFF == from_sq | (to_sq << 6) and move_promotion(move) == promotion:
+                return move
+        return None
+
+    def has_legal_moves(self, color: Color) -> bool:
+        # Stop at the first piece that has somewhere to go
+        us = COLOR_INDEX[color]
+        context = self._legal_context(us)
+        bbs = self.pieces[us]
+        for piece_type in (6, 1, 3, 4, 2, 5):
+            for sq in iter_bits(bbs[piece_type]):
+                if self._legal_targets(sq, piece_type, us, context):
+                    return True
+        return False
+
+    def legal_moves(self) -> Tuple[Move, ...]:
+        # Legal moves for the side to move, generated once per position and
+        # shared by every caller until the next push or pop
+        if self._legal_cache is None:
+            self._legal_cache = tuple(self.generate_legal_moves())
+        return self._legal_cache
+
+    def status(self) -> GameStatus:
+        # Single game status for the side to move, cached like legal_moves()
+        if self._status is None:
+            in_check = self.is_in_check(self.current_turn)
+            if not self.legal_moves():
+                self._status = GameStatus.CHECKMATE if in_check else GameStatus.STALEMATE
+            elif self.is_fifty_move_draw() or self.is_repetition() or self.is_insufficient_material():
+                self._status = GameStatus.DRAW
+            elif in_check:
+                self._status = GameStatus.CHECK
+            else:
+                self._status = GameStatus.ONGOING
+        return self._status
+
+    def is_insufficient_material(self) -> bool:
+        # Bare kings, or a single knight or bishop against a bare king
+        white, black = self.pieces
+        if white[1] | white[2] | white[5] | black[1] | black[2] | black[5]:
+            return False
+        return (white[3] | white[4] | black[3] | black[4]).bit_count() <= 1
 
     def get_valid_moves(self, row: int, col: int) -> List[Tuple[int, int]]:
         # Get all valid moves for piece at specified position
         piece = self.get_piece(row, col)
-        if piece is None:
+        if piece == EMPTY:
             return []
-            
-        valid_moves = []
-        
-        if piece.piece_type == PieceType.PAWN:
-            direction = -1 if piece.color == Color.WHITE else 1
-            if self.is_valid_position(row + direction, col) and self.get_piece(row + direction, col) is None:
-                valid_moves.append((row + direction, col))
-                if (not piece.has_moved and 
-                    self.is_valid_position(row + 2*direction, col) and
-                    self.get_piece(row + 2*direction, col) is None):
-                    valid_moves.append((row + 2*direction, col))
-            
-            # Diagonal captures
-            for c in [col-1, col+1]:
-                if self.is_valid_position(row + direction, c):
-                    target = self.get_piece(row + direction, c)
-                    if target and target.color != piece.color:
-                        valid_moves.append((row + direction, c))
-                        
-            # En passant
-            if self.en_passant_target:
-                if (row == self.en_passant_target[0] and 
-                    abs(col - self.en_passant_target[1]) == 1):
-                    valid_moves.append((row + direction, self.en_passant_target[1]))
-                    
-        elif piece.piece_type == PieceType.ROOK:
-            # Horizontal and vertical moves
-            for direction in [(0,1), (0,-1), (1,0), (-1,0)]:
-                r, c = row + direction[0], col + direction[1]
-                while self.is_valid_position(r, c):
-                    target = self.get_piece(r, c)
-                    if target is None:
-                        valid_moves.append((r, c))
-                    elif target.color != piece.color:
-                        valid_moves.append((r, c))
-                        break
-                    else:
-                        break
-                    r += direction[0]
-                    c += direction[1]
-                    
-        elif piece.piece_type == PieceType.KNIGHT:
-            # L-shaped moves
-            moves = [
-                (row+2, col+1), (row+2, col-1),
-                (row-2, col+1), (row-2, col-1),
-                (row+1, col+2), (row+1, col-2),
-                (row-1, col+2), (row-1, col-2)
-            ]
-            for r, c in moves:
-                if self.is_valid_position(r, c):
-                    target = self.get_piece(r, c)
-                    if target is None or target.color != piece.color:
-                        valid_moves.append((r, c))
-                        
-        elif piece.piece_type == PieceType.BISHOP:
-            # Diagonal moves
-            for direction in [(1,1), (1,-1), (-1,1), (-1,-1)]:
-                r, c = row + direction[0], col + direction[1]
-                while self.is_valid_position(r, c):
-                    target = self.get_piece(r, c)
-                    if target is None:
-                        valid_moves.append((r, c))
-                    elif target.color != piece.color:
-                        valid_moves.append((r, c))
-                        break
-                    else:
-                        break
-                    r += direction[0]
-                    c += direction[1]
-                    
-        elif piece.piece_type == PieceType.QUEEN:
-            # Combined rook and bishop moves
-            directions = [(0,1), (0,-1), (1,0), (-1,0), (1,1), (1,-1), (-1,1), (-1,-1)]
-            for direction in directions:
-                r, c = row + direction[0], col + direction[1]
-                while self.is_valid_position(r, c):
-                    target = self.get_piece(r, c)
-                    if target is None:
-                        valid_moves.append((r, c))
-                    elif target.color != piece.color:
-                        valid_moves.append((r, c))
-                        break
-                    else:
-                        break
-                    r += direction[0]
-                    c += direction[1]
-                    
-        elif piece.piece_type == PieceType.KING:
-            # One square in any direction
-            for r in range(row-1, row+2):
-                for c in range(col-1, col+2):
-                    if (r,c) != (row,col) and self.is_valid_position(r, c):
-                        target = self.get_piece(r, c)
-                        if target is None or target.color != piece.color:
-                            valid_moves.append((r, c))
-            
-            # Castling
-            if not piece.has_moved and not self.is_in_check(piece.color):
-                # Kingside castle
-                rook = self.get_piece(row, 7)
-                if (rook and rook.piece_type == PieceType.ROOK and 
-                    not rook.has_moved and 
-                    self.is_path_clear(row, col, row, 7) and
-                    not self.is_square_attacked(row, col+1, piece.color) and
-                    not self.is_square_attacked(row, col+2, piece.color)):
-                    valid_moves.append((row, col+2))
-                
-                # Queenside castle
-                rook = self.get_piece(row, 0)
-                if (rook and rook.piece_type == PieceType.ROOK and 
-                    not rook.has_moved and 
-                    self.is_path_clear(row, col, row, 0) and
-                    not self.is_square_attacked(row, col-1, piece.color) and
-                    not self.is_square_attacked(row, col-2, piece.color)):
-                    valid_moves.append((row, col-2))
-                    
-        # Filter moves that would result in check
-        filtered_moves = []
-        for move in valid_moves:
-            original_piece = self.board[move[0]][move[1]]
-            self.board[move[0]][move[1]] = piece
-            self.board[row][col] = None
-            
-            if not self.is_in_check(piece.color):
-                filtered_moves.append(move)
-            
-            # Restore position
-            self.board[row][col] = piece
-            self.board[move[0]][move[1]] = original_piece
-            
-        return filtered_moves
+        sq = square_index(row, col)
+        if piece_color_of(piece) == self.current_turn:
+            targets = 0
+            for move in self.legal_moves():
+                if move & 63 == sq:
+                    targets |= 1 << ((move >> 6) & 63)
+        else:
+            us = piece >> 3
+            targets = self._legal_targets(sq, piece & 7, us, self._legal_context(us))
+        return [divmod(target, 8) for target in iter_bits(targets)]
+
+    def attackers_to(self, sq: int, by: int, occupied: Optional[int] = None) -> int:
+        # Bitboard of pieces of color index `by` attacking `sq`, found by looking
+        # outward from the square with each piece's attack pattern
+        if occupied is None:
+            occupied = self.occupied
+        bbs = self.pieces[by]
+        queens = bbs[5]
+        return ((PAWN_ATTACKS[by ^ 1][sq] & bbs[1]) |
+                (KNIGHT_ATTACKS[sq] & bbs[3]) |
+                (KING_ATTACKS[sq] & bbs[6]) |
+                (bishop_attacks(sq, occupied) & (bbs[4] | queens)) |
+                (rook_attacks(sq, occupied) & (bbs[2] | queens)))
 
     def is_square_attacked(self, row: int, col: int, color: Color) -> bool:
         # Check if square is attacked by opponent
-        for r in range(8):
-            for c in range(8):
-                piece = self.get_piece(r, c)
-                if piece and piece.color != color:
-                    target = self.board[row][col]
-                    self.board[row][col] = None
-                    moves = self.get_valid_moves(r, c)
-                    self.board[row][col] = target
-                    
-                    if (row, col) in moves:
-                        return True
-        return False
+        if self._dirty:
+            self._refresh_attacks()
+        return bool(self.attack_maps[COLOR_INDEX[color] ^ 1] >> square_index(row, col) & 1)
 
     def is_in_check(self, color: Color) -> bool:
         # Check if king is in check
-        king_pos = None
-        for r in range(8):
-            for c in range(8):
-                piece = self.get_piece(r, c)
-                if (piece and piece.piece_type == PieceType.KING and 
-                    piece.color == color):
-                    king_pos = (r, c)
-                    break
-            if king_pos:
-                break
-                
-        if not king_pos:
+        us = COLOR_INDEX[color]
+        king_bb = self.pieces[us][PieceType.KING.value]
+        if not king_bb:
             return False
-                
-        return self.is_square_attacked(king_pos[0], king_pos[1], color)
+        if self._dirty:
+            self._refresh_attacks()
+        return bool(self.attack_maps[us ^ 1] & king_bb)
 
     def is_checkmate(self, color: Color) -> bool:
         # Check if king is in checkmate
-        if not self.is_in_check(color):
-            return False
-        
-        for r in range(8):
-            for c in range(8):
-                piece = self.get_piece(r, c)
-                if piece and piece.color == color:
-                    if self.get_valid_moves(r, c):
-                        return False
-        return True
+        if color == self.current_turn:
+            return self.status() == GameStatus.CHECKMATE
+        return self.is_in_check(color) and not self.has_legal_moves(color)
 
     def is_stalemate(self, color: Color) -> bool:
         # Check if position is stalemate
-        if self.is_in_check(color):
+        if color == self.current_turn:
+            return self.status() == GameStatus.STALEMATE
+        return not self.is_in_check(color) and not self.has_legal_moves(color)
+
+    def push(self, move: Move):
+        # Play a legal encoded move without any prompting, saving what pop()
+        # needs to undo it
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flags = move >> 12
+        board = self.board
+        piece = board[from_sq]
+        if flags == EN_PASSANT:
+            # The captured pawn sits beside the moving one
+            captured_sq = (from_sq & ~7) | (to_sq & 7)
+        else:
+            captured_sq = to_sq
+        captured = board[captured_sq]
+
+        self.undo_stack.append((move, captured, self.castling_rights, self.en_passant_target,
+                                self.last_move, self.halfmove_clock, self.zobrist_key))
+        self._legal_cache = None
+        self._status = None
+
+        key = self.zobrist_key ^ ZOBRIST_CASTLING[self.castling_rights] ^ ZOBRIST_BLACK_TO_MOVE
+        ep_file = self._en_passant_file()
+        if ep_file is not None:
+            key ^= ZOBRIST_EN_PASSANT[ep_file]
+        self.zobrist_key = key
+
+        if captured:
+            self._remove_piece(captured_sq)
+        self._remove_piece(from_sq)
+        if flags & PROMOTION:
+            self._place_piece(to_sq, PROMOTION_PIECES[flags & 3] | (piece & BLACK_PIECE))
+        else:
+            self._place_piece(to_sq, piece)
+
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            corner = from_sq & ~7
+            rook_sq = corner + 7 if flags == KING_CASTLE else corner
+            self._place_piece(corner + 5 if flags == KING_CASTLE else corner + 3, self._remove_piece(rook_sq))
+
+        self.castling_rights &= CASTLING_MASK[from_sq] & CASTLING_MASK[to_sq]
+        if flags == DOUBLE_PAWN_PUSH:
+            self.en_passant_target = divmod(to_sq, 8)
+        else:
+            self.en_passant_target = None
+        self.zobrist_key ^= ZOBRIST_CASTLING[self.castling_rights]
+        ep_file = self._en_passant_file()
+        if ep_file is not None:
+            self.zobrist_key ^= ZOBRIST_EN_PASSANT[ep_file]
+
+        if piece & 7 == 1 or captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.last_move = (divmod(from_sq, 8), divmod(to_sq, 8))
+        self.current_turn = Color.BLACK if self.current_turn == Color.WHITE else Color.WHITE
+        self.move_count += 1
+        self.position_history.append(self.zobrist_key)
+
+    def pop(self) -> Move:
+        # Undo the most recent push() and return its move
+        (move, captured, castling_rights, en_passant_target,
+         last_move, halfmove_clock, zobrist_key) = self.undo_stack.pop()
+        self._legal_cache = None
+        self._status = None
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flags = move >> 12
+
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            corner = from_sq & ~7
+            rook_sq = corner + 7 if flags == KING_CASTLE else corner
+            self._place_piece(rook_sq, self._remove_piece(corner + 5 if flags == KING_CASTLE else corner + 3))
+
+        piece = self._remove_piece(to_sq)
+        if flags & PROMOTION:
+            piece = PieceType.PAWN.value | (piece & BLACK_PIECE)
+        self._place_piece(from_sq, piece)
+        if captured:
+            if flags == EN_PASSANT:
+                self._place_piece((from_sq & ~7) | (to_sq & 7), captured)
+            else:
+                self._place_piece(to_sq, captured)
+
+        self.castling_rights = castling_rights
+        self.en_passant_target = en_passant_target
+        self.last_move = last_move
+        self.halfmove_clock = halfmove_clock
+        self.zobrist_key = zobrist_key
+        self.current_turn = Color.BLACK if self.current_turn == Color.WHITE else Color.WHITE
+        self.move_count -= 1
+        self.position_history.pop()
+        return move
+
+    def is_repetition(self, count: int = 3) -> bool:
+        # Check whether the current position has occurred `count` times. Only
+        # positions since the last capture or pawn move can match, and only
+        # every other one has the same side to move.
+        key = self.zobrist_key
+        history = self.position_history
+        seen = 1
+        earliest = max(len(history) - 1 - self.halfmove_clock, 0)
+        for i in range(len(history) - 3, earliest - 1, -2):
+            if history[i] == key:
+                seen += 1
+                if seen >= count:
+                    return True
+        return False
+
+    def is_fifty_move_draw(self) -> bool:
+        # Fifty moves by each side without a capture or pawn move
+        return self.halfmove_clock >= 100
+
+    def move_to_uci(self, move: Move) -> str:
+        # Long algebraic form of a move, e.g. 'e2e4' or 'e7e8q'
+        text = self.index_to_algebraic(*divmod(move & 63, 8)) + self.index_to_algebraic(*divmod((move >> 6) & 63, 8))
+        if move >> 12 & PROMOTION:
+            text += PROMOTION_LETTERS[move_promotion(move)]
+        return text
+
+    def move_to_san(self, move: Move) -> str:
+        # Standard algebraic notation of a legal move, e.g. 'Nbd7', 'exd6', 'e8=Q+'
+        flags = move_flags(move)
+        from_sq, to_sq = move_from(move), move_to(move)
+        if flags == KING_CASTLE:
+            text = 'O-O'
+        elif flags == QUEEN_CASTLE:
+            text = 'O-O-O'
+        else:
+            piece_type = self.board[from_sq] & 7
+            target = self.index_to_algebraic(*divmod(to_sq, 8))
+            capture = 'x' if flags & CAPTURE else ''
+            if piece_type == PieceType.PAWN.value:
+                text = (chr(ord('a') + (from_sq & 7)) if capture else '') + capture + target
+                if flags & PROMOTION:
+                    text += '=' + FEN_LETTERS[move_promotion(move)].upper()
+            else:
+                rivals = [other for other in self.legal_moves()
+                          if other != move and move_to(other) == to_sq and
+                          self.board[move_from(other)] & 7 == piece_type]
+                origin = ''
+                if rivals:
+                    square = self.index_to_algebraic(*divmod(from_sq, 8))
+                    if all(move_from(other) & 7 != from_sq & 7 for other in rivals):
+                        origin = square[0]
+                    elif all(move_from(other) >> 3 != from_sq >> 3 for other in rivals):
+                        origin = square[1]
+                    else:
+                        origin = square
+                text = FEN_LETTERS[piece_type].upper() + origin + capture + target
+        self.push(move)
+        check = self.is_in_check(self.current_turn)
+        mate = check and not self.legal_moves()
+        self.pop()
+        return text + ('#' if mate else '+' if check else '')
+
+    def parse_san(self, san: str) -> Move:
+        # Resolve a move in standard algebraic notation, e.g. 'Nbd7', 'exd6',
+        # 'e8=Q+' or 'O-O', against the legal moves of the side to move
+        text = san.rstrip('+#!?')
+        if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+            flag = KING_CASTLE if len(text) == 3 else QUEEN_CASTLE
+            for move in self.legal_moves():
+                if move_flags(move) == flag:
+                    return move
+            raise ValueError(f"Illegal move: {san}")
+        match = SAN_PATTERN.match(text)
+        if not match:
+            raise ValueError(f"Invalid move: {san}")
+        piece, from_file, from_rank, _, target, promotion = match.groups()
+        piece_type = FEN_PIECE_TYPES[piece.lower()].value if piece else PieceType.PAWN.value
+        to_sq = square_index(*self.algebraic_to_index(target))
+        promoted = FEN_PIECE_TYPES[promotion[-1].lower()].value if promotion else 0
+        found = [move for move in self.legal_moves()
+                 if move_to(move) == to_sq and move_promotion(move) == promoted and
+                 self.board[move_from(move)] & 7 == piece_type and
+                 (from_file is None or move_from(move) & 7 == ord(from_file) - ord('a')) and
+                 (from_rank is None or move_from(move) >> 3 == 8 - int(from_rank))]
+        if len(found) != 1:
+            raise ValueError(f"{'Ambiguous' if found else 'Illegal'} move: {san}")
+        return found[0]
+
+    def is_promotion(self, from_pos: str, to_pos: str) -> bool:
+        # Check whether a move given in algebraic notation is a legal pawn promotion
+        try:
+            from_row, from_col = self.algebraic_to_index(from_pos)
+            to_row, to_col = self.algebraic_to_index(to_pos)
+        except ValueError:
             return False
-            
-        for r in range(8):
-            for c in range(8):
-                piece = self.get_piece(r, c)
-                if piece and piece.color == color:
-                    if self.get_valid_moves(r, c):
-                        return False
-        return True
+        piece = self.get_piece(from_row, from_col)
+        return (piece == make_piece(PieceType.PAWN, self.current_turn) and to_row in (0, 7) and
+                (to_row, to_col) in self.get_valid_moves(from_row, from_col))
 
-    def make_move(self, from_pos: str, to_pos: str) -> bool:
+    def make_move(self, from_pos: str, to_pos: str, promotion: PieceType = PieceType.QUEEN) -> bool:
         # Make a move on the board
         try:
             from_row, from_col = self.algebraic_to_index(from_pos)
             to_row, to_col = self.algebraic_to_index(to_pos)
-            
-            piece = self.get_piece(from_row, from_col)
-            if piece is None or piece.color != self.current_turn:
-                return False
-                
-            valid_moves = self.get_valid_moves(from_row, from_col)
-            if (to_row, to_col) not in valid_moves:
-                return False
-                
-            # Special move handling
-            if piece.piece_type == PieceType.KING and abs(from_col - to_col) == 2:
-                # Castling
-                rook_col = 7 if to_col > from_col else 0
-                rook_new_col = 5 if to_col > from_col else 3
-                rook = self.get_piece(from_row, rook_col)
-                self.board[from_row][rook_new_col] = rook
-                self.board[from_row][rook_col] = None
-                rook.has_moved = True
-                
-            elif piece.piece_type == PieceType.PAWN:
-                # Set en passant target
-                if abs(to_row - from_row) == 2:
-                    self.en_passant_target = (to_row, to_col)
+        except ValueError:
+            return False
+
+        from_sq, to_sq = square_index(from_row, from_col), square_index(to_row, to_col)
+        piece = self.get_piece(from_row, from_col)
+        needs_promotion = piece & 7 == PieceType.PAWN.value and to_row in (0, 7)
+        move = self.find_move(from_sq, to_sq, promotion.value if needs_promotion else 0)
+        if move is None:
+            return False
+        self.push(move)
+        return True
+
+# Centipawn value of each piece, indexed by PieceType value
+PIECE_VALUES = (0, 100, 500, 320, 330, 900, 0)
+MATE_SCORE = 30000
+# Scores beyond this bound are mates, counted in plies from the root
+MATE_BOUND = MATE_SCORE - 1000
+INFINITY = 32000
+MAX_PLY = 64
+
+# Transposition table bound types
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+# Fixed-size hash table of search results keyed by Zobrist key. Each slot
+# holds one entry; a slot is overwritten when the new result is searched at
+# least as deep, or when the stored one is left over from an earlier search.
+# A slot is two 64-bit words, the key XORed with the data followed by the
+# data itself, so a torn write from another process fails the key check and
+# reads as a miss; this lets several processes share one buffer without locks.
+class TranspositionTable:
+    def __init__(self, size_mb: int = 16, buffer=None):
+        self.size = self.slots_for(size_mb)
+        self.mask = self.size - 1
+        if buffer is None:
+            self.entries = array('Q', bytes(16 * self.size))
+        else:
+            self.entries = memoryview(buffer)[:16 * self.size].cast('Q')
+        self.generation = 0
+
+    @staticmethod
+    def slots_for(size_mb: int) -> int:
+        entries = max((size_mb << 20) // 16, 1)
+        return 1 << (entries.bit_length() - 1)
+
+    @classmethod
+    def buffer_size(cls, size_mb: int) -> int:
+        # Bytes a shared buffer needs to hold a table of this size
+        return 16 * cls.slots_for(size_mb)
+
+    def clear(self):
+        self.entries[:] = array('Q', bytes(16 * self.size))
+        self.generation = 0
+
+    def release(self):
+        # Drop the view of a shared buffer so its owner can close it
+        if isinstance(self.entries, memoryview):
+            self.entries.release()
+
+    def new_search(self):
+        # Entries from earlier searches become preferred victims
+        self.generation = (self.generation + 1) & 63
+
+    def probe(self, key: int) -> Optional[tuple]:
+        # Return (move, score, depth, bound) for a stored position; move 0 means none
+        index = (key & self.mask) << 1
+        data = self.entries[index + 1]
+        if self.entries[index] ^ data != key:
+            return None
+        return (data & 0xFFFF, ((data >> 16) & 0xFFFF) - 32768,
+                (data >> 32) & 0xFF, (data >> 40) & 3)
+
+    def store(self, key: int, depth: int, score: int, bound: int, move: Move):
+        index = (key & self.mask) << 1
+        old = self.entries[index + 1]
+        if (old and self.entries[index] ^ old != key and
+                (old >> 42) == self.generation and ((old >> 32) & 0xFF) > depth):
+            return
+        data = (move | ((score + 32768) << 16) |
+                (min(max(depth, 0), 255) << 32) | (bound << 40) | (self.generation << 42))
+        self.entries[index + 1] = data
+        self.entries[index] = key ^ data
+
+# Mate scores are stored relative to the node so they stay valid at any ply
+def _score_to_table(score: int, ply: int) -> int:
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def _score_from_table(score: int, ply: int) -> int:
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+class SearchTimeout(Exception):
+    pass
+
+# Outcome of a search; score is in centipawns from the side to move
+class SearchResult(NamedTuple):
+    move: Optional[Move]
+    score: int
+    depth: int
+    nodes: int
+    elapsed: float
+    nps: int
+    pv: List[Move]
+    book: bool = False
+
+# Random numbers of the Polyglot book format: 768 for pieces (64 squares
+# for each of black pawn, white pawn, black knight, ... white king), 4 for
+# castling rights, 8 for en passant files and 1 for white to move
+POLYGLOT_RANDOM = (
+    0x9D39247E33776D41, 0x2AF7398005AAA5C7, 0x44DB015024623547, 0x9C15F73E62A76AE2,
+    0x75834465489C0C89, 0x3290AC3A203001BF, 0x0FBBAD1F61042279, 0xE83A908FF2FB60CA,
+    0x0D7E765D58755C10, 0x1A083822CEAFE02D, 0x9605D5F0E25EC3B0, 0xD021FF5CD13A2ED5,
+    0x40BDF15D4A672E32, 0x011355146FD56395, 0x5DB4832046F3D9E5, 0x239F8B2D7FF719CC,
+    0x05D1A1AE85B49AA1, 0x679F848F6E8FC971, 0x7449BBFF801FED0B, 0x7D11CDB1C3B7ADF0,
+    0x82C7709E781EB7CC, 0xF3218F1C9510786C, 0x331478F3AF51BBE6, 0x4BB38DE5E7219443,
+    0xAA649C6EBCFD50FC, 0x8DBD98A352AFD40B, 0x87D2074B81D79217, 0x19F3C751D3E92AE1,
+    0xB4AB30F062B19ABF, 0x7B0500AC42047AC4, 0xC9452CA81A09D85D, 0x24AA6C514DA27500,
+    0x4C9F34427501B447, 0x14A68FD73C910841, 0xA71B9B83461CBD93, 0x03488B95B0F1850F,
+    0x637B2B34FF93C040, 0x09D1BC9A3DD90A94, 0x3575668334A1DD3B, 0x735E2B97A4C45A23,
+    0x18727070F1BD400B, 0x1FCBACD259BF02E7, 0xD310A7C2CE9B6555, 0xBF983FE0FE5D8244,
+    0x9F74D14F7454A824, 0x51EBDC4AB9BA3035, 0x5C82C505DB9AB0FA, 0xFCF7FE8A3430B241,
+    0x3253A729B9BA3DDE, 0x8C74C368081B3075, 0xB9BC6C87167C33E7, 0x7EF48F2B83024E20,
+    0x11D505D4C351BD7F, 0x6568FCA92C76A243, 0x4DE0B0F40F32A7B8, 0x96D693460CC37E5D,
+    0x42E240CB63689F2F, 0x6D2BDCDAE2919661, 0x42880B0236E4D951, 0x5F0F4A5898171BB6,
+    0x39F890F579F92F88, 0x93C5B5F47356388B, 0x63DC359D8D231B78, 0xEC16CA8AEA98AD76,
+    0x5355F900C2A82DC7, 0x07FB9F855A997142, 0x5093417AA8A7ED5E, 0x7BCBC38DA25A7F3C,
+    0x19FC8A768CF4B6D4, 0x637A7780DECFC0D9, 0x8249A47AEE0E41F7, 0x79AD695501E7D1E8,
+    0x14ACBAF4777D5776, 0xF145B6BECCDEA195, 0xDABF2AC8201752FC, 0x24C3C94DF9C8D3F6,
+    0xBB6E2924F03912EA, 0x0CE26C0B95C980D9, 0xA49CD132BFBF7CC4, 0xE99D662AF4243939,
+    0x27E6AD7891165C3F, 0x8535F040B9744FF1, 0x54B3F4FA5F40D873, 0x72B12C32127FED2B,
+    0xEE954D3C7B411F47, 0x9A85AC909A24EAA1, 0x70AC4CD9F04F21F5, 0xF9B89D3E99A075C2,
+    0x87B3E2B2B5C907B1, 0xA366E5B8C54F48B8, 0xAE4A9346CC3F7CF2, 0x1920C04D47267BBD,
+    0x87BF02C6B49E2AE9, 0x092237AC237F3859, 0xFF07F64EF8ED14D0, 0x8DE8DCA9F03CC54E,
+    0x9C1633264DB49C89, 0xB3F22C3D0B0B38ED, 0x390E5FB44D01144B, 0x5BFEA5B4712768E9,
+    0x1E1032911FA78984, 0x9A74ACB964E78CB3, 0x4F80F7A035DAFB04, 0x6304D09A0B3738C4,
+    0x2171E64683023A08, 0x5B9B63EB9CEFF80C, 0x506AACF489889342, 0x1881AFC9A3A701D6,
+    0x6503080440750644, 0xDFD395339CDBF4A7, 0xEF927DBCF00C20F2, 0x7B32F7D1E03680EC,
+    0xB9FD7620E7316243, 0x05A7E8A57DB91B77, 0xB5889C6E15630A75, 0x4A750A09CE9573F7,
+    0xCF464CEC899A2F8A, 0xF538639CE705B824, 0x3C79A0FF5580EF7F, 0xEDE6C87F8477609D,
+    0x799E81F05BC93F31, 0x86536B8CF3428A8C, 0x97D7374C60087B73, 0xA246637CFF328532,
+    0x043FCAE60CC0EBA0, 0x920E449535DD359E, 0x70EB093B15B290CC, 0x73A1921916591CBD,
+    0x56436C9FE1A1AA8D, 0xEFAC4B70633B8F81, 0xBB215798D45DF7AF, 0x45F20042F24F1768,
+    0x930F80F4E8EB7462, 0xFF6712FFCFD75EA1, 0xAE623FD67468AA70, 0xDD2C5BC84BC8D8FC,
+    0x7EED120D54CF2DD9, 0x22FE545401165F1C, 0xC91800E98FB99929, 0x808BD68E6AC10365,
+    0xDEC468145B7605F6, 0x1BEDE3A3AEF53302, 0x43539603D6C55602, 0xAA969B5C691CCB7A,
+    0xA87832D392EFEE56, 0x65942C7B3C7E11AE, 0xDED2D633CAD004F6, 0x21F08570F420E565,
+    0xB415938D7DA94E3C, 0x91B859E59ECB6350, 0x10CFF333E0ED804A, 0x28AED140BE0BB7DD,
+    0xC5CC1D89724FA456, 0x5648F680F11A2741, 0x2D255069F0B7DAB3, 0x9BC5A38EF729ABD4,
+    0xEF2F054308F6A2BC, 0xAF2042F5CC5C2858, 0x480412BAB7F5BE2A, 0xAEF3AF4A563DFE43,
+    0x19AFE59AE451497F, 0x52593803DFF1E840, 0xF4F076E65F2CE6F0, 0x11379625747D5AF3,
+    0xBCE5D2248682C115, 0x9DA4243DE836994F, 0x066F70B33FE09017, 0x4DC4DE189B671A1C,
+    0x51039AB7712457C3, 0xC07A3F80C31FB4B4, 0xB46EE9C5E64A6E7C, 0xB3819A42ABE61C87,
+    0x21A007933A522A20, 0x2DF16F761598AA4F, 0x763C4A1371B368FD, 0xF793C46702E086A0,
+    0xD7288E012AEB8D31, 0xDE336A2A4BC1C44B, 0x0BF692B38D079F23, 0x2C604A7A177326B3,
+    0x4850E73E03EB6064, 0xCFC447F1E53C8E1B, 0xB05CA3F564268D99, 0x9AE182C8BC9474E8,
+    0xA4FC4BD4FC5558CA, 0xE755178D58FC4E76, 0x69B97DB1A4C03DFE, 0xF9B5B7C4ACC67C96,
+    0xFC6A82D64B8655FB, 0x9C684CB6C4D24417, 0x8EC97D2917456ED0, 0x6703DF9D2924E97E,
+    0xC547F57E42A7444E, 0x78E37644E7CAD29E, 0xFE9A44E9362F05FA, 0x08BD35CC38336615,
+    0x9315E5EB3A129ACE, 0x94061B871E04DF75, 0xDF1D9F9D784BA010, 0x3BBA57B68871B59D,
+    0xD2B7ADEEDED1F73F, 0xF7A255D83BC373F8, 0xD7F4F2448C0CEB81, 0xD95BE88CD210FFA7,
+    0x336F52F8FF4728E7, 0xA74049DAC312AC71, 0xA2F61BB6E437FDB5, 0x4F2A5CB07F6A35B3,
+    0x87D380BDA5BF7859, 0x16B9F7E06C453A21, 0x7BA2484C8A0FD54E, 0xF3A678CAD9A2E38C,
+    0x39B0BF7DDE437BA2, 0xFCAF55C1BF8A4424, 0x18FCF680573FA594, 0x4C0563B89F495AC3,
+    0x40E087931A00930D, 0x8CFFA9412EB642C1, 0x68CA39053261169F, 0x7A1EE967D27579E2,
+    0x9D1D60E5076F5B6F, 0x3810E399B6F65BA2, 0x32095B6D4AB5F9B1, 0x35CAB62109DD038A,
+    0xA90B24499FCFAFB1, 0x77A225A07CC2C6BD, 0x513E5E634C70E331, 0x4361C0CA3F692F12,
+    0xD941ACA44B20A45B, 0x528F7C8602C5807B, 0x52AB92BEB9613989, 0x9D1DFA2EFC557F73,
+    0x722FF175F572C348, 0x1D1260A51107FE97, 0x7A249A57EC0C9BA2, 0x04208FE9E8F7F2D6,
+    0x5A110C6058B920A0, 0x0CD9A497658A5698, 0x56FD23C8F9715A4C, 0x284C847B9D887AAE,
+    0x04FEABFBBDB619CB, 0x742E1E651C60BA83, 0x9A9632E65904AD3C, 0x881B82A13B51B9E2,
+    0x506E6744CD974924, 0xB0183DB56FFC6A79, 0x0ED9B915C66ED37E, 0x5E11E86D5873D484,
+    0xF678647E3519AC6E, 0x1B85D488D0F20CC5, 0xDAB9FE6525D89021, 0x0D151D86ADB73615,
+    0xA865A54EDCC0F019, 0x93C42566AEF98FFB, 0x99E7AFEABE000731, 0x48CBFF086DDF285A,
+    0x7F9B6AF1EBF78BAF, 0x58627E1A149BBA21, 0x2CD16E2ABD791E33, 0xD363EFF5F0977996,
+    0x0CE2A38C344A6EED, 0x1A804AADB9CFA741, 0x907F30421D78C5DE, 0x501F65EDB3034D07,
+    0x37624AE5A48FA6E9, 0x957BAF61700CFF4E, 0x3A6C27934E31188A, 0xD49503536ABCA345,
+    0x088E049589C432E0, 0xF943AEE7FEBF21B8, 0x6C3B8E3E336139D3, 0x364F6FFA464EE52E,
+    0xD60F6DCEDC314222, 0x56963B0DCA418FC0, 0x16F50EDF91E513AF, 0xEF1955914B609F93,
+    0x565601C0364E3228, 0xECB53939887E8175, 0xBAC7A9A18531294B, 0xB344C470397BBA52,
+    0x65D34954DAF3CEBD, 0xB4B81B3FA97511E2, 0xB422061193D6F6A7, 0x071582401C38434D,
+    0x7A13F18BBEDC4FF5, 0xBC4097B116C524D2, 0x59B97885E2F2EA28, 0x99170A5DC3115544,
+    0x6F423357E7C6A9F9, 0x325928EE6E6F8794, 0xD0E4366228B03343, 0x565C31F7DE89EA27,
+    0x30F5611484119414, 0xD873DB391292ED4F, 0x7BD94E1D8E17DEBC, 0xC7D9F16864A76E94,
+    0x947AE053EE56E63C, 0xC8C93882F9475F5F, 0x3A9BF55BA91F81CA, 0xD9A11FBB3D9808E4,
+    0x0FD22063EDC29FCA, 0xB3F256D8ACA0B0B9, 0xB03031A8B4516E84, 0x35DD37D5871448AF,
+    0xE9F6082B05542E4E, 0xEBFAFA33D7254B59, 0x9255ABB50D532280, 0xB9AB4CE57F2D34F3,
+    0x693501D628297551, 0xC62C58F97DD949BF, 0xCD454F8F19C5126A, 0xBBE83F4ECC2BDECB,
+    0xDC842B7E2819E230, 0xBA89142E007503B8, 0xA3BC941D0A5061CB, 0xE9F6760E32CD8021,
+    0x09C7E552BC76492F, 0x852F54934DA55CC9, 0x8107FCCF064FCF56, 0x098954D51FFF6580,
+    0x23B70EDB1955C4BF, 0xC330DE426430F69D, 0x4715ED43E8A45C0A, 0xA8D7E4DAB780A08D,
+    0x0572B974F03CE0BB, 0xB57D2E985E1419C7, 0xE8D9ECBE2CF3D73F, 0x2FE4B17170E59750,
+    0x11317BA87905E790, 0x7FBF21EC8A1F45EC, 0x1725CABFCB045B00, 0x964E915CD5E2B207,
+    0x3E2B8BCBF016D66D, 0xBE7444E39328A0AC, 0xF85B2B4FBCDE44B7, 0x49353FEA39BA63B1,
+    0x1DD01AAFCD53486A, 0x1FCA8A92FD719F85, 0xFC7C95D827357AFA, 0x18A6A990C8B35EBD,
+    0xCCCB7005C6B9C28D, 0x3BDBB92C43B17F26, 0xAA70B5B4F89695A2, 0xE94C39A54A98307F,
+    0xB7A0B174CFF6F36E, 0xD4DBA84729AF48AD, 0x2E18BC1AD9704A68, 0x2DE0966DAF2F8B1C,
+    0xB9C11D5B1E43A07E, 0x64972D68DEE33360, 0x94628D38D0C20584, 0xDBC0D2B6AB90A559,
+    0xD2733C4335C6A72F, 0x7E75D99D94A70F4D, 0x6CED1983376FA72B, 0x97FCAACBF030BC24,
+    0x7B77497B32503B12, 0x8547EDDFB81CCB94, 0x79999CDFF70902CB, 0xCFFE1939438E9B24,
+    0x829626E3892D95D7, 0x92FAE24291F2B3F1, 0x63E22C147B9C3403, 0xC678B6D860284A1C,
+    0x5873888850659AE7, 0x0981DCD296A8736D, 0x9F65789A6509A440, 0x9FF38FED72E9052F,
+    0xE479EE5B9930578C, 0xE7F28ECD2D49EECD, 0x56C074A581EA17FE, 0x5544F7D774B14AEF,
+    0x7B3F0195FC6F290F, 0x12153635B2C0CF57, 0x7F5126DBBA5E0CA7, 0x7A76956C3EAFB413,
+    0x3D5774A11D31AB39, 0x8A1B083821F40CB4, 0x7B4A38E32537DF62, 0x950113646D1D6E03,
+    0x4DA8979A0041E8A9, 0x3BC36E078F7515D7, 0x5D0A12F27AD310D1, 0x7F9D1A2E1EBE1327,
+    0xDA3A361B1C5157B1, 0xDCDD7D20903D0C25, 0x36833336D068F707, 0xCE68341F79893389,
+    0xAB9090168DD05F34, 0x43954B3252DC25E5, 0xB438C2B67F98E5E9, 0x10DCD78E3851A492,
+    0xDBC27AB5447822BF, 0x9B3CDB65F82CA382, 0xB67B7896167B4C84, 0xBFCED1B0048EAC50,
+    0xA9119B60369FFEBD, 0x1FFF7AC80904BF45, 0xAC12FB171817EEE7, 0xAF08DA9177DDA93D,
+    0x1B0CAB936E65C744, 0xB559EB1D04E5E932, 0xC37B45B3F8D6F2BA, 0xC3A9DC228CAAC9E9,
+    0xF3B8B6675A6507FF, 0x9FC477DE4ED681DA, 0x67378D8ECCEF96CB, 0x6DD856D94D259236,
+    0xA319CE15B0B4DB31, 0x073973751F12DD5E, 0x8A8E849EB32781A5, 0xE1925C71285279F5,
+    0x74C04BF1790C0EFE, 0x4DDA48153C94938A, 0x9D266D6A1CC0542C, 0x7440FB816508C4FE,
+    0x13328503DF48229F, 0xD6BF7BAEE43CAC40, 0x4838D65F6EF6748F, 0x1E152328F3318DEA,
+    0x8F8419A348F296BF, 0x72C8834A5957B511, 0xD7A023A73260B45C, 0x94EBC8ABCFB56DAE,
+    0x9FC10D0F989993E0, 0xDE68A2355B93CAE6, 0xA44CFE79AE538BBE, 0x9D1D84FCCE371425,
+    0x51D2B1AB2DDFB636, 0x2FD7E4B9E72CD38C, 0x65CA5B96B7552210, 0xDD69A0D8AB3B546D,
+    0x604D51B25FBF70E2, 0x73AA8A564FB7AC9E, 0x1A8C1E992B941148, 0xAAC40A2703D9BEA0,
+    0x764DBEAE7FA4F3A6, 0x1E99B96E70A9BE8B, 0x2C5E9DEB57EF4743, 0x3A938FEE32D29981,
+    0x26E6DB8FFDF5ADFE, 0x469356C504EC9F9D, 0xC8763C5B08D1908C, 0x3F6C6AF859D80055,
+    0x7F7CC39420A3A545, 0x9BFB227EBDF4C5CE, 0x89039D79D6FC5C5C, 0x8FE88B57305E2AB6,
+    0xA09E8C8C35AB96DE, 0xFA7E393983325753, 0xD6B6D0ECC617C699, 0xDFEA21EA9E7557E3,
+    0xB67C1FA481680AF8, 0xCA1E3785A9E724E5, 0x1CFC8BED0D681639, 0xD18D8549D140CAEA,
+    0x4ED0FE7E9DC91335, 0xE4DBF0634473F5D2, 0x1761F93A44D5AEFE, 0x53898E4C3910DA55,
+    0x734DE8181F6EC39A, 0x2680B122BAA28D97, 0x298AF231C85BAFAB, 0x7983EED3740847D5,
+    0x66C1A2A1A60CD889, 0x9E17E49642A3E4C1, 0xEDB454E7BADC0805, 0x50B704CAB602C329,
+    0x4CC317FB9CDDD023, 0x66B4835D9EAFEA22, 0x219B97E26FFC81BD, 0x261E4E4C0A333A9D,
+    0x1FE2CCA76517DB90, 0xD7504DFA8816EDBB, 0xB9571FA04DC089C8, 0x1DDC0325259B27DE,
+    0xCF3F4688801EB9AA, 0xF4F5D05C10CAB243, 0x38B6525C21A42B0E, 0x36F60E2BA4FA6800,
+    0xEB3593803173E0CE, 0x9C4CD6257C5A3603, 0xAF0C317D32ADAA8A, 0x258E5A80C7204C4B,
+    0x8B889D624D44885D, 0xF4D14597E660F855, 0xD4347F66EC8941C3, 0xE699ED85B0DFB40D,
+    0x2472F6207C2D0484, 0xC2A1E7B5B459AEB5, 0xAB4F6451CC1D45EC, 0x63767572AE3D6174,
+    0xA59E0BD101731A28, 0x116D0016CB948F09, 0x2CF9C8CA052F6E9F, 0x0B090A7560A968E3,
+    0xABEEDDB2DDE06FF1, 0x58EFC10B06A2068D, 0xC6E57A78FBD986E0, 0x2EAB8CA63CE802D7,
+    0x14A195640116F336, 0x7C0828DD624EC390, 0xD74BBE77E6116AC7, 0x804456AF10F5FB53,
+    0xEBE9EA2ADF4321C7, 0x03219A39EE587A30, 0x49787FEF17AF9924, 0xA1E9300CD8520548,
+    0x5B45E522E4B1B4EF, 0xB49C3B3995091A36, 0xD4490AD526F14431, 0x12A8F216AF9418C2,
+    0x001F837CC7350524, 0x1877B51E57A764D5, 0xA2853B80F17F58EE, 0x993E1DE72D36D310,
+    0xB3598080CE64A656, 0x252F59CF0D9F04BB, 0xD23C8E176D113600, 0x1BDA0492E7E4586E,
+    0x21E0BD5026C619BF, 0x3B097ADAF088F94E, 0x8D14DEDB30BE846E, 0xF95CFFA23AF5F6F4,
+    0x3871700761B3F743, 0xCA672B91E9E4FA16, 0x64C8E531BFF53B55, 0x241260ED4AD1E87D,
+    0x106C09B972D2E822, 0x7FBA195410E5CA30, 0x7884D9BC6CB569D8, 0x0647DFEDCD894A29,
+    0x63573FF03E224774, 0x4FC8E9560F91B123, 0x1DB956E450275779, 0xB8D91274B9E9D4FB,
+    0xA2EBEE47E2FBFCE1, 0xD9F1F30CCD97FB09, 0xEFED53D75FD64E6B, 0x2E6D02C36017F67F,
+    0xA9AA4D20DB084E9B, 0xB64BE8D8B25396C1, 0x70CB6AF7C2D5BCF0, 0x98F076A4F7A2322E,
+    0xBF84470805E69B5F, 0x94C3251F06F90CF3, 0x3E003E616A6591E9, 0xB925A6CD0421AFF3,
+    0x61BDD1307C66E300, 0xBF8D5108E27E0D48, 0x240AB57A8B888B20, 0xFC87614BAF287E07,
+    0xEF02CDD06FFDB432, 0xA1082C0466DF6C0A, 0x8215E577001332C8, 0xD39BB9C3A48DB6CF,
+    0x2738259634305C14, 0x61CF4F94C97DF93D, 0x1B6BACA2AE4E125B, 0x758F450C88572E0B,
+    0x959F587D507A8359, 0xB063E962E045F54D, 0x60E8ED72C0DFF5D1, 0x7B64978555326F9F,
+    0xFD080D236DA814BA, 0x8C90FD9B083F4558, 0x106F72FE81E2C590, 0x7976033A39F7D952,
+    0xA4EC0132764CA04B, 0x733EA705FAE4FA77, 0xB4D8F77BC3E56167, 0x9E21F4F903B33FD9,
+    0x9D765E419FB69F6D, 0xD30C088BA61EA5EF, 0x5D94337FBFAF7F5B, 0x1A4E4822EB4D7A59,
+    0x6FFE73E81B637FB3, 0xDDF957BC36D8B9CA, 0x64D0E29EEA8838B3, 0x08DD9BDFD96B9F63,
+    0x087E79E5A57D1D13, 0xE328E230E3E2B3FB, 0x1C2559E30F0946BE, 0x720BF5F26F4D2EAA,
+    0xB0774D261CC609DB, 0x443F64EC5A371195, 0x4112CF68649A260E, 0xD813F2FAB7F5C5CA,
+    0x660D3257380841EE, 0x59AC2C7873F910A3, 0xE846963877671A17, 0x93B633ABFA3469F8,
+    0xC0C0F5A60EF4CDCF, 0xCAF21ECD4377B28C, 0x57277707199B8175, 0x506C11B9D90E8B1D,
+    0xD83CC2687A19255F, 0x4A29C6465A314CD1, 0xED2DF21216235097, 0xB5635C95FF7296E2,
+    0x22AF003AB672E811, 0x52E762596BF68235, 0x9AEBA33AC6ECC6B0, 0x944F6DE09134DFB6,
+    0x6C47BEC883A7DE39, 0x6AD047C430A12104, 0xA5B1CFDBA0AB4067, 0x7C45D833AFF07862,
+    0x5092EF950A16DA0B, 0x9338E69C052B8E7B, 0x455A4B4CFE30E3F5, 0x6B02E63195AD0CF8,
+    0x6B17B224BAD6BF27, 0xD1E0CCD25BB9C169, 0xDE0C89A556B9AE70, 0x50065E535A213CF6,
+    0x9C1169FA2777B874, 0x78EDEFD694AF1EED, 0x6DC93D9526A50E68, 0xEE97F453F06791ED,
+    0x32AB0EDB696703D3, 0x3A6853C7E70757A7, 0x31865CED6120F37D, 0x67FEF95D92607890,
+    0x1F2B1D1F15F6DC9C, 0xB69E38A8965C6B65, 0xAA9119FF184CCCF4, 0xF43C732873F24C13,
+    0xFB4A3D794A9A80D2, 0x3550C2321FD6109C, 0x371F77E76BB8417E, 0x6BFA9AAE5EC05779,
+    0xCD04F3FF001A4778, 0xE3273522064480CA, 0x9F91508BFFCFC14A, 0x049A7F41061A9E60,
+    0xFCB6BE43A9F2FE9B, 0x08DE8A1C7797DA9B, 0x8F9887E6078735A1, 0xB5B4071DBFC73A66,
+    0x230E343DFBA08D33, 0x43ED7F5A0FAE657D, 0x3A88A0FBBCB05C63, 0x21874B8B4D2DBC4F,
+    0x1BDEA12E35F6A8C9, 0x53C065C6C8E63528, 0xE34A1D250E7A8D6B, 0xD6B04D3B7651DD7E,
+    0x5E90277E7CB39E2D, 0x2C046F22062DC67D, 0xB10BB459132D0A26, 0x3FA9DDFB67E2F199,
+    0x0E09B88E1914F7AF, 0x10E8B35AF3EEAB37, 0x9EEDECA8E272B933, 0xD4C718BC4AE8AE5F,
+    0x81536D601170FC20, 0x91B534F885818A06, 0xEC8177F83F900978, 0x190E714FADA5156E,
+    0xB592BF39B0364963, 0x89C350C893AE7DC1, 0xAC042E70F8B383F2, 0xB49B52E587A1EE60,
+    0xFB152FE3FF26DA89, 0x3E666E6F69AE2C15, 0x3B544EBE544C19F9, 0xE805A1E290CF2456,
+    0x24B33C9D7ED25117, 0xE74733427B72F0C1, 0x0A804D18B7097475, 0x57E3306D881EDB4F,
+    0x4AE7D6A36EB5DBCB, 0x2D8D5432157064C8, 0xD1E649DE1E7F268B, 0x8A328A1CEDFE552C,
+    0x07A3AEC79624C7DA, 0x84547DDC3E203C94, 0x990A98FD5071D263, 0x1A4FF12616EEFC89,
+    0xF6F7FD1431714200, 0x30C05B1BA332F41C, 0x8D2636B81555A786, 0x46C9FEB55D120902,
+    0xCCEC0A73B49C9921, 0x4E9D2827355FC492, 0x19EBB029435DCB0F, 0x4659D2B743848A2C,
+    0x963EF2C96B33BE31, 0x74F85198B05A2E7D, 0x5A0F544DD2B1FB18, 0x03727073C2E134B1,
+    0xC7F6AA2DE59AEA61, 0x352787BAA0D7C22F, 0x9853EAB63B5E0B35, 0xABBDCDD7ED5C0860,
+    0xCF05DAF5AC8D77B0, 0x49CAD48CEBF4A71E, 0x7A4C10EC2158C4A6, 0xD9E92AA246BF719E,
+    0x13AE978D09FE5557, 0x730499AF921549FF, 0x4E4B705B92903BA4, 0xFF577222C14F0A3A,
+    0x55B6344CF97AAFAE, 0xB862225B055B6960, 0xCAC09AFBDDD2CDB4, 0xDAF8E9829FE96B5F,
+    0xB5FDFC5D3132C498, 0x310CB380DB6F7503, 0xE87FBB46217A360E, 0x2102AE466EBB1148,
+    0xF8549E1A3AA5E00D, 0x07A69AFDCC42261A, 0xC4C118BFE78FEAAE, 0xF9F4892ED96BD438,
+    0x1AF3DBE25D8F45DA, 0xF5B4B0B0D2DEEEB4, 0x962ACEEFA82E1C84, 0x046E3ECAAF453CE9,
+    0xF05D129681949A4C, 0x964781CE734B3C84, 0x9C2ED44081CE5FBD, 0x522E23F3925E319E,
+    0x177E00F9FC32F791, 0x2BC60A63A6F3B3F2, 0x222BBFAE61725606, 0x486289DDCC3D6780,
+    0x7DC7785B8EFDFC80, 0x8AF38731C02BA980, 0x1FAB64EA29A2DDF7, 0xE4D9429322CD065A,
+    0x9DA058C67844F20C, 0x24C0E332B70019B0, 0x233003B5A6CFE6AD, 0xD586BD01C5C217F6,
+    0x5E5637885F29BC2B, 0x7EBA726D8C94094B, 0x0A56A5F0BFE39272, 0xD79476A84EE20D06,
+    0x9E4C1269BAA4BF37, 0x17EFEE45B0DEE640, 0x1D95B0A5FCF90BC6, 0x93CBE0B699C2585D,
+    0x65FA4F227A2B6D79, 0xD5F9E858292504D5, 0xC2B5A03F71471A6F, 0x59300222B4561E00,
+    0xCE2F8642CA0712DC, 0x7CA9723FBB2E8988, 0x2785338347F2BA08, 0xC61BB3A141E50E8C,
+    0x150F361DAB9DEC26, 0x9F6A419D382595F4, 0x64A53DC924FE7AC9, 0x142DE49FFF7A7C3D,
+    0x0C335248857FA9E7, 0x0A9C32D5EAE45305, 0xE6C42178C4BBB92E, 0x71F1CE2490D20B07,
+    0xF1BCC3D275AFE51A, 0xE728E8C83C334074, 0x96FBF83A12884624, 0x81A1549FD6573DA5,
+    0x5FA7867CAF35E149, 0x56986E2EF3ED091B, 0x917F1DD5F8886C61, 0xD20D8C88C8FFE65F,
+    0x31D71DCE64B2C310, 0xF165B587DF898190, 0xA57E6339DD2CF3A0, 0x1EF6E6DBB1961EC9,
+    0x70CC73D90BC26E24, 0xE21A6B35DF0C3AD7, 0x003A93D8B2806962, 0x1C99DED33CB890A1,
+    0xCF3145DE0ADD4289, 0xD0E4427A5514FB72, 0x77C621CC9FB3A483, 0x67A34DAC4356550B,
+    0xF8D626AAAF278509,
+)
+
+# Polyglot kind index of each piece code
+POLYGLOT_KINDS = {make_piece(piece_type, color): 2 * index + (color == Color.WHITE)
+                  for index, piece_type in enumerate((PieceType.PAWN, PieceType.KNIGHT, PieceType.BISHOP,
+                                                      PieceType.ROOK, PieceType.QUEEN, PieceType.KING))
+                  for color in (Color.WHITE, Color.BLACK)}
+POLYGLOT_PROMOTIONS = (0, PieceType.KNIGHT.value, PieceType.BISHOP.value,
+                       PieceType.ROOK.value, PieceType.QUEEN.value)
+POLYGLOT_ENTRY = struct.Struct('>QHHI')
+
+def polyglot_key(board: 'ChessBoard') -> int:
+    # Polyglot hash of a position; unrelated to the board's own Zobrist key
+    key = 0
+    for sq, code in enumerate(board.board):
+        if code:
+            key ^= POLYGLOT_RANDOM[64 * POLYGLOT_KINDS[code] + 8 * (7 - (sq >> 3)) + (sq & 7)]
+    for bit, index in ((WHITE_KINGSIDE, 768), (WHITE_QUEENSIDE, 769),
+                       (BLACK_KINGSIDE, 770), (BLACK_QUEENSIDE, 771)):
+        if board.castling_rights & bit:
+            key ^= POLYGLOT_RANDOM[index]
+    ep_file = board._en_passant_file()
+    if ep_file is not None:
+        key ^= POLYGLOT_RANDOM[772 + ep_file]
+    if board.current_turn == Color.WHITE:
+        key ^= POLYGLOT_RANDOM[780]
+    return key
+
+# Read-only Polyglot opening book. The file is memory-mapped and entries,
+# which are sorted by key, are found by binary search, so opening even a
+# very large book reads only the pages a lookup touches.
+class OpeningBook:
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.size = size // POLYGLOT_ENTRY.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def _key_at(self, index: int) -> int:
+        return struct.unpack_from('>Q', self._map, index * POLYGLOT_ENTRY.size)[0]
+
+    def entries(self, board: 'ChessBoard') -> List[Tuple[Move, int]]:
+        # Legal (move, weight) pairs stored for this position
+        key = polyglot_key(board)
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) >> 1
+            if self._key_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        found = []
+        while low < self.size:
+            entry_key, raw, weight, _ = POLYGLOT_ENTRY.unpack_from(self._map, low * POLYGLOT_ENTRY.size)
+            if entry_key != key:
+                break
+            move = self._decode(board, raw)
+            if move is not None:
+                found.append((move, weight))
+            low += 1
+        return found
+
+    @staticmethod
+    def _decode(board: 'ChessBoard', raw: int) -> Optional[Move]:
+        # Polyglot counts ranks from white's side and writes castling as the
+        # king taking its own rook
+        to_sq = 8 * (7 - ((raw >> 3) & 7)) + (raw & 7)
+        from_sq = 8 * (7 - ((raw >> 9) & 7)) + ((raw >> 6) & 7)
+        promotion = (raw >> 12) & 7
+        if promotion >= len(POLYGLOT_PROMOTIONS):
+            return None
+        if board.board[from_sq] & 7 == PieceType.KING.value and (from_sq & 7) == 4:
+            if to_sq == from_sq + 3:
+                to_sq = from_sq + 2
+            elif to_sq == from_sq - 4:
+                to_sq = from_sq - 2
+        return board.find_move(from_sq, to_sq, POLYGLOT_PROMOTIONS[promotion])
+
+    def choose(self, board: 'ChessBoard', weighted: bool = True,
+               rng: Optional[random.Random] = None) -> Optional[Move]:
+        # A book move for the position: weighted random by default, otherwise
+        # the highest weighted one
+        found = self.entries(board)
+        if not found:
+            return None
+        if not weighted:
+            return max(found, key=lambda entry: entry[1])[0]
+        total = sum(weight for _, weight in found)
+        if total == 0:
+            return (rng or random).choice(found)[0]
+        pick = (rng or random).randrange(total)
+        for move, weight in found:
+            pick -= weight
+            if pick < 0:
+                return move
+        return found[-1][0]
+
+# Endgame tablebases. A table covers one material set, named by the white
+# pieces then the black ones ("KQK", "KRKP"), and holds one byte per
+# position index: 0 is a draw, 1-127 means the side to move mates in that
+# many moves, 128 + n means the side to move is mated in n moves and 255
+# marks an index that is not a legal position. Tables assume no castling
+# rights and no en passant capture.
+TABLEBASE_ILLEGAL = 255
+TABLEBASE_ORDER = (PieceType.QUEEN, PieceType.ROOK, PieceType.BISHOP, PieceType.KNIGHT, PieceType.PAWN)
+TABLEBASE_LETTERS = {piece_type: letter.upper() for letter, piece_type in FEN_PIECE_TYPES.items()}
+
+def _flip_diagonal(sq: int) -> int:
+    return ((sq & 7) << 3) | (sq >> 3)
+
+# The eight board symmetries as square maps. Without pawns the white king is
+# moved into the a1-d1-d4 triangle; with pawns only the file mirror applies
+# and the white king is kept on files a-d.
+TABLEBASE_SYMMETRIES = [[(_flip_diagonal(sq) if transpose else sq) ^ flip
+                         for sq in range(64)]
+                        for transpose in (False, True) for flip in (0, 7, 56, 63)]
+KING_TRIANGLE = [sq for sq in range(64) if (7 - (sq >> 3)) <= (sq & 7) <= 3]
+KING_HALF = [sq for sq in range(64) if (sq & 7) <= 3]
+PAWNLESS_TRANSFORMS = [next(t for t, table in enumerate(TABLEBASE_SYMMETRIES) if table[sq] in KING_TRIANGLE)
+                       for sq in range(64)]
+PAWN_TRANSFORMS = [0 if (sq & 7) <= 3 else 1 for sq in range(64)]
+
+def _material_order(piece: int) -> int:
+    # Sort key putting pieces in table order: white king, black king, then the
+    # other white pieces and the other black pieces, strongest first
+    if piece & 7 == PieceType.KING.value:
+        return piece >> 3
+    return 2 + 8 * (piece >> 3) + TABLEBASE_ORDER.index(PieceType(piece & 7))
+
+def material_name(pieces: List[int]) -> str:
+    # Name of the material set held by a list of piece codes
+    sides = ['', '']
+    for piece in sorted(pieces, key=_material_order):
+        sides[piece >> 3] += TABLEBASE_LETTERS[PieceType(piece & 7)]
+    return sides[0] + sides[1]
+
+def _parse_material(name: str) -> List[int]:
+    name = name.upper()
+    second = name.find('K', 1)
+    if not name.startswith('K') or second < 0 or 'K' in name[second + 1:]:
+        raise ValueError(f"Invalid material: {name}")
+    letters = {letter: piece_type for piece_type, letter in TABLEBASE_LETTERS.items()}
+    try:
+        return sorted([make_piece(letters[ch], Color.WHITE) for ch in name[:second]] +
+                      [make_piece(letters[ch], Color.BLACK) for ch in name[second:]], key=_material_order)
+    except KeyError:
+        raise ValueError(f"Invalid material: {name}")
+
+def _side_strength(pieces: List[int]) -> Tuple[int, List[int]]:
+    values = sorted((PIECE_VALUES[piece & 7] for piece in pieces), reverse=True)
+    return sum(values), values
+
+def canonical_material(name: str) -> str:
+    # Tables are stored with the stronger side as white
+    pieces = _parse_material(name)
+    white = [piece for piece in pieces if not piece & BLACK_PIECE]
+    black = [piece & 7 for piece in pieces if piece & BLACK_PIECE]
+    if _side_strength(black) > _side_strength(white):
+        pieces = [piece ^ BLACK_PIECE for piece in pieces]
+    return material_name(pieces)
+
+def tablebase_score(value: int) -> Optional[int]:
+    # Search score of a table byte from the side to move, as if found at the root
+    if value == TABLEBASE_ILLEGAL:
+        return None
+    if value == 0:
+        return 0
+    if value < 128:
+        return MATE_SCORE - (2 * value - 1)
+    return -MATE_SCORE + 2 * (value - 128)
+
+def tablebase_value(score: int) -> int:
+    # Table byte for a search score produced by tablebase_score
+    if score == 0:
+        return 0
+    if score > 0:
+        value = (MATE_SCORE - score + 1) // 2
+        if value > 127:
+            raise ValueError("Distance to mate does not fit the table format")
+        return value
+    value = (MATE_SCORE + score) // 2
+    if value > 126:
+        raise ValueError("Distance to mate does not fit the table format")
+    return 128 + value
+
+# Index layout of one material set: side to move, the white king's slot
+# within its symmetry region, then every other piece's square
+class TablebaseLayout:
+    def __init__(self, name: str):
+        self.pieces = _parse_material(name)
+        self.name = material_name(self.pieces)
+        self.has_pawns = any(piece & 7 == PieceType.PAWN.value for piece in self.pieces)
+        self.king_squares = KING_HALF if self.has_pawns else KING_TRIANGLE
+        self.transforms = PAWN_TRANSFORMS if self.has_pawns else PAWNLESS_TRANSFORMS
+        self.king_slots = [-1] * 64
+        for slot, sq in enumerate(self.king_squares):
+            self.king_slots[sq] = slot
+        self.per_side = len(self.king_squares) * 64 ** (len(self.pieces) - 1)
+        self.size = 2 * self.per_side
+
+    def index(self, squares: List[int], side: int) -> int:
+        # Index of a position whose squares are listed in table piece order
+        table = TABLEBASE_SYMMETRIES[self.transforms[squares[0]]]
+        index = self.king_slots[table[squares[0]]]
+        for sq in squares[1:]:
+            index = index * 64 + table[sq]
+        return side * self.per_side + index
+
+    def squares(self, index: int) -> Tuple[List[int], int]:
+        # Squares in table piece order and side to move of an index
+        side, index = divmod(index, self.per_side)
+        squares = []
+        for _ in range(len(self.pieces) - 1):
+            index, sq = divmod(index, 64)
+            squares.append(sq)
+        squares.append(self.king_squares[index])
+        squares.reverse()
+        return squares, side
+
+    def dependencies(self) -> List[str]:
+        # Smaller material sets reachable by one capture or promotion
+        found = []
+        for i, piece in enumerate(self.pieces):
+            if piece & 7 == PieceType.KING.value:
+                continue
+            rest = self.pieces[:i] + self.pieces[i + 1:]
+            if len(rest) > 2:
+                found.append(canonical_material(material_name(rest)))
+            if piece & 7 == PieceType.PAWN.value:
+                for promoted in TABLEBASE_ORDER[:-1]:
+                    found.append(canonical_material(material_name(
+                        rest + [make_piece(promoted, piece_color_of(piece))])))
+        return sorted(set(found))
+
+# Collection of table files in one directory, each memory-mapped the first
+# time a position with its material is probed
+class Tablebases:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._tables = {}
+        self.max_pieces = 0
+        if os.path.isdir(directory):
+            for filename in os.listdir(directory):
+                if filename.endswith('.tbl'):
+                    self.max_pieces = max(self.max_pieces, len(filename) - 4)
+
+    def __reduce__(self):
+        # Worker processes reopen the files instead of copying the maps
+        return (self.__class__, (self.directory,))
+
+    def close(self):
+        for table in self._tables.values():
+            if table is not None:
+                table[1].close()
+        self._tables = {}
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name + '.tbl')
+
+    def _table(self, name: str):
+        if name not in self._tables:
+            table = None
+            path = self.path(name)
+            if os.path.exists(path):
+                layout = TablebaseLayout(name)
+                with open(path, 'rb') as handle:
+                    data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+                if len(data) != layout.size:
+                    data.close()
+                    raise ValueError(f"Tablebase file {path} has the wrong size")
+                table = (layout, data)
+            self._tables[name] = table
+        return self._tables[name]
+
+    def probe_pieces(self, placed: List[Tuple[int, int]], side: int) -> Optional[int]:
+        # Score of (piece, square) pairs with color index `side` to move, or
+        # None when no table covers them
+        if len(placed) == 2:
+            return 0
+        name = material_name([piece for piece, _ in placed])
+        canonical = canonical_material(name)
+        if canonical != name:
+            placed = [(piece ^ BLACK_PIECE, sq ^ 56) for piece, sq in placed]
+            side ^= 1
+        table = self._table(canonical)
+        if table is None:
+            return None
+        layout, data = table
+        placed = sorted(placed, key=lambda entry: _material_order(entry[0]))
+        return tablebase_score(data[layout.index([sq for _, sq in placed], side)])
+
+    def probe(self, board: ChessBoard) -> Optional[int]:
+        # Score of a board position from the side to move, or None
+        if bin(board.occupied).count('1') > self.max_pieces:
+            return None
+        if board.castling_rights or board._en_passant_file() is not None:
+            return None
+        return self.probe_pieces([(board.board[sq], sq) for sq in iter_bits(board.occupied)],
+                                 COLOR_INDEX[board.current_turn])
+
+# Worker for tablebase generation: for a range of indices, the number of
+# moves from each position (-1 if illegal, 0 if the game is over) followed by
+# its successors. A successor in the same table is its index; one that
+# changes material is looked up at once and stored as size + score + MATE_SCORE.
+def _tablebase_successors(task: Tuple[str, str, int, int]) -> Tuple[array, array, array]:
+    name, directory, first, last = task
+    layout = TablebaseLayout(name)
+    tables = Tablebases(directory)
+    board = ChessBoard()
+    for sq in range(64):
+        board._remove_piece(sq)
+    board.castling_rights = 0
+    board.en_passant_target = None
+    pieces = layout.pieces
+    pawn_ranks = [sq for sq in range(64) if sq < 8 or sq >= 56]
+    counts = array('i')
+    terminal = array('i')
+    successors = array('i')
+    placed = []
+    for index in range(first, last):
+        squares, side = layout.squares(index)
+        if (len(set(squares)) != len(squares) or
+                KING_ATTACKS[squares[0]] >> squares[1] & 1 or
+                any(piece & 7 == PieceType.PAWN.value and squares[i] in pawn_ranks
+                    for i, piece in enumerate(pieces))):
+            counts.append(-1)
+            terminal.append(0)
+            continue
+        for sq in placed:
+            board._remove_piece(sq)
+        for piece, sq in zip(pieces, squares):
+            board._place_piece(sq, piece)
+        placed = squares
+        board.current_turn = Color.WHITE if side == 0 else Color.BLACK
+        board._legal_cache = None
+        board._status = None
+        if board.attackers_to(squares[side ^ 1], side):
+            counts.append(-1)
+            terminal.append(0)
+            continue
+        moves = board.generate_legal_moves()
+        if not moves:
+            counts.append(0)
+            terminal.append(-MATE_SCORE if board.attackers_to(squares[side], side ^ 1) else 0)
+            continue
+        counts.append(len(moves))
+        terminal.append(0)
+        for move in moves:
+            from_sq, to_sq = move_from(move), move_to(move)
+            child = list(squares)
+            mover = child.index(from_sq)
+            if not move_flags(move) & (CAPTURE | PROMOTION):
+                child[mover] = to_sq
+                successors.append(layout.index(child, side ^ 1))
+                continue
+            after = [(piece, sq) for piece, sq in zip(pieces, squares) if sq != to_sq]
+            promoted = move_promotion(move)
+            after = [(make_piece(PieceType(promoted), board.current_turn) if promoted and sq == from_sq
+                      else piece, to_sq if sq == from_sq else sq) for piece, sq in after]
+            successors.append(layout.size + tables.probe_pieces(after, side ^ 1) + MATE_SCORE)
+    tables.close()
+    return counts, terminal, successors
+
+def generate_tablebase(name: str, directory: str, processes: int = 1, chunk_size: int = 4096,
+                       verbose: bool = True) -> str:
+    # Build the table for a material set by retrograde analysis, first building
+    # any smaller sets it converts into, and return the file written. Scores
+    # settle one ply deeper per pass until a pass changes nothing.
+    name = canonical_material(name)
+    layout = TablebaseLayout(name)
+    os.makedirs(directory, exist_ok=True)
+    path = Tablebases(directory).path(name)
+    if os.path.exists(path):
+        return path
+    for dependency in layout.dependencies():
+        generate_tablebase(dependency, directory, processes, chunk_size, verbose)
+
+    start = time.perf_counter()
+    tasks = [(name, directory, first, min(first + chunk_size, layout.size))
+             for first in range(0, layout.size, chunk_size)]
+    if processes > 1:
+        with Pool(processes) as pool:
+            results = pool.map(_tablebase_successors, tasks)
+    else:
+        results = [_tablebase_successors(task) for task in tasks]
+    counts = np.concatenate([np.frombuffer(result[0], dtype=np.int32) for result in results])
+    terminal = np.concatenate([np.frombuffer(result[1], dtype=np.int32) for result in results])
+    successors = np.concatenate([np.frombuffer(result[2], dtype=np.int32) for result in results])
+    del results
+
+    # Scores of the positions followed by a constant slot for every score a
+    # conversion into another table can have
+    scores = np.concatenate([terminal, np.arange(-MATE_SCORE, MATE_SCORE + 1, dtype=np.int32)])
+    movers = np.flatnonzero(counts > 0)
+    offsets = np.concatenate([[0], np.cumsum(counts[movers])[:-1]])
+    passes = 0
+    while True:
+        passes += 1
+        child = -scores[successors]
+        child -= np.sign(child)
+        if not len(movers):
+            break
+        best = np.maximum.reduceat(child, offsets)
+        if np.array_equal(scores[movers], best):
+            break
+        scores[movers] = best
+
+    values = np.zeros(layout.size, dtype=np.uint8)
+    values[counts < 0] = TABLEBASE_ILLEGAL
+    decided = (counts >= 0) & (scores[:layout.size] != 0)
+    values[decided] = [tablebase_value(int(score)) for score in scores[:layout.size][decided]]
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as handle:
+        handle.write(values.tobytes())
+    os.replace(temporary, path)
+
+    if verbose:
+        legal = int(np.count_nonzero(counts >= 0))
+        wins = int(np.count_nonzero((values > 0) & (values < 128)))
+        losses = int(np.count_nonzero((values >= 128) & (values < TABLEBASE_ILLEGAL)))
+        longest = int(values[values < 128].max()) if wins else 0
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {legal} positions, {wins} wins, {losses} losses, "
+              f"longest mate in {longest}, {passes} passes, {elapsed:.1f}s")
+    return path
+
+# Negamax alpha-beta searcher over ChessBoard using push/pop. Each ply
+# generates its moves into a shared buffer after its parent's moves, with
+# ordering keys kept in a parallel array, so no per-node lists are built.
+class ChessEngine:
+    def __init__(self, tt_size_mb: int = 16, tt_buffer=None, book: Optional[OpeningBook] = None,
+                 tablebases: Optional[Tablebases] = None):
+        self.tt = TranspositionTable(tt_size_mb, tt_buffer)
+        self.book = book
+        self.tablebases = tablebases
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self.history = [[0] * 4096 for _ in range(2)]
+        self.move_buffer = new_move_buffer(MAX_PLY + 2)
+        self.move_keys = array('q', bytes(8 * len(self.move_buffer)))
+        self.nodes = 0
+        self._deadline = None
+        self._soft_deadline = None
+        self._node_limit = None
+        self._root_move = 0
+        # Set from another thread or process to end the search early
+        self.stop_event = None
+
+    def evaluate(self, board: ChessBoard) -> int:
+        # Leaf score from the side to move, kept incrementally by the board
+        return board.evaluate()
+
+    def book_result(self, board: ChessBoard) -> Optional[SearchResult]:
+        # Answer straight from the opening book when it knows the position
+        if self.book is None:
+            return None
+        move = self.book.choose(board)
+        if move is None:
+            return None
+        return SearchResult(move, 0, 0, 0, 0.0, 0, [move], book=True)
+
+    def search(self, board: ChessBoard, time_limit: Optional[float] = None,
+               node_limit: Optional[int] = None, max_depth: int = MAX_PLY,
+               on_iteration: Optional[Callable[[SearchResult], None]] = None,
+               start_depth: int = 1) -> SearchResult:
+        # Iterative deepening until the time or node budget runs out; the board
+        # is left exactly as it was given
+        book = self.book_result(board)
+        if book is not None:
+            return book
+        start = time.perf_counter()
+        self.set_time_limit(time_limit)
+        self._node_limit = node_limit
+        self.nodes = 0
+        self.tt.new_search()
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        for table in self.history:
+            for i in range(4096):
+                table[i] >>= 1
+
+        root_moves = board.generate_legal_moves()
+        root_height = len(board.undo_stack)
+        best = SearchResult(root_moves[0] if root_moves else None, 0, 0, 0, 0.0, 0, [])
+        if len(root_moves) <= 1:
+            return best
+
+        for depth in range(min(start_depth, max_depth), max_depth + 1):
+            self._root_move = 0
+            try:
+                score = self._negamax(board, depth, -INFINITY, INFINITY, 0, 0)
+            except SearchTimeout:
+                while len(board.undo_stack) > root_height:
+                    board.pop()
+                if self._root_move:
+                    best = best._replace(move=self._root_move)
+                break
+            elapsed = time.perf_counter() - start
+            best = SearchResult(self._root_move, score, depth, self.nodes, elapsed,
+                                int(self.nodes / elapsed) if elapsed > 0 else 0,
+                                self._principal_variation(board, depth))
+            if on_iteration is not None:
+                on_iteration(best)
+            if abs(score) > MATE_BOUND:
+                break
+            if self._soft_deadline is not None and time.perf_counter() > self._soft_deadline:
+                break
+            if self._node_limit is not None and self.nodes >= self._node_limit:
+                break
+
+        elapsed = time.perf_counter() - start
+        return best._replace(nodes=self.nodes, elapsed=elapsed,
+                             nps=int(self.nodes / elapsed) if elapsed > 0 else 0)
+
+    def set_time_limit(self, time_limit: Optional[float]):
+        # Budget the search from now on; may be called from another thread to
+        # give a running unlimited search (such as a ponder search) a deadline.
+        # No new iteration starts after half the budget has gone.
+        now = time.perf_counter()
+        self._deadline = now + time_limit if time_limit is not None else None
+        self._soft_deadline = now + time_limit / 2 if time_limit is not None else None
+
+    def stop(self):
+        # Ask a running search to return its best move so far
+        if self.stop_event is not None:
+            self.stop_event.set()
+
+    def _check_budget(self):
+        if self._node_limit is not None and self.nodes >= self._node_limit:
+            raise SearchTimeout()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchTimeout()
+
+    def _principal_variation(self, board: ChessBoard, depth: int) -> List[Move]:
+        # Follow best moves stored in the table from the current position
+        pv = []
+        seen = set()
+        while len(pv) < depth and board.zobrist_key not in seen:
+            seen.add(board.zobrist_key)
+            entry = self.tt.probe(board.zobrist_key)
+            if entry is None or entry[0] not in board.generate_legal_moves():
+                break
+            pv.append(entry[0])
+            board.push(entry[0])
+        for _ in pv:
+            board.pop()
+        return pv
+
+    def _score_moves(self, board: ChessBoard, start: int, end: int, tt_move: Move, ply: int):
+        # Fill move_keys with (order score << 16 | move): table move first, then
+        # captures and promotions by MVV-LVA, killers, then history
+        moves = self.move_buffer
+        keys = self.move_keys
+        grid = board.board
+        killer_a, killer_b = self.killers[ply]
+        history = self.history[COLOR_INDEX[board.current_turn]]
+        for i in range(start, end):
+            move = moves[i]
+            flags = move >> 12
+            if move == tt_move:
+                score = 1 << 30
+            elif flags & (CAPTURE | PROMOTION):
+                to_sq = (move >> 6) & 63
+                from_sq = move & 63
+                victim = grid[to_sq] & 7
+                value = PIECE_VALUES[victim] if victim else PIECE_VALUES[1]
+                if flags & PROMOTION:
+                    value += PIECE_VALUES[PROMOTION_PIECES[flags & 3]]
+                score = (1 << 24) + value * 8 - (grid[from_sq] & 7)
+            elif move == killer_a:
+                score = 1 << 22
+            elif move == killer_b:
+                score = (1 << 22) - 1
+            else:
+                score = history[move & 0xFFF]
+            keys[i] = (score << 16) | move
+
+    def _next_move(self, index: int, end: int) -> Move:
+        # Swap the best remaining move into place; most cutoffs come early, so
+        # picking lazily beats sorting the whole list
+        keys = self.move_keys
+        best = max(range(index, end), key=keys.__getitem__)
+        key = keys[best]
+        keys[best] = keys[index]
+        keys[index] = key
+        return key & 0xFFFF
+
+    def _negamax(self, board: ChessBoard, depth: int, alpha: int, beta: int, ply: int, start: int) -> int:
+        in_check = board.is_in_check(board.current_turn)
+        if in_check and ply < MAX_PLY:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY:
+            return self._quiesce(board, alpha, beta, ply, start)
+
+        self.nodes += 1
+        if not self.nodes & 1023:
+            self._check_budget()
+        if ply > 0 and (board.is_repetition(2) or board.is_fifty_move_draw()):
+            return 0
+        if ply > 0 and self.tablebases is not None:
+            score = self.tablebases.probe(board)
+            if score is not None:
+                return score - ply if score > 0 else score + ply if score < 0 else 0
+
+        key = board.zobrist_key
+        tt_move = 0
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_move, tt_score, tt_depth, bound = entry
+            if ply > 0 and tt_depth >= depth:
+                tt_score = _score_from_table(tt_score, ply)
+                if (bound == EXACT or
+                        (bound == LOWER_BOUND and tt_score >= beta) or
+                        (bound == UPPER_BOUND and tt_score <= alpha)):
+                    return tt_score
+
+        end = board.generate_moves(self.move_buffer, start)
+        if end == start:
+            return -MATE_SCORE + ply if in_check else 0
+        self._score_moves(board, start, end, tt_move, ply)
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = 0
+        for index in range(start, end):
+            move = self._next_move(index, end)
+            board.push(move)
+            score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1, end)
+            board.pop()
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if ply == 0:
+                        self._root_move = move
+                    if alpha >= beta:
+                        if move >> 12 < CAPTURE:
+                            killers = self.killers[ply]
+                            if killers[0] != move:
+                                killers[1] = killers[0]
+                                killers[0] = move
+                            self.history[COLOR_INDEX[board.current_turn]][move & 0xFFF] += depth * depth
+                        break
+
+        if best_score <= original_alpha:
+            bound = UPPER_BOUND
+        elif best_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.tt.store(key, depth, _score_to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    def _quiesce(self, board: ChessBoard, alpha: int, beta: int, ply: int, start: int) -> int:
+        # Resolve captures (and check evasions) so leaves are tactically quiet
+        self.nodes += 1
+        if not self.nodes & 1023:
+            self._check_budget()
+        if ply >= MAX_PLY:
+            return self.evaluate(board)
+
+        if board.is_in_check(board.current_turn):
+            end = board.generate_moves(self.move_buffer, start)
+            if end == start:
+                return -MATE_SCORE + ply
+            best_score = -INFINITY
+        else:
+            best_score = self.evaluate(board)
+            if best_score >= beta:
+                return best_score
+            if best_score > alpha:
+                alpha = best_score
+            end = board.generate_moves(self.move_buffer, start, captures_only=True)
+        self._score_moves(board, start, end, 0, ply)
+
+        for index in range(start, end):
+            move = self._next_move(index, end)
+            board.push(move)
+            score = -self._quiesce(board, -beta, -alpha, ply + 1, end)
+            board.pop()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_score
+
+# Helper process of a lazy SMP search: searches the root with its own move
+# ordering and starting depth until told to stop, filling the shared table,
+# then reports how many nodes it visited
+def _lazy_smp_helper(snapshot: bytes, history: List[int], shm_name: str, tt_size_mb: int,
+                     generation: int, tablebases: Optional[Tablebases], helper_id: int,
+                     max_depth: int, stop_event, node_counts):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    engine = ChessEngine(tt_size_mb, shm.buf, tablebases=tablebases)
+    try:
+        engine.stop_event = stop_event
+        engine.tt.generation = generation
+        rng = random.Random(helper_id)
+        for table in engine.history:
+            for i in range(4096):
+                table[i] = rng.randrange(16)
+        board = ChessBoard.from_snapshot(snapshot, history)
+        engine.search(board, max_depth=max_depth, start_depth=1 + helper_id % 2)
+    finally:
+        node_counts.put(engine.nodes)
+        engine.tt.release()
+        shm.close()
+
+# Lazy SMP: the main search runs in this process while helper processes search
+# the same root at staggered depths. Nothing is exchanged but the
+# transposition table in shared memory; helpers pick up each other's cutoffs
+# and best moves from it, so the main search completes deeper iterations.
+class LazySMPEngine:
+    def __init__(self, processes: Optional[int] = None, tt_size_mb: int = 64,
+                 book: Optional[OpeningBook] = None, tablebases: Optional[Tablebases] = None):
+        self.processes = max(processes or os.cpu_count() or 1, 1)
+        self.tt_size_mb = tt_size_mb
+        self._shm = shared_memory.SharedMemory(create=True,
+                                               size=TranspositionTable.buffer_size(tt_size_mb))
+        self.engine = ChessEngine(tt_size_mb, self._shm.buf, book, tablebases)
+        # Set from another thread to end the search early
+        self.stop_event = None
+        # Helpers come from a fork server rather than a plain fork, which could
+        # copy a lock held by another thread (such as the UCI input reader)
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context('forkserver')
+            self._context.set_forkserver_preload(['__main__'])
+        else:
+            self._context = multiprocessing.get_context('spawn')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._shm is not None:
+            self.engine.tt.release()
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def evaluate(self, board: ChessBoard) -> int:
+        return self.engine.evaluate(board)
+
+    def set_time_limit(self, time_limit: Optional[float]):
+        self.engine.set_time_limit(time_limit)
+
+    def stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+
+    def search(self, board: ChessBoard, time_limit: Optional[float] = None,
+               node_limit: Optional[int] = None, max_depth: int = MAX_PLY,
+               on_iteration: Optional[Callable[[SearchResult], None]] = None) -> SearchResult:
+        # Same contract as ChessEngine.search; nodes and nps cover all processes
+        book = self.engine.book_result(board)
+        if book is not None:
+            return book
+        start = time.perf_counter()
+        stop_event = self._context.Event()
+        node_counts = self._context.Queue()
+        snapshot = board.snapshot()
+        helpers = [self._context.Process(target=_lazy_smp_helper,
+                                         args=(snapshot, board.position_history, self._shm.name,
+                                               self.tt_size_mb, self.engine.tt.generation,
+                                               self.engine.tablebases, helper_id, max_depth,
+                                               stop_event, node_counts),
+                                         daemon=True)
+                   for helper_id in range(1, self.processes)]
+        for helper in helpers:
+            helper.start()
+        # The main search answers to the outside stop; helpers stop once it returns
+        self.engine.stop_event = self.stop_event
+        try:
+            result = self.engine.search(board, time_limit, node_limit, max_depth, on_iteration)
+        finally:
+            stop_event.set()
+            helper_nodes = sum(node_counts.get() for _ in helpers)
+            for helper in helpers:
+                helper.join()
+        elapsed = time.perf_counter() - start
+        nodes = result.nodes + helper_nodes
+        return result._replace(nodes=nodes, elapsed=elapsed,
+                               nps=int(nodes / elapsed) if elapsed > 0 else 0)
+
+# Proof and disproof numbers of a solved or refuted node
+PN_INFINITY = 1 << 30
+# Rough memory cost of a table entry and of each move cached with an
+# unsettled node, for keeping the table within its budget
+MATE_ENTRY_BYTES = 200
+MATE_CHILD_BYTES = 40
+
+# Outcome of a mate search: proven is True for a forced mate within mate_in
+# moves (exactly mate_in when the shortest was asked for) with a mating line,
+# False when there is none within the move limit and None when the budget ran out
+class MateResult(NamedTuple):
+    proven: Optional[bool]
+    mate_in: int
+    moves: List[Move]
+    nodes: int
+    elapsed: float
+    nps: int
+
+# Depth-first proof-number (df-pn) search for forced mates. The attacker's
+# nodes are OR nodes and the defender's are AND nodes. Proof and disproof
+# numbers are kept in a table keyed by position and plies left, so the
+# bounded tree has no cycles; unsettled nodes also keep their moves and
+# child keys so re-expanding them costs no move generation. When the table
+# outgrows its memory budget the entries whose subtrees took the least work
+# are dropped.
+class MateSolver:
+    def __init__(self, memory_mb: int = 64):
+        self.memory_bytes = memory_mb << 20
+        self.table = {}
+        self.nodes = 0
+        self._used = 0
+        self._deadline = None
+        self._node_limit = None
+
+    def solve(self, board: ChessBoard, max_moves: int, time_limit: Optional[float] = None,
+              node_limit: Optional[int] = None, shortest: bool = False) -> MateResult:
+        # Prove or disprove a mate within max_moves moves for the side to move.
+        # With shortest, mates in 1, 2, ... are tried in turn so the mate and
+        # its line are the shortest, at the cost of disproving every shorter
+        # one first. The board is left as it was given.
+        start = time.perf_counter()
+        self._deadline = start + time_limit if time_limit is not None else None
+        self._node_limit = node_limit
+        self.nodes = 0
+        root_height = len(board.undo_stack)
+        proven = False
+        mate_in = 0
+        moves = []
+        try:
+            for mate_in in range(1 if shortest else max_moves, max_moves + 1):
+                pn, _ = self._mid(board, 2 * mate_in - 1, True, PN_INFINITY, PN_INFINITY)
+                if pn == 0:
+                    proven = True
+                    self._deadline = self._node_limit = None
+                    moves = self._mating_line(board, 2 * mate_in - 1, shortest)
+                    break
+        except SearchTimeout:
+            while len(board.undo_stack) > root_height:
+                board.pop()
+            proven = None
+        elapsed = time.perf_counter() - start
+        return MateResult(proven, mate_in if proven else 0, moves, self.nodes, elapsed,
+                          int(self.nodes / elapsed) if elapsed > 0 else 0)
+
+    def _check_budget(self):
+        if self._node_limit is not None and self.nodes >= self._node_limit:
+            raise SearchTimeout()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+
+    @staticmethod
+    def _entry_bytes(entry: tuple) -> int:
+        return MATE_ENTRY_BYTES + (MATE_CHILD_BYTES * len(entry[3]) if entry[3] else 0)
+
+    def _store(self, key: tuple, pn: int, dn: int, work: int, children: Optional[tuple] = None):
+        # Settled nodes drop their cached moves
+        entry = (pn, dn, work, children if pn and dn else None)
+        old = self.table.get(key)
+        self._used += self._entry_bytes(entry) - (self._entry_bytes(old) if old else 0)
+        self.table[key] = entry
+        if self._used > self.memory_bytes:
+            self._collect()
+
+    def _collect(self):
+        # Keep the half of the table that was most expensive to compute
+        works = sorted(entry[2] for entry in self.table.values())
+        cutoff = works[len(works) // 2]
+        self.table = {key: entry for key, entry in self.table.items() if entry[2] > cutoff}
+        self._used = sum(self._entry_bytes(entry) for entry in self.table.values())
+
+    def _children(self, board: ChessBoard, remaining: int, or_node: bool) -> tuple:
+        # Moves and child position keys; the last attacking move has to give check
+        moves = []
+        keys = []
+        for move in board.generate_legal_moves():
+            board.push(move)
+            if not (or_node and remaining == 1) or board.is_in_check(board.current_turn):
+                moves.append(move)
+                keys.append(board.zobrist_key)
+            board.pop()
+        return moves, keys
+
+    def _mid(self, board: ChessBoard, remaining: int, or_node: bool, th_pn: int, th_dn: int) -> Tuple[int, int]:
+        # Expand the node until its proof number reaches th_pn or its disproof
+        # number reaches th_dn, and return both
+        self.nodes += 1
+        if not self.nodes & 1023:
+            self._check_budget()
+        key = (board.zobrist_key, remaining)
+        entry = self.table.get(key)
+        if entry is not None and (entry[0] >= th_pn or entry[1] >= th_dn):
+            return entry[0], entry[1]
+
+        if entry is not None and entry[3] is not None:
+            children = entry[3]
+        elif remaining == 0:
+            children = ((), ())
+        else:
+            children = self._children(board, remaining, or_node)
+        moves, keys = children
+        if not moves:
+            # Out of moves or plies: only a position where the defender is mated counts
+            mated = not or_node and board.is_in_check(board.current_turn) and not board.legal_moves()
+            pn, dn = (0, PN_INFINITY) if mated else (PN_INFINITY, 0)
+            self._store(key, pn, dn, 1)
+            return pn, dn
+
+        first_node = self.nodes
+        unknown = (1, 1)
+        child_remaining = remaining - 1
+        while True:
+            table = self.table
+            values = [table.get((child_key, child_remaining), unknown) for child_key in keys]
+            if or_node:
+                pn = min(value[0] for value in values)
+                dn = min(sum(value[1] for value in values), PN_INFINITY)
+            else:
+                pn = min(sum(value[0] for value in values), PN_INFINITY)
+                dn = min(value[1] for value in values)
+            if pn >= th_pn or dn >= th_dn:
+                break
+            # Descend into the most promising child with thresholds that send
+            # the search back up once a sibling looks better
+            rank = 0 if or_node else 1
+            best = second = PN_INFINITY
+            chosen = 0
+            for i, value in enumerate(values):
+                if value[rank] < best:
+                    best, second, chosen = value[rank], best, i
+                elif value[rank] < second:
+                    second = value[rank]
+            child_pn, child_dn = values[chosen][0], values[chosen][1]
+            if or_node:
+                child_th_pn = min(th_pn, second + 1)
+                child_th_dn = min(th_dn - dn + child_dn, PN_INFINITY)
+            else:
+                child_th_pn = min(th_pn - pn + child_pn, PN_INFINITY)
+                child_th_dn = min(th_dn, second + 1)
+            board.push(moves[chosen])
+            self._mid(board, child_remaining, not or_node, child_th_pn, child_th_dn)
+            board.pop()
+        self._store(key, pn, dn, self.nodes - first_node + (entry[2] if entry else 0), children)
+        return pn, dn
+
+    def _proven(self, board: ChessBoard, remaining: int, or_node: bool) -> bool:
+        return remaining >= 0 and self._mid(board, remaining, or_node, PN_INFINITY, PN_INFINITY)[0] == 0
+
+    def _mating_line(self, board: ChessBoard, remaining: int, tight: bool) -> List[Move]:
+        # Follow proven moves from a proven root, mating at once whenever
+        # possible. When the mate is known to take all `remaining` plies
+        # (tight), the defender's longest resistance is a reply that is not
+        # also mate two plies sooner; otherwise the defender takes the reply
+        # whose proof took the most work.
+        line = []
+        or_node = True
+        while remaining > 0 and not (board.is_in_check(board.current_turn) and not board.legal_moves()):
+            moves, keys = self._children(board, remaining, or_node)
+            chosen = None
+            if or_node:
+                chosen = next((move for move in moves if self._mates(board, move)), None)
+                if chosen is None:
+                    # A move already proven in the table, else prove them in turn
+                    chosen = next((move for move, child_key in zip(moves, keys)
+                                   if self.table.get((child_key, remaining - 1), (1,))[0] == 0), None)
+            candidates = [] if chosen is not None else zip(moves, keys)
+            most_work = -1
+            for move, child_key in candidates:
+                board.push(move)
+                if or_node:
+                    found = self._proven(board, remaining - 1, False)
+                elif tight:
+                    found = not self._proven(board, remaining - 3, True)
                 else:
-                    if (self.en_passant_target and
-                        (to_row, to_col) == (self.en_passant_target[0] + (-1 if piece.color == Color.WHITE else 1), 
-                                           self.en_passant_target[1])):
-                        self.board[self.en_passant_target[0]][self.en_passant_target[1]] = None
-                
-                # Promotion
-                if to_row in [0, 7]:
-                    print("Choose promotion piece:")
-                    print("1. Queen")
-                    print("2. Rook")
-                    print("3. Bishop") 
-                    print("4. Knight")
-                    while True:
-                        try:
-                            choice = int(input("Enter number (1-4): "))
-                            if 1 <= choice <= 4:
-                                piece_types = {
-                                    1: PieceType.QUEEN,
-                                    2: PieceType.ROOK,
-                                    3: PieceType.BISHOP,
-                                    4: PieceType.KNIGHT
-                                }
-                                piece = Piece(piece_types[choice], piece.color)
-                                break
-                            else:
-                                print("Please enter valid number (1-4)")
-                        except ValueError:
-                            print("Please enter valid number")
+                    self._proven(board, remaining - 1, True)
+                    work = self.table[(child_key, remaining - 1)][2]
+                    if work > most_work:
+                        chosen, most_work = move, work
+                    found = False
+                board.pop()
+                if found:
+                    chosen = move
+                    break
+            if chosen is None:
+                break
+            board.push(chosen)
+            line.append(chosen)
+            remaining -= 1
+            or_node = not or_node
+        for _ in line:
+            board.pop()
+        return line
+
+    @staticmethod
+    def _mates(board: ChessBoard, move: Move) -> bool:
+        board.push(move)
+        mate = board.is_in_check(board.current_turn) and not board.legal_moves()
+        board.pop()
+        return mate
+
+def run_mate_search(fen: str, max_moves: int, shortest: bool = False,
+                    time_limit: Optional[float] = None, memory_mb: int = 64) -> Optional[bool]:
+    # Solve one position and print the verdict with the mating line in SAN
+    board = ChessBoard(fen)
+    result = MateSolver(memory_mb).solve(board, max_moves, time_limit, shortest=shortest)
+    if result.proven:
+        line = []
+        for move in result.moves:
+            line.append(board.move_to_san(move))
+            board.push(move)
+        print(f"Mate in {'' if shortest else '<= '}{result.mate_in}: {' '.join(line)}")
+    elif result.proven is False:
+        print(f"No mate in {max_moves}")
+    else:
+        print("Unknown: budget exhausted")
+    print(f"{result.nodes} nodes in {result.elapsed:.2f}s ({result.nps} nodes/s)")
+    return result.proven
+
+# Piece code held by each of the 12 planes of a batch tensor: white pawn,
+# knight, bishop, rook, queen, king, then the same for black
+PLANE_PIECES = np.array([make_piece(piece_type, color)
+                         for color in (Color.WHITE, Color.BLACK)
+                         for piece_type in (PieceType.PAWN, PieceType.KNIGHT, PieceType.BISHOP,
+                                            PieceType.ROOK, PieceType.QUEEN, PieceType.KING)], dtype=np.uint8)
+
+# Stack the mailboxes of many boards into an (N, 12, 64) tensor of 0/1 planes
+def board_planes(boards: List[ChessBoard]) -> np.ndarray:
+    mailboxes = np.frombuffer(b''.join(bytes(board.board) for board in boards), dtype=np.uint8)
+    mailboxes = mailboxes.reshape(len(boards), 64)
+    return (mailboxes[:, None, :] == PLANE_PIECES[None, :, None]).astype(np.float32)
+
+# The board's own piece-square scores as (12, 64) middlegame and endgame
+# weight tensors, plus the per-plane phase weights
+def default_weights() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    middlegame = np.array([MIDDLEGAME_SCORES[piece] for piece in PLANE_PIECES], dtype=np.float32)
+    endgame = np.array([ENDGAME_SCORES[piece] for piece in PLANE_PIECES], dtype=np.float32)
+    phase = np.array([PHASE_WEIGHTS[piece & 7] for piece in PLANE_PIECES], dtype=np.float32)
+    return middlegame, endgame, phase
+
+# Score a whole batch at once from white's point of view. Pass boards or a
+# ready-made plane tensor; without endgame weights the score is the plain
+# dot product with the middlegame weights, otherwise the two are tapered by
+# phase exactly as ChessBoard.evaluate() does.
+def batch_evaluate(positions, middlegame_weights: Optional[np.ndarray] = None,
+                   endgame_weights: Optional[np.ndarray] = None,
+                   phase_weights: Optional[np.ndarray] = None) -> np.ndarray:
+    planes = positions if isinstance(positions, np.ndarray) else board_planes(positions)
+    if middlegame_weights is None:
+        middlegame_weights, endgame_weights, phase_weights = default_weights()
+    middlegame = np.einsum('npk,pk->n', planes, middlegame_weights)
+    if endgame_weights is None:
+        return middlegame
+    if phase_weights is None:
+        phase_weights = default_weights()[2]
+    endgame = np.einsum('npk,pk->n', planes, endgame_weights)
+    phase = np.minimum(np.einsum('npk,p->n', planes, phase_weights), TOTAL_PHASE)
+    return np.floor((middlegame * phase + endgame * (TOTAL_PHASE - phase)) / TOTAL_PHASE)
+
+def _count_legal_moves(snapshots: List[bytes]) -> List[int]:
+    board = ChessBoard()
+    buffer = new_move_buffer(1)
+    counts = []
+    for snapshot in snapshots:
+        board.restore(snapshot)
+        counts.append(board.generate_moves(buffer))
+    return counts
+
+# Legal move count (mobility) of the side to move in every position, with
+# the batch split across worker processes when asked
+def batch_mobility(boards: List[ChessBoard], processes: int = 1, chunk_size: int = 1024) -> np.ndarray:
+    snapshots = [board.snapshot() for board in boards]
+    chunks = [snapshots[i:i + chunk_size] for i in range(0, len(snapshots), chunk_size)]
+    if processes > 1 and len(chunks) > 1:
+        with Pool(processes) as pool:
+            results = pool.map(_count_legal_moves, chunks)
+    else:
+        results = [_count_legal_moves(chunk) for chunk in chunks]
+    return np.array([count for chunk in results for count in chunk], dtype=np.int32)
+
+# Standard perft reference positions with known leaf counts for depths 1, 2, ...
+PERFT_POSITIONS = [
+    ("Initial position", STARTING_FEN,
+     [20, 400, 8902, 197281, 4865609, 119060324]),
+    ("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603, 193690690]),
+    ("Position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624, 11030083]),
+    ("Position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333, 15833292]),
+    ("Position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487, 89941194]),
+    ("Position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+# Count the leaf nodes of the legal move tree to the given depth
+def perft(board: ChessBoard, depth: int, buffer: Optional[array] = None, start: int = 0) -> int:
+    if depth == 0:
+        return 1
+    if buffer is None:
+        buffer = new_move_buffer(depth)
+    end = board.generate_moves(buffer, start)
+    if depth == 1:
+        return end - start
+    nodes = 0
+    for index in range(start, end):
+        board.push(buffer[index])
+        nodes += perft(board, depth - 1, buffer, end)
+        board.pop()
+    return nodes
+
+def _perft_root_move(task: tuple) -> tuple:
+    board, move, depth = task
+    board.push(move)
+    nodes = perft(board, depth - 1)
+    board.pop()
+    return move, nodes
+
+# Leaf counts below each root move, optionally splitting root moves across processes
+def divide(board: ChessBoard, depth: int, processes: int = 1) -> dict:
+    moves = board.generate_legal_moves()
+    if depth < 1:
+        raise ValueError("Divide needs a depth of at least 1")
+    if processes > 1 and len(moves) > 1:
+        with Pool(processes) as pool:
+            results = pool.map(_perft_root_move, [(board, move, depth) for move in moves])
+    else:
+        results = [_perft_root_move((board, move, depth)) for move in moves]
+    return dict(results)
+
+# Run perft on one position, printing the per-move split when asked
+def run_perft(fen: str, depth: int, show_divide: bool = False, processes: int = 1) -> int:
+    board = ChessBoard()
+    board.set_fen(fen)
+    start = time.perf_counter()
+    if show_divide or processes > 1:
+        counts = divide(board, depth, processes)
+        nodes = sum(counts.values())
+        if show_divide:
+            for move, count in sorted(counts.items(), key=lambda item: board.move_to_uci(item[0])):
+                print(f"{board.move_to_uci(move)}: {count}")
+    else:
+        nodes = perft(board, depth)
+    elapsed = time.perf_counter() - start
+    print(f"Depth {depth}: {nodes} nodes in {elapsed:.2f}s ({int(nodes / elapsed) if elapsed > 0 else 0} nodes/s)")
+    return nodes
+
+# Check every reference position up to max_depth; returns True when all counts match
+def run_perft_suite(max_depth: int = 3, processes: int = 1) -> bool:
+    all_passed = True
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected in PERFT_POSITIONS:
+        board = ChessBoard()
+        board.set_fen(fen)
+        for depth in range(1, min(max_depth, len(expected)) + 1):
+            start = time.perf_counter()
+            if processes > 1:
+                nodes = sum(divide(board, depth, processes).values())
             else:
-                self.en_passant_target = None
-            
-            # Record move
-            self.last_move = ((from_row, from_col), (to_row, to_col))
-            
-            # Check if capturing king
-            target = self.get_piece(to_row, to_col)
-            if target and target.piece_type == PieceType.KING:
-                self.board[to_row][to_col] = piece
-                self.board[from_row][from_col] = None
-                print(f"Game Over! {piece.color.name} wins!")
-                return True
-            
-            # Execute move
-            self.board[to_row][to_col] = piece
-            self.board[from_row][from_col] = None
-            piece.has_moved = True
-            
-            # Switch turn
-            self.current_turn = Color.BLACK if self.current_turn == Color.WHITE else Color.WHITE
-            
-            # Check for check
-            if self.is_in_check(self.current_turn):
-                print("Check!")
-                print(f"{self.current_turn.name} king is under attack!")
-            
-            self.move_count += 1
-            
+                nodes = perft(board, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            passed = nodes == expected[depth - 1]
+            all_passed = all_passed and passed
+            print(f"{name:<17} depth {depth}: {nodes:>10} {'OK' if passed else 'FAIL (expected ' + str(expected[depth - 1]) + ')'}"
+                  f"  {elapsed:.2f}s  {int(nodes / elapsed) if elapsed > 0 else 0} nodes/s")
+    print(f"Total: {total_nodes} nodes in {total_time:.2f}s ({int(total_nodes / total_time) if total_time > 0 else 0} nodes/s)")
+    return all_passed
+
+# One game read from a PGN file: its tag pairs, its moves in standard
+# algebraic notation and the result token that ended it
+class PGNGame(NamedTuple):
+    headers: Dict[str, str]
+    moves: List[str]
+    result: str
+
+PGN_TAG = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+PGN_RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+def _pgn_moves(movetext: str) -> Tuple[List[str], str]:
+    # Strip comments, variations, move numbers and annotations from movetext
+    text = re.sub(r'\{[^}]*\}', ' ', movetext)
+    while True:
+        stripped = re.sub(r'\([^()]*\)', ' ', text)
+        if stripped == text:
+            break
+        text = stripped
+    moves = []
+    result = '*'
+    for token in text.split():
+        if token in PGN_RESULTS:
+            result = token
+            continue
+        token = re.sub(r'^\d+\.+', '', token)
+        if token and not token.startswith('$'):
+            moves.append(token)
+    return moves, result
+
+def _strip_pgn_comment(line: str, in_brace: bool) -> Tuple[str, bool]:
+    # Cut a ';' comment from a movetext line, ignoring ';' inside a '{...}'
+    # comment that may have opened on an earlier line; also returns whether
+    # a brace comment is still open at the end of the line
+    for index, char in enumerate(line):
+        if in_brace:
+            in_brace = char != '}'
+        elif char == '{':
+            in_brace = True
+        elif char == ';':
+            return line[:index], False
+    return line, in_brace
+
+def read_pgn(source) -> Iterator[PGNGame]:
+    # Stream games from a PGN path or open text file one at a time, so an
+    # archive of any size is never held in memory
+    handle = open(source, encoding='utf-8', errors='replace') if isinstance(source, str) else source
+    try:
+        headers = {}
+        movetext = []
+        in_brace = False
+        for line in handle:
+            line = line.strip()
+            if in_brace:
+                line, in_brace = _strip_pgn_comment(line, in_brace)
+                movetext.append(line)
+                continue
+            if line.startswith('%'):
+                continue
+            tag = PGN_TAG.match(line)
+            if tag:
+                if movetext:
+                    yield PGNGame(headers, *_pgn_moves(' '.join(movetext)))
+                    headers, movetext = {}, []
+                headers[tag.group(1)] = tag.group(2)
+            elif line:
+                line, in_brace = _strip_pgn_comment(line, in_brace)
+                movetext.append(line)
+        if headers or movetext:
+            yield PGNGame(headers, *_pgn_moves(' '.join(movetext)))
+    finally:
+        if handle is not source:
+            handle.close()
+
+# Outcome of replaying one game: plies played before the end or the first
+# bad move, the error if there was one, and optionally every position seen
+class GameReplay(NamedTuple):
+    plies: int
+    error: Optional[str]
+    positions: List[bytes]
+
+def replay_game(game: PGNGame, keep_positions: bool = False, board: Optional[ChessBoard] = None) -> GameReplay:
+    # Play a game's moves on a board, stopping at the first one that is not legal
+    board = board or ChessBoard()
+    positions = []
+    try:
+        board.set_fen(game.headers.get('FEN', STARTING_FEN))
+    except ValueError as error:
+        return GameReplay(0, str(error), positions)
+    if keep_positions:
+        positions.append(board.snapshot())
+    for ply, san in enumerate(game.moves):
+        try:
+            board.push(board.parse_san(san))
+        except ValueError as error:
+            number = f"{board.move_count // 2 + 1}{'.' if board.current_turn == Color.WHITE else '...'}"
+            return GameReplay(ply, f"{number} {error}", positions)
+        if keep_positions:
+            positions.append(board.snapshot())
+    return GameReplay(len(game.moves), None, positions)
+
+def _replay_chunk(task: Tuple[List[PGNGame], bool]) -> List[GameReplay]:
+    games, keep_positions = task
+    board = ChessBoard()
+    return [replay_game(game, keep_positions, board) for game in games]
+
+def replay_games(games: Iterable[PGNGame], processes: int = 1, chunk_size: int = 64,
+                 keep_positions: bool = False) -> Iterator[GameReplay]:
+    # Replay games in order, in chunks across a process pool; only a few
+    # chunks are in flight at once so the games can come straight from read_pgn
+    games = iter(games)
+    def chunks():
+        while True:
+            chunk = list(itertools.islice(games, chunk_size))
+            if not chunk:
+                return
+            yield chunk, keep_positions
+    if processes <= 1:
+        for task in chunks():
+            yield from _replay_chunk(task)
+        return
+    with Pool(processes) as pool:
+        pending = deque()
+        for task in chunks():
+            pending.append(pool.apply_async(_replay_chunk, (task,)))
+            if len(pending) >= 2 * processes:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+def run_pgn_validation(path: str, processes: int = 1, show_errors: bool = True) -> bool:
+    # Check every move of every game in a PGN file and report games/second
+    start = time.perf_counter()
+    games = plies = invalid = 0
+    headers = deque()
+    def stream():
+        for game in read_pgn(path):
+            headers.append(game.headers)
+            yield game
+    for replay in replay_games(stream(), processes):
+        game_headers = headers.popleft()
+        games += 1
+        plies += replay.plies
+        if replay.error:
+            invalid += 1
+            if show_errors:
+                print(f"Game {games} ({game_headers.get('White', '?')} - {game_headers.get('Black', '?')}): "
+                      f"{replay.error}")
+    elapsed = time.perf_counter() - start
+    rate = games / elapsed if elapsed > 0 else 0
+    print(f"{games} games, {plies} plies, {invalid} invalid in {elapsed:.2f}s "
+          f"({rate:.1f} games/s, {int(plies / elapsed) if elapsed > 0 else 0} plies/s)")
+    return invalid == 0
+
+# One EPD test: the position and its operations, e.g. {'bm': ['Nf3'], 'id': ['WAC.001']}
+class EPDTest(NamedTuple):
+    fen: str
+    operations: Dict[str, List[str]]
+
+# Outcome of searching one EPD test
+class EPDResult(NamedTuple):
+    name: str
+    solved: bool
+    move: str
+    expected: str
+    depth: int
+    nodes: int
+    elapsed: float
+
+EPD_OPERATION = re.compile(r'(\w+)((?:\s+(?:"[^"]*"|[^\s;"]+))*)\s*;')
+
+def read_epd(source) -> Iterator[EPDTest]:
+    # Stream the tests of an EPD file; each line is four FEN fields followed by
+    # operations such as 'bm Nf3;' or 'id "WAC.001";'
+    handle = open(source, encoding='utf-8') if isinstance(source, str) else source
+    try:
+        for line in handle:
+            fields = line.strip().split(None, 4)
+            if len(fields) < 4 or fields[0].startswith('#'):
+                continue
+            operations = {}
+            for opcode, operands in EPD_OPERATION.findall(fields[4] if len(fields) > 4 else ''):
+                operations[opcode] = [operand.strip('"') for operand in re.findall(r'"[^"]*"|\S+', operands)]
+            fen = ' '.join(fields[:4])
+            if 'hmvc' in operations and 'fmvn' in operations:
+                fen += f" {operations['hmvc'][0]} {operations['fmvn'][0]}"
+            yield EPDTest(fen, operations)
+    finally:
+        if handle is not source:
+            handle.close()
+
+def _run_epd_test(task: Tuple[int, EPDTest, Optional[float], Optional[int], int]) -> EPDResult:
+    number, test, time_limit, depth, tt_size_mb = task
+    board = ChessBoard(test.fen)
+    name = test.operations.get('id', [str(number)])[0]
+    best = {board.parse_san(san) for san in test.operations.get('bm', [])}
+    avoid = {board.parse_san(san) for san in test.operations.get('am', [])}
+    result = ChessEngine(tt_size_mb).search(board, time_limit=time_limit, max_depth=depth or MAX_PLY)
+    solved = result.move is not None and (not best or result.move in best) and result.move not in avoid
+    expected = '; '.join(f"{opcode} {' '.join(test.operations[opcode])}"
+                         for opcode in ('bm', 'am') if opcode in test.operations)
+    return EPDResult(name, solved, board.move_to_san(result.move) if result.move is not None else '-',
+                     expected, result.depth, result.nodes, result.elapsed)
+
+def run_epd_suite(path: str, time_limit: Optional[float] = None, depth: Optional[int] = None,
+                  processes: int = 1, tt_size_mb: int = 16) -> float:
+    # Search every position of an EPD suite under a time or depth budget and
+    # report each answer, the solve rate and the aggregate nodes/second
+    if time_limit is None and depth is None:
+        time_limit = 1.0
+    tasks = ((number, test, time_limit, depth, tt_size_mb)
+             for number, test in enumerate(read_epd(path), 1))
+    start = time.perf_counter()
+    total = solved = nodes = 0
+    search_time = 0.0
+    pool = Pool(processes) if processes > 1 else None
+    try:
+        results = pool.imap(_run_epd_test, tasks) if pool else map(_run_epd_test, tasks)
+        for result in results:
+            total += 1
+            solved += result.solved
+            nodes += result.nodes
+            search_time += result.elapsed
+            print(f"{result.name:<16} {'ok  ' if result.solved else 'FAIL'} {result.move:<8} "
+                  f"({result.expected})  depth {result.depth}  {result.nodes} nodes")
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    elapsed = time.perf_counter() - start
+    rate = solved / total if total else 0.0
+    print(f"Solved {solved}/{total} ({100 * rate:.1f}%) in {elapsed:.2f}s; {nodes} nodes, "
+          f"{int(nodes / elapsed) if elapsed > 0 else 0} nodes/s across {max(processes, 1)} processes "
+          f"({int(nodes / search_time) if search_time > 0 else 0} nodes/s per search)")
+    return rate
+
+# UCI front end. Commands are read on the calling thread while a search
+# runs on a background thread, so stop, isready and ponderhit are answered
+# at once. In a ponder or infinite search the best move is held back until
+# the GUI sends stop or ponderhit, as the protocol requires.
+class UCIEngine:
+    def __init__(self, output=None):
+        self.output = output or sys.stdout
+        self.board = ChessBoard()
+        self.options = {'Hash': 16, 'Threads': 1, 'Ponder': False, 'BookFile': '', 'TablebasePath': ''}
+        self.engine = None
+        self._thread = None
+        self._stop_event = None
+        self._release = threading.Event()
+        self._ponder_budget = None
+        self._pending_limit = None
+        self._output_lock = threading.Lock()
+
+    def send(self, line: str):
+        with self._output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def _engine(self):
+        # Built on first use so setoption can change how it is made
+        if self.engine is None:
+            book = OpeningBook(self.options['BookFile']) if self.options['BookFile'] else None
+            tablebases = Tablebases(self.options['TablebasePath']) if self.options['TablebasePath'] else None
+            if self.options['Threads'] > 1:
+                self.engine = LazySMPEngine(self.options['Threads'], self.options['Hash'], book, tablebases)
+            else:
+                self.engine = ChessEngine(self.options['Hash'], book=book, tablebases=tablebases)
+        return self.engine
+
+    def _reset_engine(self):
+        self.stop_search()
+        if isinstance(self.engine, LazySMPEngine):
+            self.engine.close()
+        self.engine = None
+
+    def run(self, lines=None):
+        # Serve commands until 'quit' or the end of input
+        for line in lines if lines is not None else sys.stdin:
+            if not self.handle(line):
+                break
+        self._reset_engine()
+
+    def handle(self, line: str) -> bool:
+        # Act on one command line; False once the engine should exit
+        tokens = line.split()
+        if not tokens:
             return True
-            
-        except ValueError:
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send("id name Classic-Game Chess")
+            self.send("id author Classic-Game")
+            self.send(f"option name Hash type spin default 16 min 1 max 4096")
+            self.send(f"option name Threads type spin default 1 min 1 max {os.cpu_count() or 1}")
+            self.send("option name Ponder type check default false")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send("uciok")
+        elif command == 'isready':
+            self.send("readyok")
+        elif command == 'setoption':
+            self._set_option(args)
+        elif command == 'ucinewgame':
+            self.stop_search()
+            if self.engine is not None:
+                engine = self.engine.engine if isinstance(self.engine, LazySMPEngine) else self.engine
+                engine.tt.clear()
+            self.board = ChessBoard()
+        elif command == 'position':
+            self.stop_search()
+            self._set_position(args)
+        elif command == 'go':
+            self.stop_search()
+            self._go(args)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'ponderhit':
+            if self._ponder_budget is not None:
+                # Also applied at the next iteration in case the search had
+                # not yet started and would overwrite it
+                self._pending_limit = self._ponder_budget or None
+                self.engine.set_time_limit(self._pending_limit)
+                self._ponder_budget = None
+            self._release.set()
+        elif command == 'quit':
             return False
+        return True
+
+    def _set_option(self, args: List[str]):
+        text = ' '.join(args)
+        match = re.match(r'name\s+(.+?)(?:\s+value\s+(.*))?$', text)
+        if not match:
+            return
+        name, value = match.group(1), (match.group(2) or '').strip()
+        if name in ('Hash', 'Threads'):
+            try:
+                self.options[name] = max(int(value), 1)
+            except ValueError:
+                return
+        elif name == 'Ponder':
+            self.options[name] = value.lower() == 'true'
+            return
+        elif name in ('BookFile', 'TablebasePath'):
+            self.options[name] = '' if value == '<empty>' else value
+        else:
+            return
+        self._reset_engine()
+
+    def _set_position(self, args: List[str]):
+        moves = args.index('moves') if 'moves' in args else len(args)
+        try:
+            if args and args[0] == 'fen':
+                board = ChessBoard(' '.join(args[1:moves]))
+            else:
+                board = ChessBoard()
+            for text in args[moves + 1:]:
+                move = board.find_move(square_index(*board.algebraic_to_index(text[:2])),
+                                       square_index(*board.algebraic_to_index(text[2:4])),
+                                       FEN_PIECE_TYPES[text[4].lower()].value if len(text) > 4 else 0)
+                if move is None:
+                    raise ValueError(f"Illegal move: {text}")
+                board.push(move)
+        except ValueError as error:
+            self.send(f"info string {error}")
+            return
+        self.board = board
+
+    def _time_budget(self, params: dict) -> Optional[float]:
+        # Seconds to spend on this move from the go parameters
+        if 'movetime' in params:
+            return max(params['movetime'] / 1000 - 0.02, 0.01)
+        white = self.board.current_turn == Color.WHITE
+        remaining = params.get('wtime' if white else 'btime')
+        if remaining is None:
+            return None
+        increment = params.get('winc' if white else 'binc', 0)
+        budget = remaining / params.get('movestogo', 30) + increment * 0.75
+        return max(min(budget, remaining * 0.5 - 50), 10) / 1000
+
+    def _go(self, args: List[str]):
+        params = {}
+        for name, value in zip(args, args[1:]):
+            if name in ('wtime', 'btime', 'winc', 'binc', 'movestogo', 'movetime', 'depth', 'nodes'):
+                try:
+                    params[name] = int(value)
+                except ValueError:
+                    pass
+        pondering = 'ponder' in args
+        held = pondering or 'infinite' in args
+        budget = None if 'infinite' in args else self._time_budget(params)
+        engine = self._engine()
+        self._stop_event = threading.Event()
+        engine.stop_event = self._stop_event
+        self._release = threading.Event()
+        if not held:
+            self._release.set()
+        # A ponderhit turns the ponder search into a timed one; 0 means no limit
+        self._ponder_budget = (budget or 0) if pondering else None
+        board = ChessBoard.from_snapshot(self.board.snapshot(), self.board.position_history)
+        self._thread = threading.Thread(
+            target=self._search, daemon=True,
+            args=(engine, board, None if pondering else budget, params.get('nodes'),
+                  params.get('depth', MAX_PLY)))
+        self._thread.start()
+
+    def _search(self, engine, board: ChessBoard, time_limit: Optional[float],
+                node_limit: Optional[int], max_depth: int):
+        result = engine.search(board, time_limit, node_limit, max_depth, self._report)
+        self._release.wait()
+        if result.move is None:
+            self.send("bestmove 0000")
+        elif len(result.pv) > 1:
+            self.send(f"bestmove {board.move_to_uci(result.move)} ponder {board.move_to_uci(result.pv[1])}")
+        else:
+            self.send(f"bestmove {board.move_to_uci(result.move)}")
 
-def play_chess():
+    def _report(self, result: SearchResult):
+        if self._pending_limit is not None:
+            limit, self._pending_limit = self._pending_limit, None
+            self.engine.set_time_limit(limit)
+        if abs(result.score) > MATE_BOUND:
+            plies = MATE_SCORE - abs(result.score)
+            score = f"mate {(plies + 1) // 2 if result.score > 0 else -(plies // 2)}"
+        else:
+            score = f"cp {result.score}"
+        pv = ' '.join(self.board.move_to_uci(move) for move in result.pv)
+        self.send(f"info depth {result.depth} score {score} nodes {result.nodes} nps {result.nps} "
+                  f"time {int(result.elapsed * 1000)} pv {pv}")
+
+    def stop_search(self):
+        # End a running search; its best move is sent before this returns
+        if self._thread is not None:
+            self._stop_event.set()
+            self._release.set()
+            self._thread.join()
+            self._thread = None
+            self._ponder_budget = None
+            self._pending_limit = None
+
+# Ask the player which piece a pawn should promote to
+def choose_promotion() -> PieceType:
+    print("Choose promotion piece:")
+    print("1. Queen")
+    print("2. Rook")
+    print("3. Bishop")
+    print("4. Knight")
+    piece_types = {
+        1: PieceType.QUEEN,
+        2: PieceType.ROOK,
+        3: PieceType.BISHOP,
+        4: PieceType.KNIGHT
+    }
+    while True:
+        try:
+            choice = int(input("Enter number (1-4): "))
+            if 1 <= choice <= 4:
+                return piece_types[choice]
+            print("Please enter valid number (1-4)")
+        except ValueError:
+            print("Please enter valid number")
+
+def play_chess(book_path: Optional[str] = None, tablebase_dir: Optional[str] = None):
     board = ChessBoard()
+    engine = None
+    computer_color = None
+    if input("Play against the computer? (y/n): ").strip().lower().startswith('y'):
+        engine = ChessEngine(book=OpeningBook(book_path) if book_path else None,
+                             tablebases=Tablebases(tablebase_dir) if tablebase_dir else None)
+        side = input("Play as white or black? (w/b): ").strip().lower()
+        computer_color = Color.WHITE if side.startswith('b') else Color.BLACK
     while True:
         try:
             board.display()
             current_player = "White" if board.current_turn == Color.WHITE else "Black"
             print(f"\n{current_player}'s turn")
             
-            # Check if any king is captured
-            white_king_exists = False
-            black_king_exists = False
-            for r in range(8):
-                for c in range(8):
-                    piece = board.get_piece(r, c)
-                    if piece and piece.piece_type == PieceType.KING:
-                        if piece.color == Color.WHITE:
-                            white_king_exists = True
-                        else:
-                            black_king_exists = True
-            
-            if not white_king_exists:
-                print("Black wins!")
-                break
-            elif not black_king_exists:
-                print("White wins!")
-                break
-            
-            if board.is_checkmate(board.current_turn):
+            status = board.status()
+            if status == GameStatus.CHECKMATE:
                 print(f"Checkmate! {'Black' if board.current_turn == Color.WHITE else 'White'} wins!")
                 break
-                
-            if board.is_stalemate(board.current_turn):
+
+            if status == GameStatus.STALEMATE:
                 print("Stalemate!")
                 break
-                
+
+            if status == GameStatus.DRAW:
+                print("Draw!")
+                break
+
             # Check if king is in check
-            if board.is_in_check(board.current_turn):
+            if status == GameStatus.CHECK:
                 print(f"{current_player}'s king is in check!")
-                
+
+            if board.current_turn == computer_color:
+                result = engine.search(board, time_limit=3.0)
+                if result.book:
+                    print(f"Computer plays {board.move_to_uci(result.move)} (book)")
+                else:
+                    print(f"Computer plays {board.move_to_uci(result.move)} "
+                          f"(depth {result.depth}, {result.nodes} nodes, {result.nps} nodes/s)")
+                board.push(result.move)
+                continue
+
             from_pos = input("Enter piece to move (e.g. e2): ").strip()
             if from_pos.lower() == 'resign':
                 print(f"{current_player} resigns! {'Black' if board.current_turn == Color.WHITE else 'White'} wins!")
                 break
                 
             to_pos = input("Enter destination (e.g. e4): ").strip()
+            promotion = choose_promotion() if board.is_promotion(from_pos, to_pos) else PieceType.QUEEN
             
-            if board.make_move(from_pos, to_pos):
+            if board.make_move(from_pos, to_pos, promotion):
                 print("Move successful!")
             else:
                 print("Invalid move!")
@@ -481,5 +3189,61 @@ def play_chess():
             print(f"Error occurred: {e}")
             continue
 
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Chess")
+    parser.add_argument("--book", help="Polyglot opening book for the computer player")
+    parser.add_argument("--tablebases", help="directory of endgame tables for the computer player")
+    commands = parser.add_subparsers(dest="command")
+    perft_parser = commands.add_parser("perft", help="count move generation leaf nodes")
+    perft_parser.add_argument("depth", type=int, nargs="?", default=3)
+    perft_parser.add_argument("--fen", help="position to test instead of the reference suite")
+    perft_parser.add_argument("--divide", action="store_true", help="show the count below each root move")
+    perft_parser.add_argument("--processes", type=int, default=1, help="split root moves across processes")
+    pgn_parser = commands.add_parser("pgn", help="replay every game of a PGN file to check its moves")
+    pgn_parser.add_argument("path")
+    pgn_parser.add_argument("--processes", type=int, default=1, help="replay games across processes")
+    pgn_parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    epd_parser = commands.add_parser("epd", help="search the positions of an EPD test suite")
+    epd_parser.add_argument("path")
+    epd_parser.add_argument("--time", type=float, help="seconds per position (default 1.0 without --depth)")
+    epd_parser.add_argument("--depth", type=int, help="search depth per position")
+    epd_parser.add_argument("--processes", type=int, default=1, help="search positions across processes")
+    epd_parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB")
+    commands.add_parser("uci", help="speak the UCI protocol on standard input and output")
+    mate_parser = commands.add_parser("mate", help="prove or disprove a forced mate with proof-number search")
+    mate_parser.add_argument("fen")
+    mate_parser.add_argument("moves", type=int, help="mate within this many moves")
+    mate_parser.add_argument("--shortest", action="store_true", help="find the shortest mate and its longest defence")
+    mate_parser.add_argument("--time", type=float, help="give up after this many seconds")
+    mate_parser.add_argument("--memory", type=int, default=64, help="node table budget in MB")
+    tablebase_parser = commands.add_parser("tablebase", help="generate endgame tables by retrograde analysis")
+    tablebase_parser.add_argument("material", nargs="+", help="material sets such as KQK, KRK, KPK")
+    tablebase_parser.add_argument("--dir", default="tablebases", help="directory for the table files")
+    tablebase_parser.add_argument("--processes", type=int, default=1, help="split positions across processes")
+    args = parser.parse_args(argv)
+
+    if args.command == "perft":
+        if args.fen or args.divide:
+            run_perft(args.fen or STARTING_FEN, args.depth, args.divide, args.processes)
+        elif not run_perft_suite(args.depth, args.processes):
+            sys.exit(1)
+    elif args.command == "pgn":
+        if not run_pgn_validation(args.path, args.processes, not args.quiet):
+            sys.exit(1)
+    elif args.command == "epd":
+        run_epd_suite(args.path, args.time, args.depth, args.processes, args.hash)
+    elif args.command == "uci":
+        UCIEngine().run()
+    elif args.command == "mate":
+        run_mate_search(args.fen, args.moves, args.shortest, args.time, args.memory)
+    elif args.command == "tablebase":
+        for material in args.material:
+            try:
+                generate_tablebase(material, args.dir, args.processes)
+            except ValueError as error:
+                parser.error(str(error))
+    else:
+        play_chess(args.book, args.tablebases)
+
 if __name__ == "__main__":
-    play_chess()
+    main()
@@ -1,149 +1,1211 @@
 import pygame
+import argparse
+import itertools
+import math
+import mmap
+import os
 import random
+import struct
 import sys
+import time
+from collections import namedtuple
+from multiprocessing import Pool
 
-# Creates an empty 6x7 game board represented as a 2D list
+ROWS = 6
+COLS = 7
+# Each column takes ROWS + 1 bits, bottom cell first, so the spare top bit
+# keeps shifted lines from wrapping into the next column
+COLUMN_BITS = ROWS + 1
+CELLS = ROWS * COLS
+BOTTOM_ROW = sum(1 << (c * COLUMN_BITS) for c in range(COLS))
+FULL_BOARD = BOTTOM_ROW * ((1 << ROWS) - 1)
+
+# Bit of the cell at display row r (0 at the top) and column c
+def cell_bit(r, c):
+    return 1 << (c * COLUMN_BITS + ROWS - 1 - r)
+
+# Bit of a column's lowest cell and mask of its playable cells
+def bottom_mask(col):
+    return 1 << (col * COLUMN_BITS)
+
+def column_mask(col):
+    return ((1 << ROWS) - 1) << (col * COLUMN_BITS)
+
+# Checks a bitboard of one player's pieces for four in a row: shifting by 1,
+# COLUMN_BITS, COLUMN_BITS - 1 and COLUMN_BITS + 1 lines up neighbours
+# vertically, horizontally and along both diagonals
+def has_four(stones):
+    for shift in (1, COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1):
+        pairs = stones & (stones >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+# Empty cells that would complete four in a row for the given pieces
+def winning_cells(stones, mask):
+    # Vertical: three stacked pieces below the cell
+    cells = (stones << 1) & (stones << 2) & (stones << 3)
+    for shift in (COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1):
+        pair = (stones << shift) & (stones << 2 * shift)
+        cells |= pair & (stones << 3 * shift)
+        cells |= pair & (stones >> shift)
+        pair = (stones >> shift) & (stones >> 2 * shift)
+        cells |= pair & (stones << shift)
+        cells |= pair & (stones >> 3 * shift)
+    return cells & (FULL_BOARD ^ mask)
+
+# Every line of four cells on the board as (row, col) lists, and the index
+# of each line passing through a cell, by row * COLS + col
+def four_windows():
+    windows = []
+    for r in range(ROWS):
+        for c in range(COLS):
+            for dr, dc in ((0, 1), (1, 0), (1, 1), (-1, 1)):
+                cells = [(r + i * dr, c + i * dc) for i in range(4)]
+                if all(0 <= row < ROWS and 0 <= col < COLS for row, col in cells):
+                    windows.append(cells)
+    return windows
+
+WINDOWS = four_windows()
+CELL_WINDOWS = [[] for _ in range(CELLS)]
+for index, cells in enumerate(WINDOWS):
+    for r, c in cells:
+        CELL_WINDOWS[r * COLS + c].append(index)
+
+# Pieces of each player in every line of four, updated through the lines
+# crossing the changed cell only. Tracks completed lines for win checks and
+# the open threes: lines holding three of one player's pieces and none of
+# the other's.
+class WindowCounts:
+    def __init__(self):
+        self.counts = {1: [0] * len(WINDOWS), 2: [0] * len(WINDOWS)}
+        self.complete = {1: 0, 2: 0}
+        self.open = {1: set(), 2: set()}
+
+    def copy(self):
+        windows = WindowCounts.__new__(WindowCounts)
+        windows.counts = {piece: counts[:] for piece, counts in self.counts.items()}
+        windows.complete = dict(self.complete)
+        windows.open = {piece: set(lines) for piece, lines in self.open.items()}
+        return windows
+
+    def add(self, r, c, piece):
+        other = 3 - piece
+        own, theirs = self.counts[piece], self.counts[other]
+        for window in CELL_WINDOWS[r * COLS + c]:
+            own[window] += 1
+            if own[window] == 4:
+                self.complete[piece] += 1
+                self.open[piece].discard(window)
+            elif own[window] == 3 and not theirs[window]:
+                self.open[piece].add(window)
+            if theirs[window] == 3:
+                self.open[other].discard(window)
+
+    def remove(self, r, c, piece):
+        other = 3 - piece
+        own, theirs = self.counts[piece], self.counts[other]
+        for window in CELL_WINDOWS[r * COLS + c]:
+            if own[window] == 4:
+                self.complete[piece] -= 1
+            own[window] -= 1
+            if own[window] == 3 and not theirs[window]:
+                self.open[piece].add(window)
+            elif own[window] == 2:
+                self.open[piece].discard(window)
+            if theirs[window] == 3 and not own[window]:
+                self.open[other].add(window)
+
+# Game position as two bitboards: the pieces of the player to move and all
+# occupied cells, plus the number of pieces in each column. Indexing as
+# board[r][c] still gives 0, 1 or 2 for the drawing and rule code.
+# drop/undo_drop also keep the window counts and a move history for the
+# game; play/undo change only the bitboards, for the searches.
+class Board:
+    def __init__(self):
+        self.current = 0
+        self.mask = 0
+        self.heights = [0] * COLS
+        self.to_move = 1
+        self.moves = 0
+        self.windows = WindowCounts()
+        self.history = []
+
+    @classmethod
+    def from_bitboards(cls, current, mask):
+        # Position reached by alternate moves from the empty board, without
+        # window counts
+        board = cls.__new__(cls)
+        board.current = current
+        board.mask = mask
+        board.heights = [(mask & column_mask(c)).bit_count() for c in range(COLS)]
+        board.moves = mask.bit_count()
+        board.to_move = 1 if board.moves % 2 == 0 else 2
+        board.windows = None
+        board.history = []
+        return board
+
+    def copy(self):
+        board = Board.__new__(Board)
+        board.current = self.current
+        board.mask = self.mask
+        board.heights = self.heights[:]
+        board.to_move = self.to_move
+        board.moves = self.moves
+        board.windows = self.windows.copy() if self.windows is not None else None
+        board.history = self.history[:]
+        return board
+
+    def stones(self, piece):
+        # Bitboard of one player's pieces
+        return self.current if piece == self.to_move else self.current ^ self.mask
+
+    def cell(self, r, c):
+        bit = cell_bit(r, c)
+        if not self.mask & bit:
+            return 0
+        return self.to_move if self.current & bit else 3 - self.to_move
+
+    def __getitem__(self, r):
+        return [self.cell(r, c) for c in range(COLS)]
+
+    def __len__(self):
+        return ROWS
+
+    def can_play(self, col):
+        return 0 <= col < COLS and self.heights[col] < ROWS
+
+    def play(self, col):
+        # Drop a piece of the player to move; the other player is then to move
+        self.current ^= self.mask
+        self.mask |= self.mask + bottom_mask(col)
+        self.heights[col] += 1
+        self.to_move = 3 - self.to_move
+        self.moves += 1
+
+    def undo(self, col):
+        # Take back the last piece dropped in this column
+        self.heights[col] -= 1
+        self.mask ^= 1 << (col * COLUMN_BITS + self.heights[col])
+        self.current ^= self.mask
+        self.to_move = 3 - self.to_move
+        self.moves -= 1
+
+    def drop(self, col, piece):
+        # Game move for either player, keeping the window counts up to date
+        passed = piece != self.to_move
+        if passed:
+            self.pass_turn()
+        row = ROWS - 1 - self.heights[col]
+        self.play(col)
+        if self.windows is not None:
+            self.windows.add(row, col, piece)
+        self.history.append((col, passed))
+
+    def undo_drop(self):
+        # Take back the last game move, returning its column
+        col, passed = self.history.pop()
+        piece = 3 - self.to_move
+        self.undo(col)
+        if self.windows is not None:
+            self.windows.remove(ROWS - 1 - self.heights[col], col, piece)
+        if passed:
+            self.pass_turn()
+        return col
+
+    def pass_turn(self):
+        # Hand the move to the other player without dropping a piece
+        self.current ^= self.mask
+        self.to_move = 3 - self.to_move
+
+    def possible(self):
+        # Bits of the cells a piece can be dropped onto, one per open column
+        return (self.mask + BOTTOM_ROW) & FULL_BOARD
+
+    def non_losing_moves(self):
+        # Playable cells that neither leave an immediate win to the opponent
+        # nor ignore one; empty when every move loses at once
+        possible = self.possible()
+        threats = winning_cells(self.current ^ self.mask, self.mask)
+        forced = possible & threats
+        if forced:
+            if forced & (forced - 1):
+                return 0
+            possible = forced
+        return possible & ~(threats >> 1)
+
+    def move_bit(self, col):
+        # Bit of the cell a piece dropped in this column would land on
+        return (self.mask + bottom_mask(col)) & column_mask(col)
+
+    def wins_with(self, piece, col):
+        # Whether dropping the piece in this column would make four in a row
+        return self.can_play(col) and has_four(self.stones(piece) | self.move_bit(col))
+
+    def is_win(self, piece):
+        return has_four(self.stones(piece))
+
+    def threats(self, piece):
+        # Empty cells (row, col) that would complete one of the player's open threes
+        if self.windows is None:
+            stones = winning_cells(self.stones(piece), self.mask)
+            return [(r, c) for r in range(ROWS) for c in range(COLS) if stones & cell_bit(r, c)]
+        cells = set()
+        for window in self.windows.open[piece]:
+            for r, c in WINDOWS[window]:
+                if not self.mask & cell_bit(r, c):
+                    cells.add((r, c))
+        return sorted(cells)
+
+    def is_full(self):
+        return self.mask == FULL_BOARD
+
+    def key(self):
+        # Unique number for the position with the player to move
+        return self.current + self.mask
+
+    def canonical_key(self):
+        # Smaller key of the position and its mirror image; the sum in key()
+        # never carries between columns, so mirroring moves whole columns
+        key = self.current + self.mask
+        mirrored = 0
+        for col in range(COLS):
+            column = (key >> (col * COLUMN_BITS)) & ((1 << COLUMN_BITS) - 1)
+            mirrored |= column << ((COLS - 1 - col) * COLUMN_BITS)
+        return min(key, mirrored)
+
+# Creates an empty 6x7 game board
 def create_board():
-    return [[0 for _ in range(7)] for _ in range(6)]
+    return Board()
 
-# Places a piece (1 for player, 2 for AI) at the specified row and column
+# Places a piece (1 for player, 2 for AI) at the specified row and column;
+# the row is always the next open one in that column
 def drop_piece(board, row, col, piece):
-    board[row][col] = piece
+    board.drop(col, piece)
+
+# Removes the last piece placed, returning its column
+def undo_piece(board):
+    return board.undo_drop()
 
 # Checks if a column is valid for placing a piece (not full and within bounds)
 def is_valid_location(board, col):
-    if col < 0 or col >= 7:
-        return False
-    return board[0][col] == 0
+    return board.can_play(col)
 
 # Returns the next available row in a column, or None if column is full
 def get_next_open_row(board, col):
-    if col < 0 or col >= 7:
+    if not board.can_play(col):
         return None
-    for r in range(5, -1, -1):
-        if board[r][col] == 0:
-            return r
-    return None
+    return ROWS - 1 - board.heights[col]
 
-# Checks if there are three pieces in a row for a given player
-# Returns True/False and the position to block if found
+# Checks if a player has three pieces in a line of four whose last cell is empty
+# Returns True/False and that empty cell, the position to block, if found
 def check_three_in_a_row(board, piece):
-    # Check horizontal
-    for r in range(6):
-        for c in range(5):
-            if board[r][c:c+3] == [piece]*3:
-                return True, r, c+3
-                
-    # Check vertical  
-    for c in range(7):
-        for r in range(4):
-            if [board[r+i][c] for i in range(3)] == [piece]*3:
-                return True, r+3, c
-            
-    # Check diagonal (positive slope)
-    for c in range(4):
-        for r in range(3):
-            if (board[r][c] == piece and 
-                board[r+1][c+1] == piece and 
-                board[r+2][c+2] == piece):
-                return True, r+3, c+3
-                
-    # Check diagonal (negative slope)
-    for c in range(4):
-        for r in range(5, 2, -1):
-            if (board[r][c] == piece and 
-                board[r-1][c+1] == piece and 
-                board[r-2][c+2] == piece):
-                return True, r-3, c+3
-                
+    threats = board.threats(piece)
+    if threats:
+        return True, threats[0][0], threats[0][1]
     return False, None, None
 
 # Checks if a player has won by getting 4 in a row in any direction
 def winning_move(board, piece):
-    # Check horizontal
-    for c in range(4):
-        for r in range(6):
-            if board[r][c] == piece and board[r][c+1] == piece and board[r][c+2] == piece and board[r][c+3] == piece:
-                return True
+    if board.windows is not None:
+        return board.windows.complete[piece] > 0
+    return board.is_win(piece)
 
-    # Check vertical
-    for c in range(7):
-        for r in range(3):
-            if board[r][c] == piece and board[r+1][c] == piece and board[r+2][c] == piece and board[r+3][c] == piece:
-                return True
+# Checks if placing a piece in a column would result in a win
+def check_potential_win(board, piece, col):
+    return board.wins_with(piece, col)
 
-    # Check diagonal (positive slope)
-    for c in range(4):
-        for r in range(3):
-            if board[r][c] == piece and board[r+1][c+1] == piece and board[r+2][c+2] == piece and board[r+3][c+3] == piece:
-                return True
+# Checks if the board is completely full (draw condition)
+def is_board_full(board):
+    return board.is_full()
 
-    # Check diagonal (negative slope)
-    for c in range(4):
-        for r in range(3, 6):
-            if board[r][c] == piece and board[r-1][c+1] == piece and board[r-2][c+2] == piece and board[r-3][c+3] == piece:
-                return True
+# Columns searched from the centre outwards, where pieces take part in the
+# most lines
+CENTER_ORDER = [3, 2, 4, 1, 5, 0, 6]
+CENTER_RANK = {col: rank for rank, col in enumerate(CENTER_ORDER)}
 
-    return False
+# Scores for the player to move: a win is worth WIN_SCORE minus the number of
+# pieces on the board once it is made, so quicker wins score higher;
+# heuristic scores at the depth limit stay far below it
+WIN_SCORE = 1000
+PROVEN_SCORE = WIN_SCORE - CELLS - 1
+EXACT, LOWER, UPPER = 0, 1, 2
 
-# Checks if placing a piece in a column would result in a win
-def check_potential_win(board, piece, col):
-    if col < 0 or col >= 7:
+# AI time budgets per move offered in the menu
+DIFFICULTIES = [("Easy", 0.1), ("Medium", 0.5), ("Hard", 2.0)]
+DEFAULT_TIME_BUDGET = 0.5
+
+SearchResult = namedtuple("SearchResult", "column score depth nodes elapsed nps")
+
+# Opening database: sorted big-endian 64-bit records, each the canonical
+# position key shifted left by 8 over a signed score byte (the piece count
+# when the player to move wins, its negative when they lose, 0 for a draw)
+OPENING_RECORD = struct.Struct(">Q")
+OPENING_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+class SearchTimeout(Exception):
+    pass
+
+# Largest prime no greater than n
+def previous_prime(n):
+    def is_prime(value):
+        if value < 2:
+            return False
+        return all(value % divisor for divisor in range(2, math.isqrt(value) + 1))
+    while not is_prime(n):
+        n -= 1
+    return n
+
+# Fixed-size hash table of searched positions, indexed by key modulo its
+# size; a new entry evicts whatever shared its slot. The size is rounded
+# down to a prime: keys hold 7 bits per column, so a power of two would only
+# see the left-hand columns.
+class TranspositionTable:
+    def __init__(self, size=1 << 20):
+        self.size = previous_prime(size)
+        self.keys = [0] * size
+        self.entries = [None] * size
+
+    def get(self, key):
+        index = key % self.size
+        if self.keys[index] == key:
+            return self.entries[index]
+        return None
+
+    def put(self, key, entry):
+        index = key % self.size
+        self.keys[index] = key
+        self.entries[index] = entry
+
+    def clear(self):
+        self.keys = [0] * self.size
+        self.entries = [None] * self.size
+
+# Alpha-beta negamax over the bitboard with iterative deepening. The table is
+# kept between moves since keys identify positions exactly.
+class Solver:
+    def __init__(self, table_size=1 << 20, book=None):
+        self.table = TranspositionTable(table_size)
+        self.book = book
+        self.nodes = 0
+        self.deadline = float("inf")
+
+    # Searches deeper and deeper until the time budget runs out or the
+    # position is solved, and returns the best move of the last full depth
+    def search(self, board, time_budget=DEFAULT_TIME_BUDGET):
+        start = time.perf_counter()
+        self.nodes = 0
+        self.deadline = float("inf")
+        root = board.copy()
+        possible = root.possible()
+        for col in CENTER_ORDER:
+            if possible & column_mask(col) and winning_cells(root.current, root.mask) & column_mask(col) & possible:
+                return self._result(col, WIN_SCORE - root.moves - 1, 1, start)
+        if not root.non_losing_moves():
+            # Every move loses; still pick one
+            col = next((c for c in CENTER_ORDER if root.can_play(c)), None)
+            return self._result(col, -(WIN_SCORE - root.moves - 2), 1, start)
+        if self.book is not None:
+            found = self.book.best_move(root)
+            if found is not None:
+                return self._result(found[0], found[1], 0, start)
+
+        column, score, reached = None, 0, 0
+        for depth in range(1, CELLS - root.moves + 1):
+            try:
+                score, column = self._root(root, depth)
+            except SearchTimeout:
+                break
+            reached = depth
+            if abs(score) >= PROVEN_SCORE:
+                break
+            # The first depth always completes so there is a move to play
+            self.deadline = start + time_budget
+            if time.perf_counter() >= self.deadline:
+                break
+        return self._result(column, score, reached, start)
+
+    # Exact score of a position, found by null-window searches bisecting the
+    # scores it can have: wins on the mover's turns, losses on the other's.
+    # Raises SearchTimeout if a time limit is given and runs out.
+    def solve(self, board, time_limit=None):
+        self.deadline = float("inf") if time_limit is None else time.perf_counter() + time_limit
+        root = board.copy()
+        if root.is_full():
+            return 0
+        if winning_cells(root.current, root.mask) & root.possible():
+            return WIN_SCORE - root.moves - 1
+        if not root.non_losing_moves():
+            return -(WIN_SCORE - root.moves - 2)
+        candidates = ([-(WIN_SCORE - m) for m in range(root.moves + 2, CELLS + 1, 2)] + [0] +
+                      sorted(WIN_SCORE - m for m in range(root.moves + 3, CELLS + 1, 2)))
+        low, high = 0, len(candidates) - 1
+        while low < high:
+            mid = (low + high + 1) // 2
+            target = candidates[mid]
+            if self._negamax(root, CELLS, target - 1, target) >= target:
+                low = mid
+            else:
+                high = mid - 1
+        return candidates[low]
+
+    def _result(self, column, score, depth, start):
+        elapsed = time.perf_counter() - start
+        return SearchResult(column, score, depth, self.nodes, elapsed, self.nodes / elapsed if elapsed > 0 else 0.0)
+
+    def _root(self, board, depth):
+        alpha, beta = -WIN_SCORE, WIN_SCORE
+        best_col = None
+        entry = self.table.get(board.key())
+        for col in self._order(board, board.non_losing_moves(), entry[3] if entry else None):
+            board.play(col)
+            score = -self._negamax(board, depth - 1, -beta, -alpha)
+            board.undo(col)
+            if best_col is None or score > alpha:
+                alpha, best_col = score, col
+        self.table.put(board.key(), (depth, EXACT, alpha, best_col))
+        return alpha, best_col
+
+    def _negamax(self, board, depth, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & 4095 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+        if winning_cells(board.current, board.mask) & board.possible():
+            return WIN_SCORE - board.moves - 1
+        moves = board.non_losing_moves()
+        if not moves:
+            return -(WIN_SCORE - board.moves - 2)
+        if board.moves >= CELLS - 2:
+            return 0
+        # Neither side wins on its next move, so the quickest win left for
+        # the player to move is on their move after, and the quickest loss
+        # on the opponent's move after that
+        max_score = WIN_SCORE - (board.moves + 3)
+        if beta > max_score:
+            beta = max_score
+            if alpha >= beta:
+                return beta
+        min_score = -(WIN_SCORE - (board.moves + 4))
+        if alpha < min_score:
+            alpha = min_score
+            if alpha >= beta:
+                return alpha
+        if depth <= 0:
+            return self.evaluate(board)
+
+        key = board.key()
+        entry = self.table.get(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, flag, score, tt_move = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return score
+                if flag == LOWER and score >= beta:
+                    return score
+                if flag == UPPER and score <= alpha:
+                    return score
+
+        original_alpha = alpha
+        best, best_col = -WIN_SCORE, None
+        for col in self._order(board, moves, tt_move):
+            board.play(col)
+            score = -self._negamax(board, depth - 1, -beta, -alpha)
+            board.undo(col)
+            if score > best:
+                best, best_col = score, col
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if best <= original_alpha:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.put(key, (depth, flag, best, best_col))
+        return best
+
+    # Table move first, then moves creating the most new threats, then
+    # centre columns first
+    def _order(self, board, moves, tt_move):
+        ordered = []
+        for col in CENTER_ORDER:
+            bit = moves & column_mask(col)
+            if bit:
+                threats = winning_cells(board.current | bit, board.mask | bit).bit_count()
+                ordered.append((col != tt_move, -threats, CENTER_RANK[col], col))
+        ordered.sort()
+        return [entry[3] for entry in ordered]
+
+    # Depth-limit estimate for the player to move: open cells completing
+    # four for them against those completing four for the opponent
+    def evaluate(self, board):
+        own = winning_cells(board.current, board.mask).bit_count()
+        other = winning_cells(board.current ^ board.mask, board.mask).bit_count()
+        return own - other
+
+# Signed score byte stored in the opening database, and back
+def book_value(score):
+    if score == 0:
+        return 0
+    return WIN_SCORE - score if score > 0 else -(WIN_SCORE + score)
+
+def book_score(value):
+    if value == 0:
+        return 0
+    return WIN_SCORE - value if value > 0 else -(WIN_SCORE + value)
+
+# Read-only view of an opening database file, memory-mapped so nothing is
+# loaded up front and lookups are a binary search over the records
+class OpeningBook:
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.size = size // OPENING_RECORD.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def probe(self, board):
+        # Exact score for the player to move, or None if the position is not stored
+        key = board.canonical_key()
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) >> 1
+            if OPENING_RECORD.unpack_from(self._map, mid * OPENING_RECORD.size)[0] >> 8 < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.size:
+            record = OPENING_RECORD.unpack_from(self._map, low * OPENING_RECORD.size)[0]
+            if record >> 8 == key:
+                value = record & 0xFF
+                return book_score(value - 256 if value >= 128 else value)
+        return None
+
+    def best_move(self, board):
+        # (column, score) of the best move when every reply position is
+        # stored, preferring centre columns among equal scores
+        best = None
+        board = board.copy()
+        for col in CENTER_ORDER:
+            if not board.can_play(col):
+                continue
+            if board.wins_with(board.to_move, col):
+                return col, WIN_SCORE - board.moves - 1
+            board.play(col)
+            score = self.probe(board)
+            board.undo(col)
+            if score is None:
+                return None
+            if best is None or -score > best[1]:
+                best = (col, -score)
+        return best
+
+# Distinct positions (up to mirroring) after each number of moves up to
+# plies, skipping games already won, as dicts of canonical key to bitboards
+def _opening_levels(root, plies):
+    levels = [{root.canonical_key(): (root.current, root.mask)}]
+    for _ in range(root.moves, plies):
+        level = {}
+        for current, mask in levels[-1].values():
+            board = Board.from_bitboards(current, mask)
+            for col in range(COLS):
+                if board.can_play(col) and not board.wins_with(board.to_move, col):
+                    board.play(col)
+                    level.setdefault(board.canonical_key(), (board.current, board.mask))
+                    board.undo(col)
+        levels.append(level)
+    return levels
+
+_opening_solver = None
+
+# Pool worker solving one position; each process keeps its own table.
+# The score is None when the time limit ran out first.
+def _solve_opening_position(task):
+    global _opening_solver
+    position, time_limit = task
+    if _opening_solver is None:
+        _opening_solver = Solver()
+    board = Board.from_bitboards(*position)
+    try:
+        score = _opening_solver.solve(board, time_limit)
+    except SearchTimeout:
+        score = None
+    return board.canonical_key(), score
+
+# Solve every position after exactly plies moves, back the exact scores up
+# through the earlier positions and write them all as an opening database.
+# Positions not solved within time_limit seconds are left out, along with
+# every earlier position that needs them; the AI searches those itself.
+def generate_opening_book(path, plies=6, processes=1, time_limit=1.0, chunk_size=16, verbose=True):
+    start = time.perf_counter()
+    levels = _opening_levels(create_board(), plies)
+    tasks = [(position, time_limit) for position in levels[-1].values()]
+    if verbose:
+        print(f"Solving {len(tasks)} positions after {plies} moves")
+    scores = {}
+    if processes > 1:
+        with Pool(processes) as pool:
+            solved = pool.imap_unordered(_solve_opening_position, tasks, chunk_size)
+            for done, (key, score) in enumerate(solved, 1):
+                scores[key] = score
+                if verbose and done % 1000 == 0:
+                    print(f"{done}/{len(tasks)} searched, {time.perf_counter() - start:.0f}s")
+    else:
+        for done, task in enumerate(tasks, 1):
+            key, score = _solve_opening_position(task)
+            scores[key] = score
+            if verbose and done % 1000 == 0:
+                print(f"{done}/{len(tasks)} searched, {time.perf_counter() - start:.0f}s")
+    unsolved = sum(score is None for score in scores.values())
+
+    for level in reversed(levels[:-1]):
+        for key, position in level.items():
+            board = Board.from_bitboards(*position)
+            if winning_cells(board.current, board.mask) & board.possible():
+                scores[key] = WIN_SCORE - board.moves - 1
+                continue
+            best = None
+            for col in range(COLS):
+                if not board.can_play(col):
+                    continue
+                board.play(col)
+                score = scores[board.canonical_key()]
+                board.undo(col)
+                if score is None:
+                    best = None
+                    break
+                if best is None or -score > best:
+                    best = -score
+            scores[key] = best
+
+    records = sorted(key << 8 | (book_value(score) & 0xFF) for key, score in scores.items() if score is not None)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as handle:
+        for record in records:
+            handle.write(OPENING_RECORD.pack(record))
+    os.replace(temporary, path)
+    if verbose:
+        print(f"Wrote {len(records)} of {len(scores)} positions to {path} in "
+              f"{time.perf_counter() - start:.1f}s; {unsolved} positions after {plies} moves "
+              f"ran out of time")
+    return path
+
+# Node of the Monte Carlo search tree. wins counts playout results (1 for a
+# win, 0.5 for a draw) for the player who made the move leading here;
+# terminal holds that result when the move ended the game.
+class MCTSNode:
+    __slots__ = ("move", "parent", "children", "untried", "visits", "wins", "terminal")
+
+    def __init__(self, move, parent, untried, terminal=None):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.0
+        self.terminal = terminal
+
+# UCT search tree over the bitboard position, kept between moves: when the
+# new position is a child or grandchild of the old root, that subtree
+# becomes the root and its statistics are reused
+class MCTSTree:
+    def __init__(self, exploration=1.4, rng=None):
+        self.exploration = exploration
+        self.rng = rng or random.Random()
+        self.root = None
+        self.board = None
+
+    def set_root(self, board):
+        position = Board.from_bitboards(board.current, board.mask)
+        position.to_move = board.to_move
+        root = self._descendant(position.key()) if self.root is not None else None
+        if root is None:
+            root = MCTSNode(None, None, self._moves(position))
+        root.parent = None
+        self.root, self.board = root, position
+
+    def _descendant(self, key):
+        # The root, one of its children or one of their children with this
+        # position key, if any
+        if self.board.key() == key:
+            return self.root
+        after = self.board.copy()
+        for child in self.root.children:
+            after.play(child.move)
+            if after.key() == key:
+                return child
+            for grandchild in child.children:
+                after.play(grandchild.move)
+                found = after.key() == key
+                after.undo(grandchild.move)
+                if found:
+                    return grandchild
+            after.undo(child.move)
+        return None
+
+    def _moves(self, board):
+        moves = [col for col in CENTER_ORDER if board.can_play(col)]
+        self.rng.shuffle(moves)
+        return moves
+
+    # Runs playouts until the time is up and returns how many were made
+    def run(self, seconds):
+        deadline = time.perf_counter() + seconds
+        playouts = 0
+        while True:
+            for _ in range(64):
+                self._iterate()
+            playouts += 64
+            if time.perf_counter() >= deadline:
+                return playouts
+
+    def _iterate(self):
+        board = self.board.copy()
+        node = self.root
+        log = math.log
+        sqrt = math.sqrt
+        # Select by UCT through fully expanded nodes
+        while not node.untried and node.children and node.terminal is None:
+            scale = self.exploration * sqrt(log(node.visits))
+            node = max(node.children, key=lambda child: child.wins / child.visits + scale / sqrt(child.visits))
+            board.play(node.move)
+        # Expand one untried move
+        if node.terminal is None and node.untried:
+            col = node.untried.pop()
+            won = board.wins_with(board.to_move, col)
+            board.play(col)
+            if won:
+                child = MCTSNode(col, node, [], 1.0)
+            elif board.is_full():
+                child = MCTSNode(col, node, [], 0.5)
+            else:
+                child = MCTSNode(col, node, self._moves(board))
+            node.children.append(child)
+            node = child
+        if node.terminal is not None:
+            result = node.terminal
+        else:
+            result = 1.0 - self._playout(board)
+        while node is not None:
+            node.visits += 1
+            node.wins += result
+            result = 1.0 - result
+            node = node.parent
+
+    # Random game from the position, except that a player always takes a
+    # win on offer and blocks the opponent's; returns the result for the
+    # player to move at the start
+    def _playout(self, board):
+        mover = board.to_move
+        choice = self.rng.choice
+        while True:
+            possible = board.possible()
+            if not possible:
+                return 0.5
+            if winning_cells(board.current, board.mask) & possible:
+                return 1.0 if board.to_move == mover else 0.0
+            blocks = winning_cells(board.current ^ board.mask, board.mask) & possible
+            if blocks:
+                col = ((blocks & -blocks).bit_length() - 1) // COLUMN_BITS
+            else:
+                col = choice([c for c in range(COLS) if board.heights[c] < ROWS])
+            board.play(col)
+
+    def child_stats(self):
+        # {column: (visits, wins)} for the moves from the root
+        return {child.move: (child.visits, child.wins) for child in self.root.children}
+
+_mcts_tree = None
+
+# Pool worker running one time slice on its own tree, which persists in the
+# process between slices and moves; returns the process id, the root move
+# statistics so far and the playouts made in this slice
+def _mcts_slice(task):
+    global _mcts_tree
+    current, mask, to_move, seconds, exploration = task
+    if _mcts_tree is None:
+        _mcts_tree = MCTSTree(exploration)
+    board = Board.from_bitboards(current, mask)
+    board.to_move = to_move
+    _mcts_tree.set_root(board)
+    playouts = _mcts_tree.run(seconds)
+    return os.getpid(), _mcts_tree.child_stats(), playouts
+
+# Monte Carlo tree search player. With several processes each worker grows
+# its own tree from the same root (root parallelism); the root move
+# statistics of all trees are merged at the end of every time slice, and the
+# search stops early once the leading move cannot be caught.
+class MCTSPlayer:
+    def __init__(self, processes=1, exploration=1.4, slice_time=0.1):
+        self.processes = processes
+        self.exploration = exploration
+        self.slice_time = slice_time
+        self.tree = MCTSTree(exploration)
+        self.pool = Pool(processes) if processes > 1 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def search(self, board, time_budget=DEFAULT_TIME_BUDGET):
+        start = time.perf_counter()
+        deadline = start + time_budget
+        totals = {}
+        playouts = 0
+        while True:
+            seconds = max(min(self.slice_time, deadline - time.perf_counter()), 0.0)
+            if self.pool is None:
+                self.tree.set_root(board)
+                playouts += self.tree.run(seconds)
+                totals[0] = self.tree.child_stats()
+            else:
+                tasks = [(board.current, board.mask, board.to_move, seconds, self.exploration)] * self.processes
+                for worker, stats, made in self.pool.map(_mcts_slice, tasks, chunksize=1):
+                    totals[worker] = stats
+                    playouts += made
+            merged = {}
+            for stats in totals.values():
+                for move, (visits, wins) in stats.items():
+                    merged_visits, merged_wins = merged.get(move, (0, 0.0))
+                    merged[move] = (merged_visits + visits, merged_wins + wins)
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or len(merged) < 2:
+                break
+            ranked = sorted(merged.values(), reverse=True)
+            elapsed = time.perf_counter() - start
+            if ranked[0][0] - ranked[1][0] > playouts / elapsed * remaining:
+                break
+
+        elapsed = time.perf_counter() - start
+        if not merged:
+            col = next((c for c in CENTER_ORDER if board.can_play(c)), None)
+            return SearchResult(col, 0, 0, playouts, elapsed, 0.0)
+        col = max(merged, key=lambda move: merged[move][0])
+        visits, wins = merged[col]
+        return SearchResult(col, round(100 * wins / visits), self._depth(), playouts, elapsed,
+                            playouts / elapsed if elapsed > 0 else 0.0)
+
+    def _depth(self):
+        # Length of the most visited line in the local tree
+        node, depth = self.tree.root, 0
+        while node is not None and node.children:
+            node = max(node.children, key=lambda child: child.visits)
+            depth += 1
+        return depth
+
+# m,n,k games: k in a row on any board size, with pieces dropping to the
+# bottom of their column (gravity, as in Four in a Row) or placed on any
+# empty cell (as in Gomoku). Cells are bits at row * (cols + 1) + col; the
+# spare bit closing each row is never set, so shifted lines cannot wrap.
+class MNKBoard:
+    def __init__(self, rows=15, cols=15, k=5, gravity=False):
+        self.rows = rows
+        self.cols = cols
+        self.k = k
+        self.gravity = gravity
+        self.stride = cols + 1
+        # Horizontal, vertical and both diagonal neighbours
+        self.shifts = (1, self.stride, self.stride + 1, self.stride - 1)
+        self.cells = sum(self.bit(r, c) for r in range(rows) for c in range(cols))
+        self.stones = {1: 0, 2: 0}
+        self.heights = [0] * cols
+        self.to_move = 1
+        self.history = []
+        self.windows, self.cell_windows = self._windows()
+
+    def _windows(self):
+        # Bit mask of every line of k cells, and the lines through each cell
+        windows = []
+        cell_windows = {}
+        for r in range(self.rows):
+            for c in range(self.cols):
+                for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    cells = [(r + i * dr, c + i * dc) for i in range(self.k)]
+                    if all(0 <= row < self.rows and 0 <= col < self.cols for row, col in cells):
+                        mask = sum(self.bit(row, col) for row, col in cells)
+                        for row, col in cells:
+                            cell_windows.setdefault(row * self.stride + col, []).append(mask)
+                        windows.append(mask)
+        return windows, cell_windows
+
+    def bit(self, r, c):
+        return 1 << (r * self.stride + c)
+
+    def position(self, bit):
+        # (row, col) of a single-bit mask
+        return divmod(bit.bit_length() - 1, self.stride)
+
+    def __getitem__(self, r):
+        return [1 if self.stones[1] & self.bit(r, c) else 2 if self.stones[2] & self.bit(r, c) else 0
+                for c in range(self.cols)]
+
+    def __len__(self):
+        return self.rows
+
+    def empty(self):
+        return self.cells & ~(self.stones[1] | self.stones[2])
+
+    def playable(self):
+        # Cells the player to move may take
+        if not self.gravity:
+            return self.empty()
+        cells = 0
+        for c in range(self.cols):
+            if self.heights[c] < self.rows:
+                cells |= self.bit(self.rows - 1 - self.heights[c], c)
+        return cells
+
+    def drop_row(self, col):
+        # Row a piece dropped in this column lands on, or None if it is full
+        if not 0 <= col < self.cols or self.heights[col] >= self.rows:
+            return None
+        return self.rows - 1 - self.heights[col]
+
+    def can_play(self, r, c):
+        return 0 <= r < self.rows and 0 <= c < self.cols and bool(self.playable() & self.bit(r, c))
+
+    def play(self, r, c):
+        self.stones[self.to_move] |= self.bit(r, c)
+        self.heights[c] += 1
+        self.history.append((r, c))
+        self.to_move = 3 - self.to_move
+
+    def undo(self):
+        r, c = self.history.pop()
+        self.to_move = 3 - self.to_move
+        self.stones[self.to_move] &= ~self.bit(r, c)
+        self.heights[c] -= 1
+        return r, c
+
+    def is_full(self):
+        return not self.empty()
+
+    def has_k(self, stones):
+        # Any run of k stones: runs double in length per AND of the board
+        # with itself shifted, then a last shift tops them up to k
+        for shift in self.shifts:
+            run, length = stones, 1
+            while 2 * length <= self.k:
+                run &= run >> (length * shift)
+                length *= 2
+            if length < self.k:
+                run &= run >> ((self.k - length) * shift)
+            if run:
+                return True
         return False
-    
-    row = get_next_open_row(board, col)
-    if row is not None:
-        temp_board = [row[:] for row in board]
-        drop_piece(temp_board, row, col, piece)
-        return winning_move(temp_board, piece)
-    return False
 
-# Checks if the board is completely full (draw condition)
-def is_board_full(board):
-    return all(board[0][col] != 0 for col in range(7))
-
-# AI logic for choosing next move
-def ai_move(board):
-    # First check if AI can win in next move
-    for col in range(7):
-        if is_valid_location(board, col):
-            if check_potential_win(board, 2, col):
-                return col
-
-    # Then check if player can win in next move and block it
-    for col in range(7):
-        if is_valid_location(board, col):
-            if check_potential_win(board, 1, col):
-                return col
-
-    # Then check if player has three in a row to block
-    has_three, row, col = check_three_in_a_row(board, 1)
-    if has_three and col < 7 and col >= 0:  # Add bounds check
-        if is_valid_location(board, col):
-            return col
-                
-    # Otherwise make random move
-    valid_locations = [col for col in range(7) if is_valid_location(board, col)]
-    if valid_locations:
-        return random.choice(valid_locations)
-    return None
+    def is_win(self, piece):
+        return self.has_k(self.stones[piece])
+
+    def completing_cells(self, piece, missing=1):
+        # Empty cells in lines holding k - missing of the player's stones
+        # and missing empty cells: winning cells for missing=1, the moves
+        # that make a winning cell for missing=2
+        stones, empty = self.stones[piece], self.empty()
+        cells = 0
+        for shift in self.shifts:
+            own = [stones >> (i * shift) for i in range(self.k)]
+            free = [empty >> (i * shift) for i in range(self.k)]
+            for gaps in itertools.combinations(range(self.k), missing):
+                starts = self.cells
+                for i in range(self.k):
+                    starts &= free[i] if i in gaps else own[i]
+                    if not starts:
+                        break
+                for i in gaps:
+                    cells |= starts << (i * shift)
+        return cells & empty
+
+    def bits(self, mask):
+        # Single-bit masks of the cells in mask, lowest first
+        while mask:
+            low = mask & -mask
+            yield low
+            mask ^= low
+
+ThreatSearchResult = namedtuple("ThreatSearchResult", "cell reason nodes elapsed")
+
+# Computer player for m,n,k boards. It wins or blocks at once when it can,
+# looks for a threat sequence: moves that each leave a winning cell, which
+# forces the reply, until two winning cells are left at once (victory by
+# continuous fours). Otherwise it scores candidate moves by the lines
+# through them and plays the best one that gives the opponent no threat
+# sequence.
+class MNKPlayer:
+    def __init__(self, max_threats=12, defence_candidates=8):
+        self.max_threats = max_threats
+        self.defence_candidates = defence_candidates
+        self.nodes = 0
+        self.deadline = float("inf")
+        self.failed = {}
+
+    def choose(self, board, time_budget=1.0):
+        start = time.perf_counter()
+        self.deadline = start + time_budget
+        self.nodes = 0
+        self.failed = {}
+        me, other = board.to_move, 3 - board.to_move
+        playable = board.playable()
+        if not playable:
+            return ThreatSearchResult(None, "board full", 0, 0.0)
+
+        def result(cell, reason):
+            return ThreatSearchResult(board.position(cell), reason, self.nodes, time.perf_counter() - start)
+
+        wins = board.completing_cells(me) & playable
+        if wins:
+            return result(wins & -wins, "win")
+        blocks = board.completing_cells(other) & playable
+        if blocks:
+            return result(blocks & -blocks, "block")
+
+        ranked = self._ranked(board, playable)
+        try:
+            for depth in range(1, self.max_threats + 1):
+                cell = self._threats(board, me, depth)
+                if cell is not None:
+                    return result(cell, f"threat sequence of {depth}")
+            for cell in ranked[:self.defence_candidates]:
+                board.play(*board.position(cell))
+                try:
+                    refuted = self._threats(board, other, self.max_threats) is not None
+                finally:
+                    board.undo()
+                if not refuted:
+                    return result(cell, "safe")
+        except SearchTimeout:
+            pass
+        return result(ranked[0], "best line score")
+
+    def _ranked(self, board, playable):
+        # Candidate moves by line score; without gravity only cells next to
+        # stones (or the centre of an empty board) are considered
+        candidates = playable
+        if not board.gravity:
+            occupied = board.stones[1] | board.stones[2]
+            if not occupied:
+                return [board.bit(board.rows // 2, board.cols // 2)]
+            near = occupied
+            for _ in range(2):
+                for shift in board.shifts:
+                    near |= (near << shift) | (near >> shift)
+            candidates &= near
+        me = board.to_move
+        return sorted(board.bits(candidates), key=lambda cell: -self._score(board, cell, me))
 
-# Draws the game board on the screen using pygame
+    def _score(self, board, cell, me):
+        # Sum over the lines through the cell: lines free of the opponent
+        # score for attack, lines free of our stones for defence, growing
+        # tenfold with every stone already in them
+        own, other = board.stones[me], board.stones[3 - me]
+        score = 0
+        for window in board.cell_windows[cell.bit_length() - 1]:
+            mine = (own & window).bit_count()
+            theirs = (other & window).bit_count()
+            if not theirs:
+                score += 2 * 10 ** mine
+            if not mine:
+                score += 10 ** theirs
+        return score
+
+    def _threats(self, board, attacker, depth):
+        # First move of a threat sequence for the attacker, who is to move,
+        # using at most depth threats, or None
+        self.nodes += 1
+        if not self.nodes & 255 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+        defender = 3 - attacker
+        playable = board.playable()
+        wins = board.completing_cells(attacker) & playable
+        if wins:
+            return wins & -wins
+        blocks = board.completing_cells(defender) & playable
+        if blocks & (blocks - 1) or not depth:
+            return None
+        key = (board.stones[1], board.stones[2])
+        if self.failed.get(key, 0) >= depth:
+            return None
+
+        # When the defender has a winning cell, taking it is the only move
+        candidates = blocks or board.completing_cells(attacker, 2) & playable
+        for cell in board.bits(candidates):
+            board.play(*board.position(cell))
+            after = board.playable()
+            threats = board.completing_cells(attacker) & after
+            found = False
+            if threats and not board.completing_cells(defender) & after:
+                if threats & (threats - 1):
+                    found = True
+                else:
+                    board.play(*board.position(threats))
+                    try:
+                        found = self._threats(board, attacker, depth - 1) is not None
+                    finally:
+                        board.undo()
+            board.undo()
+            if found:
+                return cell
+        self.failed[key] = depth
+        return None
+
+# AI logic for choosing next move: searches for the player to move within
+# the time budget with the given Solver or MCTSPlayer and reports the
+# search speed
+def ai_move(board, time_budget=DEFAULT_TIME_BUDGET, solver=None):
+    if solver is None:
+        solver = Solver()
+    result = solver.search(board, time_budget)
+    if result.column is not None:
+        if isinstance(solver, MCTSPlayer):
+            print(f"AI plays column {result.column + 1}: {result.score}% wins, line of {result.depth}, "
+                  f"{result.nodes} playouts in {result.elapsed:.2f}s ({result.nps:.0f} playouts/s)")
+        else:
+            print(f"AI plays column {result.column + 1}: depth {result.depth}, score {result.score}, "
+                  f"{result.nodes} nodes in {result.elapsed:.2f}s ({result.nps:.0f} nodes/s)")
+    return result.column
+
+# Draws the game board on the screen using pygame, with cells sized to fit
+# the board below the 100 pixel banner
 def draw_board(screen, board):
     BLUE = (0, 0, 255)
     BLACK = (0, 0, 0)
     RED = (255, 0, 0)
     YELLOW = (255, 255, 0)
+    rows, cols = len(board), len(board[0])
+    size = min(700 // cols, 600 // rows)
+    radius = size * 2 // 5
     
-    for c in range(7):
-        for r in range(6):
-            pygame.draw.rect(screen, BLUE, (c*100, r*100+100, 100, 100))
-            if board[r][c] == 0:
-                pygame.draw.circle(screen, BLACK, (c*100+50, r*100+150), 40)
-            elif board[r][c] == 1:
-                pygame.draw.circle(screen, RED, (c*100+50, r*100+150), 40)
+    for r in range(rows):
+        row = board[r]
+        for c in range(cols):
+            pygame.draw.rect(screen, BLUE, (c*size, r*size+100, size, size))
+            if row[c] == 0:
+                pygame.draw.circle(screen, BLACK, (c*size+size//2, r*size+100+size//2), radius)
+            elif row[c] == 1:
+                pygame.draw.circle(screen, RED, (c*size+size//2, r*size+100+size//2), radius)
             else:
-                pygame.draw.circle(screen, YELLOW, (c*100+50, r*100+150), 40)
+                pygame.draw.circle(screen, YELLOW, (c*size+size//2, r*size+100+size//2), radius)
     pygame.display.update()
 
 # Draws a button with text on the screen
@@ -154,8 +1216,11 @@ def draw_button(screen, text, x, y, width, height, color):
     text_rect = text_surface.get_rect(center=(x + width/2, y + height/2))
     screen.blit(text_surface, text_rect)
 
-# Main menu interface with game mode selection
-def main_menu():
+# Main menu interface with game mode selection; the AI uses the opening
+# database at book_path when the file exists
+def main_menu(book_path=OPENING_BOOK_PATH, processes=1):
+    book = OpeningBook(book_path) if book_path and os.path.exists(book_path) else None
+    mcts = None
     pygame.init()
     WIDTH = 700
     HEIGHT = 700
@@ -165,12 +1230,15 @@ def main_menu():
     while True:
         screen.fill((255, 255, 255))
         draw_button(screen, "Player vs AI", 150, 200, 400, 80, (0, 255, 0))
-        draw_button(screen, "Player vs Player", 150, 300, 400, 80, (0, 255, 0))
-        draw_button(screen, "Exit", 150, 400, 400, 80, (255, 0, 0))
+        draw_button(screen, "Player vs MCTS AI", 150, 300, 400, 80, (0, 255, 0))
+        draw_button(screen, "Player vs Player", 150, 400, 400, 80, (0, 255, 0))
+        draw_button(screen, "Exit", 150, 500, 400, 80, (255, 0, 0))
         pygame.display.update()
         
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                if mcts is not None:
+                    mcts.close()
                 pygame.quit()
                 sys.exit()
                 
@@ -178,18 +1246,54 @@ def main_menu():
                 mouse_pos = event.pos
                 if 150 <= mouse_pos[0] <= 550:
                     if 200 <= mouse_pos[1] <= 280:
-                        play_game(screen, True)  # AI mode
+                        time_budget = difficulty_menu(screen)
+                        if time_budget is not None:
+                            play_game(screen, True, time_budget, book)  # AI mode
                     elif 300 <= mouse_pos[1] <= 380:
-                        play_game(screen, False)  # 2 Player mode
+                        time_budget = difficulty_menu(screen)
+                        if time_budget is not None:
+                            if mcts is None:
+                                mcts = MCTSPlayer(processes)
+                            play_game(screen, True, time_budget, player=mcts)  # MCTS AI mode
                     elif 400 <= mouse_pos[1] <= 480:
+                        play_game(screen, False)  # 2 Player mode
+                    elif 500 <= mouse_pos[1] <= 580:
+                        if mcts is not None:
+                            mcts.close()
                         pygame.quit()
                         sys.exit()
 
+# Difficulty selection for the AI, returning its time budget per move in
+# seconds or None to go back
+def difficulty_menu(screen):
+    while True:
+        screen.fill((255, 255, 255))
+        for i, (name, budget) in enumerate(DIFFICULTIES):
+            draw_button(screen, f"{name} ({budget:g}s/move)", 150, 200 + i * 100, 400, 80, (0, 255, 0))
+        draw_button(screen, "Back", 150, 200 + len(DIFFICULTIES) * 100, 400, 80, (255, 0, 0))
+        pygame.display.update()
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                mouse_pos = event.pos
+                if 150 <= mouse_pos[0] <= 550:
+                    for i, (name, budget) in enumerate(DIFFICULTIES):
+                        if 200 + i * 100 <= mouse_pos[1] <= 280 + i * 100:
+                            return budget
+                    back = 200 + len(DIFFICULTIES) * 100
+                    if back <= mouse_pos[1] <= back + 80:
+                        return None
+
 # Main game loop handling player moves, AI moves, and win conditions
-def play_game(screen, ai_mode):
+def play_game(screen, ai_mode, time_budget=DEFAULT_TIME_BUDGET, book=None, player=None):
     WIDTH = 700
     HEIGHT = 700
     board = create_board()
+    solver = player or (Solver(book=book) if ai_mode else None)
     game_over = False
     turn = 0
     
@@ -240,7 +1344,7 @@ def play_game(screen, ai_mode):
         
         # AI's turn
         if ai_mode and turn == 1 and not game_over:
-            col = ai_move(board)
+            col = ai_move(board, time_budget, solver)
             
             if col is not None and is_valid_location(board, col):
                 pygame.time.wait(500)
@@ -271,5 +1375,93 @@ def play_game(screen, ai_mode):
             pygame.time.wait(3000)
             return
 
+# Game loop for m,n,k boards: a click picks a column with gravity or a cell
+# without, and the AI plays the second player
+def play_mnk_game(screen, board, ai_mode, time_budget=1.0):
+    WIDTH = 700
+    size = min(700 // board.cols, 600 // board.rows)
+    player = MNKPlayer() if ai_mode else None
+    colors = {1: (255, 0, 0), 2: (255, 255, 0)}
+    names = {1: "Player 1", 2: "AI" if ai_mode else "Player 2"}
+    game_over = False
+    
+    draw_board(screen, board)
+    
+    while not game_over:
+        move = None
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+                
+            if event.type == pygame.MOUSEMOTION and board.gravity and not (ai_mode and board.to_move == 2):
+                pygame.draw.rect(screen, (0,0,0), (0,0, WIDTH, 100))
+                pygame.draw.circle(screen, colors[board.to_move], (event.pos[0], 50), min(40, size * 2 // 5))
+                pygame.display.update()
+                
+            if event.type == pygame.MOUSEBUTTONDOWN and not (ai_mode and board.to_move == 2):
+                col = event.pos[0] // size
+                row = board.drop_row(col) if board.gravity else (event.pos[1] - 100) // size
+                if row is not None and board.can_play(row, col):
+                    move = (row, col)
+        
+        # AI's turn
+        if ai_mode and board.to_move == 2 and move is None:
+            result = player.choose(board, time_budget)
+            move = result.cell
+            if move is not None:
+                print(f"AI plays {move}: {result.reason}, {result.nodes} threat nodes in {result.elapsed:.2f}s")
+            
+        if move is not None:
+            piece = board.to_move
+            board.play(*move)
+            draw_board(screen, board)
+            if board.is_win(piece):
+                pygame.draw.rect(screen, (0,0,0), (0,0, WIDTH, 100))
+                font = pygame.font.SysFont("monospace", 75)
+                label = font.render(f"{names[piece]} wins!!", 1, colors[piece])
+                screen.blit(label, (40,10))
+                game_over = True
+            elif board.is_full():
+                pygame.draw.rect(screen, (0,0,0), (0,0, WIDTH, 100))
+                font = pygame.font.SysFont("monospace", 75)
+                label = font.render("Draw!", 1, (255,255,255))
+                screen.blit(label, (40,10))
+                game_over = True
+            pygame.display.update()
+            
+        if game_over:
+            pygame.time.wait(3000)
+            return
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Four in a Row")
+    parser.add_argument("--book", default=OPENING_BOOK_PATH, help="opening database for the AI")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes for the MCTS AI")
+    commands = parser.add_subparsers(dest="command")
+    book_parser = commands.add_parser("book", help="solve the early positions and write an opening database")
+    book_parser.add_argument("--plies", type=int, default=6, help="solve every position after this many moves")
+    book_parser.add_argument("--time", type=float, default=1.0, help="seconds allowed per position after --plies moves")
+    book_parser.add_argument("--processes", type=int, default=1, help="solve positions across processes")
+    book_parser.add_argument("--output", default=OPENING_BOOK_PATH, help="database file to write")
+    mnk_parser = commands.add_parser("mnk", help="play k in a row on any board size (Gomoku by default)")
+    mnk_parser.add_argument("--rows", type=int, default=15)
+    mnk_parser.add_argument("--cols", type=int, default=15)
+    mnk_parser.add_argument("--k", type=int, default=5, help="pieces in a row needed to win")
+    mnk_parser.add_argument("--gravity", action="store_true", help="pieces drop to the bottom of their column")
+    mnk_parser.add_argument("--two-player", action="store_true", help="play against another person")
+    mnk_parser.add_argument("--time", type=float, default=1.0, help="AI time budget per move in seconds")
+    args = parser.parse_args(argv)
+
+    if args.command == "book":
+        generate_opening_book(args.output, args.plies, args.processes, args.time)
+    elif args.command == "mnk":
+        pygame.init()
+        screen = pygame.display.set_mode((700, 700))
+        pygame.display.set_caption(f"{args.k} in a Row")
+        play_mnk_game(screen, MNKBoard(args.rows, args.cols, args.k, args.gravity), not args.two_player, args.time)
+    else:
+        main_menu(args.book, args.processes)
+
 if __name__ == "__main__":
-    main_menu()
+    main()